@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""Fake Event Warehouse server for tests."""
+import json
+import select
+import socket
+import struct
+import threading
+import time
+
+_HEADER = struct.Struct('>II')
+
+
+def default_handler(query):
+    if query == 'SELECT GetTables':
+        return json.dumps({'tables': {}})
+    if query.startswith('SELECT'):
+        return json.dumps({'events': []})
+    if query.startswith('NO RESPONSE'):
+        return None
+    return json.dumps({'result': True})
+
+
+class FakeEventWarehouse(object):
+    """Fake Event Warehouse server, which serves each connection by a thread.
+
+    * Queries received at once are answered together after ``latency`` seconds, in reverse order if ``reorder``.
+    * ``max_pending`` is the max number of queries received but not answered on a connection.
+    * ``connection_count`` is the number of accepted connections.
+    * ``connection_queries`` is the list of received queries for each connection, in order of acceptance.
+    """
+
+    def __init__(self, handler=default_handler, latency=0.0, reorder=False):
+        self._handler = handler
+        self._latency = latency
+        self._reorder = reorder
+        self._server_sock = socket.socket()
+        self._server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server_sock.bind(('127.0.0.1', 0))
+        self._server_sock.listen(5)
+        self._stopped = False
+        self._thread = None
+        self._connection_threads = []
+
+        self.port = self._server_sock.getsockname()[1]
+        self.queries = []
+        self.max_pending = 0
+        self.connection_count = 0
+        self.connection_queries = []
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self._thread.join()
+        for thread in self._connection_threads:
+            thread.join()
+        self._server_sock.close()
+
+    def _serve(self):
+        while not self._stopped:
+            ready, _, _ = select.select([self._server_sock], [], [], 0.05)
+            if len(ready) > 0:
+                sock, _ = self._server_sock.accept()
+                self.connection_count += 1
+                queries = []
+                self.connection_queries.append(queries)
+                thread = threading.Thread(target=self._serve_connection, args=(sock, queries))
+                thread.daemon = True
+                thread.start()
+                self._connection_threads.append(thread)
+
+    def _serve_connection(self, sock, queries):
+        try:
+            self._serve_queries(sock, queries)
+        finally:
+            sock.close()
+
+    def _serve_queries(self, sock, queries):
+        buf = ''
+        pending = []
+        while not self._stopped:
+            ready, _, _ = select.select([sock], [], [], 0.005)
+            if len(ready) > 0:
+                recv = sock.recv(65536)
+                if len(recv) == 0:
+                    return
+                buf += recv
+
+                while len(buf) >= 8:
+                    size, seq = _HEADER.unpack_from(buf)
+                    if len(buf) < size + 8:
+                        break
+                    query = buf[8:size + 8]
+                    buf = buf[size + 8:]
+                    self.queries.append(query)
+                    queries.append(query)
+                    pending.append((seq, query))
+                self.max_pending = max(self.max_pending, len(pending))
+
+                # Wait for following queries
+                continue
+
+            if len(pending) == 0:
+                continue
+
+            # Answer received queries
+            time.sleep(self._latency)
+            if self._reorder:
+                pending.reverse()
+            for seq, query in pending:
+                response = self._handler(query)
+                if response is not None:
+                    sock.sendall(_HEADER.pack(len(response), seq) + response)
+            pending = []
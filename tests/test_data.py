@@ -2,6 +2,9 @@
 import unittest
 from unittest import TestCase
 import json
+import copy
+import hashlib
+import timeit
 
 import uds.logging
 from uds.data.build import M2MDataBuilder
@@ -145,5 +148,261 @@ class TestM2MData(TestCase):
         print is_ok
 
 
+class TestM2MDataBounds(TestCase):
+
+    def setUp(self):
+        builder = M2MDataBuilder()
+        builder.title = 'TestM2MDataBounds'
+        builder.timezone = '+09:00'
+        builder.m2m_info = {
+            'formatVersion': '1.02',
+            'createdContact': 'ISP Guest User<ispguest@example.com>',
+        }
+        builder.m2m_data_schema = [
+            {'type': 'datetime', 'name': 'time'},
+            {'type': 'numeric', 'name': 'longitude', 'unit': 'degree'},
+            {'type': 'numeric', 'name': 'latitude', 'unit': 'degree'},
+        ]
+        builder.primary_keys = ['time', 'longitude', 'latitude']
+        self.m2m_data = builder.create_m2m_data()
+
+    def test_bounds(self):
+        m2m_data = self.m2m_data
+        m2m_data.append({'time': '2015-02-16T01:00:00.000', 'longitude': 130.0, 'latitude': 35.0})
+        m2m_data.append({'time': '2015-02-16T00:00:00.000', 'longitude': 131.0, 'latitude': 34.0})
+
+        assert str(m2m_data.min_time) == '2015-02-16 00:00:00+09:00'
+        assert str(m2m_data.max_time) == '2015-02-16 01:00:00+09:00'
+        assert (m2m_data.south, m2m_data.north, m2m_data.west, m2m_data.east) == (34.0, 35.0, 130.0, 131.0)
+
+        # Bounds are cached.
+        assert m2m_data._get_bounds() is m2m_data._get_bounds()
+
+        # append/extend invalidate cache.
+        m2m_data.extend([{'time': '2015-02-16T02:00:00.000', 'longitude': 129.0, 'latitude': 36.0}])
+        assert str(m2m_data.max_time) == '2015-02-16 02:00:00+09:00'
+        assert (m2m_data.south, m2m_data.north, m2m_data.west, m2m_data.east) == (34.0, 36.0, 129.0, 131.0)
+
+        # Direct change of values is detected by number of datum.
+        del m2m_data.data_values[:]
+        assert m2m_data.min_time is None
+        assert m2m_data.south is None
+
+
+class TestM2MDataCommitter(TestCase):
+
+    def setUp(self):
+        builder = M2MDataBuilder()
+        builder.title = 'TestM2MDataCommitter'
+        builder.timezone = '+09:00'
+        builder.m2m_info = {
+            'formatVersion': '1.02',
+            'createdContact': 'ISP Guest User<ispguest@example.com>',
+        }
+        builder.m2m_data_schema = [
+            {'type': 'datetime', 'name': 'time'},
+            {'type': 'numeric', 'name': 'longitude', 'unit': 'degree'},
+            {'type': 'numeric', 'name': 'latitude', 'unit': 'degree'},
+            {'type': 'string', 'name': 'name'},
+        ]
+        builder.primary_keys = ['time', 'longitude', 'latitude']
+        self.builder = builder
+        self.m2m_data = self._create_m2m_data()
+
+    def _create_m2m_data(self):
+        m2m_data = self.builder.create_m2m_data()
+        for i in range(100):
+            m2m_data.append({'time': '2015-02-16T01:00:00.000', 'longitude': 130.0 + i, 'latitude': 35.0,
+                             'name': u'\u6771\u4eac"%d"' % i})
+        return m2m_data
+
+    def test_commit(self):
+        pre_data_json = self.m2m_data.data_json
+        committed = M2MDataCommitter().process(self.m2m_data)
+
+        assert committed is not self.m2m_data
+        assert committed.dict['sensor_info']['data_size'] == len(pre_data_json)
+        assert committed.dict['sensor_info']['data_hash'] == hashlib.md5(json.dumps(committed.dict['data'])).hexdigest()
+        assert committed.data_json == json.dumps(committed.data_dict)
+
+    def test_json_cache(self):
+        committed = M2MDataCommitter().process(self.m2m_data)
+        assert committed.json == json.dumps(committed.dict)
+        assert committed.metadata_json == json.dumps(committed.metadata_dict)
+        assert committed.data_json == json.dumps(committed.data_dict)
+
+        # Each part is serialized only once.
+        assert committed._get_part_json('sensor_info') is committed._get_part_json('sensor_info')
+
+        # Cache of data part is cleared by append.
+        committed.append({'time': '2015-02-16T02:00:00.000', 'longitude': 130.0, 'latitude': 35.0, 'name': ''})
+        assert committed.data_json == json.dumps(committed.data_dict)
+
+        # Cache of edited part is cleared by mark_dirty.
+        committed.dict['sensor_info']['data_link']['uri'] = 'file_path'
+        committed.mark_dirty('sensor_info')
+        assert committed.json == json.dumps(committed.dict)
+
+        # Filtered copy reuses metadata cache.
+        clone = committed.copy_without_values()
+        assert clone.metadata_json == committed.metadata_json
+        assert clone.data_json == json.dumps(clone.data_dict)
+
+    def test_commit_time_offset(self):
+        self.m2m_data.device_info['timeOffset'] = '+0900'
+        timezone = self.m2m_data.dict['primary']['timezone']
+        committed = M2MDataCommitter().process(self.m2m_data)
+
+        # Deprecated time offset is normalized on the target, and the committed copy keeps it.
+        assert 'timeOffset' not in self.m2m_data.device_info
+        assert self.m2m_data.dict['primary']['timezone'] == '+0900'
+        assert committed.device_info['timeOffset'] == '+0900'
+        assert committed.dict['primary']['timezone'] == timezone
+        assert committed.json == json.dumps(committed.dict)
+
+    def test_commit_in_place(self):
+        expected = M2MDataCommitter().process(self._create_m2m_data())
+
+        deepcopy = copy.deepcopy
+        copy.deepcopy = None
+        try:
+            # Target is committed without deep copy.
+            committed = M2MDataCommitter(in_place=True).process(self.m2m_data)
+        finally:
+            copy.deepcopy = deepcopy
+
+        # Same JSON as the deep copy, except data_id.
+        assert committed is self.m2m_data
+        assert committed.dumps_values() == expected.dumps_values()
+        assert committed.dict['sensor_info']['data_size'] == expected.dict['sensor_info']['data_size']
+        assert committed.dict['sensor_info']['data_hash'] == hashlib.md5(json.dumps(committed.dict['data'])).hexdigest()
+        assert committed.data_json == json.dumps(committed.data_dict)
+        assert committed.dict['primary']['timezone'] == expected.dict['primary']['timezone']
+
+
+class TestM2MDataChecker(TestCase):
+
+    def setUp(self):
+        builder = M2MDataBuilder()
+        builder.title = 'TestM2MDataChecker'
+        builder.timezone = '+09:00'
+        builder.m2m_info = {
+            'formatVersion': '1.02',
+            'createdContact': 'ISP Guest User<ispguest@example.com>',
+        }
+        builder.m2m_data_schema = [
+            {'type': 'datetime', 'name': 'time'},
+            {'type': 'numeric', 'name': 'longitude', 'unit': 'degree'},
+            {'type': 'numeric', 'name': 'latitude', 'unit': 'degree'},
+        ]
+        builder.primary_keys = ['time', 'longitude', 'latitude']
+        self.builder = builder
+
+    def _create_m2m_data_list(self, columnar):
+        self.builder.columnar = columnar
+        m2m_data_list = []
+        for i in range(3):
+            m2m_data = self.builder.create_m2m_data()
+            for j in range(100):
+                m2m_data.append({'time': '2015-02-16T01:00:00.000', 'longitude': 130.0 + j * 0.1, 'latitude': 35.0})
+            m2m_data_list.append(m2m_data)
+        return m2m_data_list
+
+    def test_check_list(self):
+        for columnar in [False, True]:
+            m2m_data_list = self._create_m2m_data_list(columnar)
+            assert M2MDataChecker().check_list(m2m_data_list) is True
+
+            m2m_data_list[1].append({'time': '2015-02-16T01:00:00.000', 'longitude': 0.0, 'latitude': 0.0})
+            assert M2MDataChecker().check_list(m2m_data_list) is False
+
+            m2m_data_list[2].append({'time': '2099-02-16T01:00:00.000', 'longitude': 130.0, 'latitude': 35.0})
+            m2m_data_list[2].append({'time': '2015-02-16T01:00:00.000', 'longitude': 130.0})
+            assert M2MDataChecker().check_list(m2m_data_list) is False
+
+    def test_drop_invalid(self):
+        for columnar in [False, True]:
+            m2m_data_list = self._create_m2m_data_list(columnar)
+            original = list(m2m_data_list)
+            m2m_data_list[1].append({'time': '2015-02-16T01:00:00.000', 'longitude': 0.0, 'latitude': 0.0})
+            m2m_data_list[2].append({'time': '2099-02-16T01:00:00.000', 'longitude': 130.0, 'latitude': 35.0})
+            m2m_data_list[2].append({'time': '2015-02-16T01:00:00.000', 'longitude': 200.0, 'latitude': 35.0})
+
+            assert M2MDataChecker().check_list(m2m_data_list, drop_invalid=True) is True
+            assert [m2m_data.size for m2m_data in m2m_data_list] == [100, 100, 100]
+
+            # Only M2M Data including invalid datum are replaced.
+            assert m2m_data_list[0] is original[0]
+            assert m2m_data_list[1] is not original[1]
+            assert m2m_data_list[2] is not original[2]
+            assert m2m_data_list[1].is_columnar is columnar
+
+            invalid = self.builder.create_m2m_data()
+            invalid.append({'time': 'invalid', 'longitude': 130.0, 'latitude': 35.0})
+            m2m_data_list = [invalid]
+            assert M2MDataChecker().check_list(m2m_data_list, drop_invalid=True) is False
+            assert len(m2m_data_list) == 0
+
+
+class TestM2MDataBuilder(TestCase):
+
+    def setUp(self):
+        builder = M2MDataBuilder()
+        builder.title = 'TestM2MDataBuilder'
+        builder.timezone = '+09:00'
+        builder.m2m_info = {
+            'formatVersion': '1.01',
+            'createdContact': 'ISP Guest User<ispguest@example.com>',
+            'device': {
+                'ownership': 'NICT',
+                'capability': {
+                    'frequency': {
+                        'type': 'hour',
+                        'count': 1
+                    },
+                },
+            },
+        }
+        builder.m2m_data_schema = [
+            {'type': 'datetime', 'name': 'time'},
+            {'type': 'numeric', 'name': 'rainfall', 'unit': 'mm'},
+        ]
+        builder.primary_keys = ['time', 'longitude', 'latitude']
+        self.builder = builder
+
+    def test_template(self):
+        expected = self.builder.create_m2m_data()
+        self.builder.prepare()
+        m2m_data1 = self.builder.create_m2m_data()
+        m2m_data2 = self.builder.create_m2m_data()
+
+        assert type(m2m_data1) is type(expected)
+        assert m2m_data1.json == expected.json
+        assert m2m_data1.primary_keys == expected.primary_keys
+        assert m2m_data1.info_summary == expected.info_summary
+
+        # Objects do not share mutable parts.
+        m2m_data1.device_info['longitude'] = 130.0
+        m2m_data1.append({'time': '2015-02-16T01:00:00.000', 'rainfall': 1.0})
+        assert 'longitude' not in m2m_data2.device_info
+        assert m2m_data2.size == 0
+
+        # Setting parameter clears template.
+        self.builder.title = 'Changed'
+        assert self.builder.create_m2m_data().dict['primary']['title'] == 'Changed'
+
+    def test_throughput(self):
+        before = min(timeit.repeat(self.builder.create_m2m_data, number=1000, repeat=3))
+        self.builder.prepare()
+
+        # Prepared builder stamps the template without building. (deepcopy of parts)
+        built = []
+        self.builder.process = lambda m2m_data: built.append(m2m_data)
+        after = min(timeit.repeat(self.builder.create_m2m_data, number=1000, repeat=3))
+        print 'create_m2m_data x 1000: deepcopy={0:.6f}s, template={1:.6f}s'.format(before, after)
+
+        assert built == []
+
+
 if __name__ == "__main__":
     unittest.main()
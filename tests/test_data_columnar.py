@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import array
+import copy
+import json
+import pickle
+import unittest
+from unittest import TestCase
+
+from uds.data.build import M2MDataBuilder
+from uds.data.check import M2MDataChecker
+from uds.data.commit import M2MDataCommitter
+from uds.filters import LastDataFinder
+from uds.filters import LimitedBufferedFilter
+from uds.filters import TimeOrderFilter
+from uds.io import NullDao
+
+
+class TestColumnarM2MData(TestCase):
+
+    def setUp(self):
+        builder = M2MDataBuilder()
+        builder.title = 'TestColumnarM2MData'
+        builder.timezone = '+09:00'
+        builder.m2m_info = {
+            'formatVersion': '1.02',
+            'createdContact': 'ISP Guest User<ispguest@example.com>',
+        }
+        builder.m2m_data_schema = [
+            {'type': 'datetime', 'name': 'time'},
+            {'type': 'numeric', 'name': 'longitude', 'unit': 'degree'},
+            {'type': 'numeric', 'name': 'latitude', 'unit': 'degree'},
+            {'type': 'numeric', 'name': 'rainfall', 'unit': 'mm'},
+            {'type': 'string', 'name': 'name'},
+        ]
+        builder.primary_keys = ['time', 'longitude', 'latitude']
+        self.builder = builder
+
+        self.data = []
+        for i in range(2500):
+            datum = {'time': '2015-02-16T0%d:00:00.000' % (i % 3), 'longitude': 130.0 + i * 0.001,
+                     'latitude': 35.0 - i * 0.001, 'rainfall': i, 'name': u'東京'}
+            if i % 7 == 0:
+                datum['rainfall'] = None
+            if i % 11 == 0:
+                del datum['name']
+            self.data.append(datum)
+
+    def _create_pair(self):
+        row = self.builder.create_m2m_data()
+        row.extend(copy.deepcopy(self.data))
+        self.builder.columnar = True
+        columnar = self.builder.create_m2m_data()
+        self.builder.columnar = False
+        columnar.extend(copy.deepcopy(self.data))
+        return row, columnar
+
+    def test_columns(self):
+        row, columnar = self._create_pair()
+        assert columnar.is_columnar
+        assert columnar.size == 2500
+        assert isinstance(columnar.column('longitude'), array.array)
+
+        # Mixed type or missing values demote column to list.
+        assert isinstance(columnar.column('rainfall'), list)
+        assert columnar.column('rainfall') == row.column('rainfall')
+        assert columnar.column('name') == row.column('name')
+        assert columnar[11] == row[11]
+        assert columnar[-1] == row[-1]
+
+    def test_same_as_row(self):
+        row, columnar = self._create_pair()
+
+        assert (columnar.min_time, columnar.max_time) == (row.min_time, row.max_time)
+        assert (columnar.south, columnar.north, columnar.west, columnar.east) ==\
+            (row.south, row.north, row.west, row.east)
+        assert M2MDataChecker().process(columnar) == M2MDataChecker().process(row) is True
+        assert json.loads(columnar.dumps_values()) == json.loads(row.dumps_values())
+
+        committed = M2MDataCommitter(in_place=True).process(columnar)
+        assert committed.is_columnar
+        assert json.loads(committed.data_json)['data']['values'] == json.loads(row.dumps_values())
+
+        # Copies keep columns.
+        assert pickle.loads(pickle.dumps(columnar, 2)).column('name') == columnar.column('name')
+        assert copy.deepcopy(columnar).column('name') == columnar.column('name')
+
+    def test_filters(self):
+        row, columnar = self._create_pair()
+
+        for flt_class in [lambda: TimeOrderFilter(LastDataFinder(NullDao())), lambda: LimitedBufferedFilter(10000)]:
+            filtered_row = flt_class().filter([row])[0]
+            filtered_columnar = flt_class().filter([columnar])[0]
+            assert filtered_columnar.is_columnar
+            assert filtered_columnar.size == filtered_row.size
+            assert sorted(filtered_columnar.column('longitude')) == sorted(filtered_row.column('longitude'))
+
+        assert columnar.is_columnar
+
+    def test_check_invalid(self):
+        self.builder.columnar = True
+        columnar = self.builder.create_m2m_data()
+        columnar.append({'time': '2015-02-16T00:00:00.000', 'longitude': 130.0, 'latitude': 35.0})
+        columnar.append({'time': '2015-02-16T00:00:00.000', 'longitude': 0.0, 'latitude': 0.0})
+        assert M2MDataChecker().process(columnar) is False
+
+        columnar = self.builder.create_m2m_data()
+        columnar.append({'time': '2015-02-16T00:00:00.000', 'longitude': 130.0})
+        assert M2MDataChecker().process(columnar) is False
+
+    def test_materialize(self):
+        row, columnar = self._create_pair()
+
+        assert columnar.data_values == row.data_values
+        assert not columnar.is_columnar
+        columnar.append({'time': '2015-02-16T03:00:00.000', 'longitude': 140.0, 'latitude': 35.0})
+        assert columnar.size == 2501
+        assert columnar.east == 140.0
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+import copy
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+import uds.filters
+from uds.data.build import M2MDataBuilder
+from uds.filters import LastDataFinder
+from uds.filters import LimitedBufferedFilter
+from uds.filters import TimeOrderFilter
+from uds.io.base import M2MDataDao
+
+
+class CountingDao(M2MDataDao):
+
+    def __init__(self, last_times):
+        super(CountingDao, self).__init__()
+        self.last_times = last_times
+        self.select_last_count = 0
+        self.select_last_many_count = 0
+
+    def reconnect(self):
+        pass
+
+    def select_last(self, key_data):
+        self.select_last_count += 1
+        return self.last_times.get(key_data['longitude'])
+
+    def select_last_many(self, key_values_list):
+        self.select_last_many_count += 1
+        return [self.last_times.get(key_values['longitude']) for key_values in key_values_list]
+
+    def insert(self, m2m_data):
+        pass
+
+
+class FailingDao(CountingDao):
+    """Dao which returns False or raises for the first accesses, like lost connections."""
+
+    def __init__(self, last_times, failures):
+        super(FailingDao, self).__init__(last_times)
+        self.failures = list(failures)
+        self.reconnect_count = 0
+
+    def reconnect(self):
+        self.reconnect_count += 1
+
+    def select_last(self, key_data):
+        if len(self.failures) > 0:
+            return self._fail()
+        return super(FailingDao, self).select_last(key_data)
+
+    def select_last_many(self, key_values_list):
+        if len(self.failures) > 0:
+            return self._fail()
+        return super(FailingDao, self).select_last_many(key_values_list)
+
+    def _fail(self):
+        failure = self.failures.pop(0)
+        if isinstance(failure, Exception):
+            raise failure
+        return failure
+
+
+class TestLastDataFinder(TestCase):
+
+    def test_retry(self):
+        dao = FailingDao({135.0: '2015-01-01T00:00:00'}, [False, Exception('lost'), False])
+        finder = LastDataFinder(dao)
+        finder.min_retry_interval = 0.01
+        finder.max_retry_interval = 0.02
+
+        sleeps = []
+        original_sleep = uds.filters.time.sleep
+        uds.filters.time.sleep = sleeps.append
+        try:
+            assert finder.find_many([{'longitude': 135.0}]) == ['2015-01-01T00:00:00']
+            dao.failures = [False]
+            assert finder.find({'longitude': 135.0}) == '2015-01-01T00:00:00'
+        finally:
+            uds.filters.time.sleep = original_sleep
+
+        # Reconnected for both False and exception, with bounded backoff.
+        assert dao.reconnect_count == 4
+        assert sleeps == [0.01, 0.02, 0.02, 0.01]
+
+
+class TestTimeOrderFilter(TestCase):
+
+    def setUp(self):
+        builder = M2MDataBuilder()
+        builder.title = 'TestTimeOrderFilter'
+        builder.timezone = '+09:00'
+        builder.m2m_info = {
+            'formatVersion': '1.02',
+            'createdContact': 'ISP Guest User<ispguest@example.com>',
+        }
+        builder.m2m_data_schema = [
+            {'type': 'datetime', 'name': 'time'},
+            {'type': 'numeric', 'name': 'longitude', 'unit': 'degree'},
+            {'type': 'numeric', 'name': 'latitude', 'unit': 'degree'},
+        ]
+        builder.primary_keys = ['time', 'longitude', 'latitude']
+        self._builder = builder
+
+    def _create_m2m_data_list(self, station_count, time):
+        m2m_data_list = []
+        for i in range(station_count):
+            m2m_data = self._builder.create_m2m_data()
+            m2m_data.append({'time': time, 'longitude': 130.0 + i, 'latitude': 35.0})
+            m2m_data_list.append(m2m_data)
+        return m2m_data_list
+
+    def test_find_missing_keys_at_once(self):
+        dao = CountingDao({130.0: '2015-02-16T01:00:00+09:00'})
+        flt = TimeOrderFilter(LastDataFinder(dao))
+
+        filtered = flt.filter(self._create_m2m_data_list(10, '2015-02-16T01:00:00'))
+        assert dao.select_last_many_count == 1
+        assert dao.select_last_count == 0
+        assert len(filtered) == 9
+
+        # Known keys are not looked up again.
+        filtered = flt.filter(self._create_m2m_data_list(10, '2015-02-16T02:00:00'))
+        assert dao.select_last_many_count == 1
+        assert len(filtered) == 10
+
+    def test_warm_start_cache(self):
+        cache_file_path = os.path.join(tempfile.mkdtemp(), 'time_order_filter', 'TestTimeOrderFilter.json')
+
+        dao = CountingDao({})
+        flt = TimeOrderFilter(LastDataFinder(dao), cache_file_path=cache_file_path)
+        flt.open()
+        flt.filter(self._create_m2m_data_list(10, '2015-02-16T01:00:00'))
+        flt.close()
+        assert dao.select_last_many_count == 1
+
+        # Restarted filter finds last data from cache file.
+        dao = CountingDao({})
+        flt = TimeOrderFilter(LastDataFinder(dao), cache_file_path=cache_file_path)
+        flt.open()
+        filtered = flt.filter(self._create_m2m_data_list(10, '2015-02-16T01:00:00'))
+        assert dao.select_last_many_count == 0
+        assert len(filtered) == 0
+
+        # Stale cache is ignored.
+        dao = CountingDao({})
+        flt = TimeOrderFilter(LastDataFinder(dao), cache_file_path=cache_file_path, cache_max_age=-1)
+        flt.open()
+        filtered = flt.filter(self._create_m2m_data_list(10, '2015-02-16T01:00:00'))
+        assert dao.select_last_many_count == 1
+        assert len(filtered) == 10
+
+        # Cache file without entries is ignored.
+        with open(cache_file_path, 'w') as fp:
+            fp.write('{}')
+        dao = CountingDao({})
+        flt = TimeOrderFilter(LastDataFinder(dao), cache_file_path=cache_file_path)
+        flt.open()
+        filtered = flt.filter(self._create_m2m_data_list(10, '2015-02-16T01:00:00'))
+        assert dao.select_last_many_count == 1
+        assert len(filtered) == 10
+
+
+class TestCopyWithoutValues(TestCase):
+
+    def setUp(self):
+        builder = M2MDataBuilder()
+        builder.title = 'TestCopyWithoutValues'
+        builder.timezone = '+09:00'
+        builder.m2m_info = {
+            'formatVersion': '1.02',
+            'createdContact': 'ISP Guest User<ispguest@example.com>',
+        }
+        builder.m2m_data_schema = [
+            {'type': 'datetime', 'name': 'time'},
+            {'type': 'numeric', 'name': 'longitude', 'unit': 'degree'},
+            {'type': 'numeric', 'name': 'latitude', 'unit': 'degree'},
+        ]
+        builder.primary_keys = ['time', 'longitude', 'latitude']
+        m2m_data = builder.create_m2m_data()
+        for i in range(5000):
+            m2m_data.append({'time': '2015-02-16T01:00:00', 'longitude': 130.0 + i * 0.001, 'latitude': 35.0})
+        self._m2m_data = m2m_data
+
+    @staticmethod
+    def _walk_containers(obj):
+        stack = [obj]
+        while stack:
+            obj = stack.pop()
+            yield obj
+            if isinstance(obj, dict):
+                stack.extend(value for value in obj.itervalues() if isinstance(value, (dict, list)))
+            elif isinstance(obj, list):
+                stack.extend(value for value in obj if isinstance(value, (dict, list)))
+
+    def _count_new_containers(self, m2m_data):
+        """Count dicts and lists held by m2m_data, which are not shared with the original."""
+        original_ids = set(id(obj) for obj in self._walk_containers(self._m2m_data.dict))
+        return len([obj for obj in self._walk_containers(m2m_data.dict) if id(obj) not in original_ids])
+
+    def test_copy_without_values(self):
+        clone = self._m2m_data.copy_without_values()
+        assert clone.size == 0
+        assert self._m2m_data.size == 5000
+        assert clone.primary_keys == self._m2m_data.primary_keys
+
+        # Metadata is not shared with the original.
+        clone.dict['primary']['title'] = 'Changed'
+        assert self._m2m_data.dict['primary']['title'] == 'TestCopyWithoutValues'
+
+    def test_allocation_count(self):
+        # Previous filters deep-copied whole M2MData and then deleted values.
+        before = self._count_new_containers(copy.deepcopy(self._m2m_data))
+        after = self._count_new_containers(self._m2m_data.copy_without_values())
+
+        assert before > 5000
+        assert after < 100
+
+        filtered = LimitedBufferedFilter(buffer_size=10000).filter([self._m2m_data])
+        assert filtered[0].size == 5000
+        assert filtered[0].data_values is not self._m2m_data.data_values
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import json
+import timeit
+import unittest
+from unittest import TestCase
+
+from evwh_server import FakeEventWarehouse
+from uds.io.evwh import EventWarehouseClient
+from uds.io.evwh import FrameReader
+from uds.io.evwh import _HEADER
+from uds.io.evwh import data_to_byte
+
+
+def _echo_handler(query):
+    return json.dumps({'query': query})
+
+
+# Multi-megabyte response like GetTables on a large deployment
+_LARGE_RESPONSE = json.dumps({'events': [{'data': 'x' * 100, 'index': i} for i in range(30000)]})
+
+
+def _large_handler(query):
+    return _LARGE_RESPONSE
+
+
+class _Container(object):
+    recv = ''
+
+
+class _ChunkedSocket(object):
+    """Socket which returns given bytes in pieces of the given sizes."""
+
+    def __init__(self, data, sizes):
+        self._data = data
+        self._sizes = sizes
+        self.recv_count = 0
+
+    def recv_into(self, buf, nbytes):
+        self.recv_count += 1
+        size = min(self._sizes.pop(0) if self._sizes else len(self._data), nbytes, len(self._data))
+        buf[:size] = self._data[:size]
+        self._data = self._data[size:]
+        return size
+
+
+class TestEventWarehouseClient(TestCase):
+
+    def _connect(self, server, max_in_flight=16):
+        client = EventWarehouseClient('127.0.0.1', server.port)
+        client.max_in_flight = max_in_flight
+        client.connect()
+        return client
+
+    def test_send_many(self):
+        server = FakeEventWarehouse(_echo_handler, reorder=True).start()
+        client = self._connect(server, max_in_flight=8)
+
+        queries = ['SELECT ' + str(i) for i in range(50)]
+        responses = client.send_many(queries)
+        client.disconnect()
+        server.stop()
+
+        # Responses are matched with queries, even if they are returned in different order.
+        assert [json.loads(response)['query'] for response in responses] == queries
+        assert 1 < server.max_pending <= 8
+
+    def test_send(self):
+        server = FakeEventWarehouse(_echo_handler).start()
+        client = self._connect(server)
+
+        assert json.loads(client.send('SELECT 1'))['query'] == 'SELECT 1'
+        assert json.loads(client.send('SELECT 2'))['query'] == 'SELECT 2'
+        client.disconnect()
+        server.stop()
+
+    def test_timeout(self):
+        server = FakeEventWarehouse().start()
+        client = self._connect(server)
+        client.timeout = 0.2
+
+        responses = client.send_many(['INSERT 1', 'NO RESPONSE', 'INSERT 2'])
+
+        # Connection is reopened for next queries.
+        assert client.send('INSERT 3') is not False
+        client.disconnect()
+        server.stop()
+
+        assert responses[0] is not False
+        assert responses[1] is False
+        assert responses[2] is not False
+        assert server.connection_count == 2
+
+    def test_socket_error(self):
+        server = FakeEventWarehouse().start()
+        client = self._connect(server)
+
+        # Socket error is not raised, and queries fail.
+        client._sock.close()
+        assert client.send_many(['INSERT 1', 'INSERT 2']) == [False, False]
+
+        assert client.send('INSERT 3') is not False
+        client.disconnect()
+        server.stop()
+        assert server.connection_count == 2
+
+    def test_pipelined(self):
+        server = FakeEventWarehouse(latency=0.005).start()
+        client = self._connect(server)
+        queries = ['INSERT ' + str(i) for i in range(40)]
+
+        # Serial send waits for each response.
+        serial = min(timeit.repeat(lambda: [client.send(query) for query in queries], number=1, repeat=3))
+        assert server.max_pending == 1
+
+        # Pipelined queries are pending on the server together, on the same connection.
+        pipelined = min(timeit.repeat(lambda: client.send_many(queries), number=1, repeat=3))
+        client.disconnect()
+        server.stop()
+
+        print 'evwh send: serial={0:.4f}s, pipelined={1:.4f}s'.format(serial, pipelined)
+        assert 1 < server.max_pending <= 16
+        assert server.connection_count == 1
+
+class TestFrameReader(TestCase):
+
+    def test_frames(self):
+        bodies = ['a' * 10, '', 'b' * 100000, 'c' * 3]
+        data = ''.join(_HEADER.pack(len(body), seq) + body for seq, body in enumerate(bodies))
+        sock = _ChunkedSocket(data, [3, 7, 20, 5000, 1, 100000])
+        reader = FrameReader(read_size=16, max_read_size=1024)
+
+        frames = []
+        while reader.recv_from(sock) > 0:
+            frames.extend(reader.frames())
+        assert frames == list(enumerate(bodies))
+
+    def test_large_frame(self):
+        body = 'x' * (3 * 1024 * 1024)
+        sock = _ChunkedSocket(_HEADER.pack(len(body), 1) + body, [])
+        reader = FrameReader(read_size=1024, max_read_size=65536)
+
+        frames = []
+        while len(frames) == 0:
+            assert reader.recv_from(sock) > 0
+            frames.extend(reader.frames())
+
+        # After the header is parsed, the rest of the frame is received by a single read. (Not by max_read_size)
+        assert frames == [(1, body)]
+        assert sock.recv_count == 2
+
+    def test_benchmark_large_response(self):
+        server = FakeEventWarehouse(_large_handler).start()
+        client = EventWarehouseClient('127.0.0.1', server.port)
+        client.connect()
+
+        def receive_concatenating():
+            # Former MessageContainer: 1024 bytes per recv, concatenated, header parsed on each check
+            client._sock.sendall(data_to_byte(1, 'SELECT large'))
+            container = _Container()
+            while True:
+                container.recv += client._sock.recv(1024)
+                if len(container.recv) >= 8:
+                    size, seq = _HEADER.unpack(container.recv[:8])
+                    if len(container.recv) >= size + 8:
+                        return container.recv[8:size + 8]
+
+        def receive_framed():
+            return client.send('SELECT large')
+
+        assert len(receive_framed()) > 2 * 1024 * 1024
+        assert receive_concatenating() == receive_framed()
+
+        before = min(timeit.repeat(receive_concatenating, number=1, repeat=3))
+        after = min(timeit.repeat(receive_framed, number=1, repeat=3))
+        client.disconnect()
+        server.stop()
+        print 'large response: concatenating={0:.4f}s, framed={1:.4f}s'.format(before, after)
+
+
+if __name__ == "__main__":
+    unittest.main()
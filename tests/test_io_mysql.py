@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+import datetime
+import decimal
+import unittest
+from unittest import TestCase
+
+import uds.io.mysql
+from uds.config import default_config
+from uds.data.build import M2MDataBuilder
+from uds.io.mysql import MySQLConnectionPool
+from uds.io.mysql import MySQLDao
+from uds.io.mysql import PooledMySQLClient
+from uds.io.mysql import create_client
+
+
+class RecordingClient(object):
+
+    def __init__(self, existing_keys=()):
+        self.executed = []
+        self.commit_count = 0
+        self.existing_keys = set(existing_keys)
+        self.last_error = None
+
+    def execute(self, query, args=None):
+        self.executed.append((query, args))
+
+        # Fails with duplicate key error if a row has existing longitude.
+        duplicates = [value for value in args if value in self.existing_keys]
+        if len(duplicates) > 0:
+            self.last_error = Exception(1062, "Duplicate entry '{0}' for key 'time_loc'".format(duplicates[0]))
+            return False
+        return len(args)
+
+    def commit(self):
+        self.commit_count += 1
+
+    def select(self, query, args=None):
+        self.executed.append((query, args))
+        return [(decimal.Decimal('130.0000000000'), datetime.datetime(2015, 2, 16, 1, 0), '+09:00')]
+
+
+class TestMySQLDao(TestCase):
+
+    def setUp(self):
+        builder = M2MDataBuilder()
+        builder.title = 'TestMySQLDao'
+        builder.timezone = '+09:00'
+        builder.m2m_info = {
+            'formatVersion': '1.02',
+            'createdContact': 'ISP Guest User<ispguest@example.com>',
+        }
+        builder.m2m_data_schema = [
+            {'type': 'datetime', 'name': 'time'},
+            {'type': 'numeric', 'name': 'longitude', 'unit': 'degree'},
+            {'type': 'numeric', 'name': 'latitude', 'unit': 'degree'},
+            {'type': 'numeric', 'name': 'rainfall', 'unit': 'mm'},
+        ]
+        builder.primary_keys = ['time', 'longitude', 'latitude']
+        self._builder = builder
+
+    def _create_m2m_data(self, count):
+        m2m_data = self._builder.create_m2m_data()
+        for i in range(count):
+            m2m_data.append({'time': '2015-02-16T00:00:00',
+                             'longitude': 130.0 + i * 0.001,
+                             'latitude': 35.0,
+                             'rainfall': float(i)})
+        return m2m_data
+
+    def test_insert_many(self):
+        client = RecordingClient()
+        dao = MySQLDao(client, 'TestTable', insert_batch_size=10)
+
+        count = dao.insert_many([self._create_m2m_data(15), self._create_m2m_data(10)])
+
+        assert count == 25
+        assert len(client.executed) == 3
+        assert client.commit_count == 3
+
+        query, args = client.executed[0]
+        assert query.startswith('INSERT INTO TestTable(')
+        assert query.count('(%s') == 10
+        assert len(args) % 10 == 0
+        assert "'" not in query.split('VALUES')[1]
+
+    def test_insert_many_with_duplicate(self):
+        client = RecordingClient(existing_keys=[130.003])
+        dao = MySQLDao(client, 'TestTable', insert_batch_size=10)
+
+        count = dao.insert_many([self._create_m2m_data(15)])
+
+        # The batch with duplicate row is inserted one by one, and only the duplicate row is skipped.
+        assert count == 14
+        assert [query.count('(%s') for query, args in client.executed] == [10] + [1] * 10 + [5]
+        assert client.commit_count == 9 + 1
+
+    def test_insert_geometry(self):
+        client = RecordingClient()
+        dao = MySQLDao(client, 'TestTable')
+
+        m2m_data = self._create_m2m_data(2)
+        m2m_data[0]['geo_loc'] = 'Point(130.0 35.0)'
+        dao.insert(m2m_data)
+
+        # Rows with geometry value are sent by another statement.
+        assert len(client.executed) == 2
+        assert 'GeomFromText(%s)' in client.executed[0][0]
+        assert 'GeomFromText(%s)' not in client.executed[1][0]
+
+    def test_select_last_many(self):
+        client = RecordingClient()
+        dao = MySQLDao(client, 'TestTable')
+
+        results = dao.select_last_many([{'longitude': 130.0}, {'longitude': 131.0}])
+
+        assert len(client.executed) == 1
+        query, args = client.executed[0]
+        assert 'GROUP BY `longitude`' in query
+        assert args == [130.0, 131.0]
+
+        # Timezone is taken from the row of the last time, not maximum of another row.
+        assert 'MAX(`timezone`)' not in query
+        assert 't.`longitude` = l.`longitude` AND t.`time` = l.`last_time`' in query
+        assert results == ['2015-02-16T01:00:00+09:00', None]
+
+
+class FakeCursor(object):
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def execute(self, query, args=None):
+        if self._connection.is_lost:
+            raise Exception('MySQL server has gone away')
+        self._connection.executed.append(query)
+        return 1
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class FakeConnection(object):
+
+    def __init__(self):
+        self.is_lost = False
+        self.is_closed = False
+        self.ping_count = 0
+        self.executed = []
+
+    def cursor(self, cursorclass=None):
+        return FakeCursor(self)
+
+    def ping(self):
+        self.ping_count += 1
+        if self.is_lost:
+            raise Exception('MySQL server has gone away')
+
+    def rollback(self):
+        if self.is_lost:
+            raise Exception('MySQL server has gone away')
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.is_closed = True
+
+
+class TestMySQLConnectionPool(TestCase):
+
+    def setUp(self):
+        self.connections = []
+
+        def connect(**kwargs):
+            self.connections.append(FakeConnection())
+            return self.connections[-1]
+
+        self._connect = getattr(uds.io.mysql.MySQLdb, 'connect', None)
+        uds.io.mysql.MySQLdb.connect = connect
+
+    def tearDown(self):
+        if self._connect is None:
+            del uds.io.mysql.MySQLdb.connect
+        else:
+            uds.io.mysql.MySQLdb.connect = self._connect
+
+    def test_reuse(self):
+        pool = MySQLConnectionPool('user', 'password', 'host', 'db', pool_size=1)
+        con1 = pool.acquire()
+        con2 = pool.acquire()
+        pool.release(con1)
+        pool.release(con2)
+
+        # Released connections are reused up to pool_size, and others are closed.
+        assert pool.acquire() is con1
+        assert con2.is_closed
+        assert len(self.connections) == 2
+
+    def test_ping_idle(self):
+        pool = MySQLConnectionPool('user', 'password', 'host', 'db', ping_interval=0)
+        con = pool.acquire()
+        pool.release(con)
+        assert pool.acquire() is con
+        assert con.ping_count == 1
+
+        # Lost idle connection is replaced with new one.
+        pool.release(con)
+        con.is_lost = True
+        assert pool.acquire() is not con
+        assert con.is_closed
+        assert len(self.connections) == 2
+
+    def test_discard_broken(self):
+        client = PooledMySQLClient('user', 'password', 'host', 'TestMySQLConnectionPool.test_discard_broken')
+        client.connect()
+        con = self.connections[0]
+
+        con.is_lost = True
+        assert client.select('SELECT 1') is False
+
+        # Failed connection is closed, and new one is borrowed for next statement.
+        assert client.select('SELECT 2') == []
+        assert con.is_closed
+        assert self.connections[1].executed == ['SELECT 2']
+
+        client.disconnect()
+        client.connect()
+        assert len(self.connections) == 2
+
+    def test_ping_held_connection(self):
+        client = PooledMySQLClient('user', 'password', 'host', 'TestMySQLConnectionPool.test_ping_held_connection',
+                                   ping_interval=0)
+        client.connect()
+        self.connections[0].is_lost = True
+
+        # Held connection idle longer than ping_interval is checked before use.
+        assert client.execute('INSERT 1') == 1
+        assert self.connections[0].is_closed
+        assert self.connections[1].executed == ['INSERT 1']
+
+    def test_create_client(self):
+        mysql_params = {'user': 'user', 'password': 'password', 'host': 'host', 'db': 'test_create_client'}
+
+        # Omitted pool_size is same as default config.
+        client = create_client(mysql_params)
+        assert isinstance(client, PooledMySQLClient)
+        assert client._pool._pool_size == default_config.STORE_PARAMS['mysql']['pool_size']
+
+        mysql_params['pool_size'] = 0
+        assert not isinstance(create_client(mysql_params), PooledMySQLClient)
+
+
+if __name__ == "__main__":
+    unittest.main()
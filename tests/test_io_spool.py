@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import time
+import unittest
+from unittest import TestCase
+
+from uds.io.spool import Spool
+from uds.io.spool import SpoolReplayer
+
+
+class TestSpool(TestCase):
+
+    def setUp(self):
+        self._dir_path = os.path.join(tempfile.mkdtemp(), 'spool')
+
+    def test_append_read_commit(self):
+        spool = Spool(self._dir_path)
+        spool.append(['a', 'bb', ''])
+        spool.append(['ccc'])
+        assert spool.depth == 4
+
+        records, positions = spool.read(3)
+        assert records == ['a', 'bb', '']
+
+        # Records are read from the committed position.
+        spool.commit(positions[1], 2)
+        records, positions = spool.read(10)
+        assert records == ['', 'ccc']
+        assert spool.depth == 2
+        spool.close()
+
+        # Records not committed are read after reopen.
+        spool = Spool(self._dir_path)
+        assert spool.depth == 2
+        assert spool.read(10)[0] == ['', 'ccc']
+        spool.close()
+
+    def test_segments(self):
+        spool = Spool(self._dir_path, segment_bytes=10)
+        for i in range(5):
+            spool.append(['record' + str(i)])
+        assert len([name for name in os.listdir(self._dir_path) if name.endswith('.spool')]) == 5
+
+        records, positions = spool.read(3)
+        assert records == ['record0', 'record1', 'record2']
+        spool.commit(positions[-1], 3)
+
+        # Read segments are removed.
+        assert len([name for name in os.listdir(self._dir_path) if name.endswith('.spool')]) == 3
+        assert spool.read(10)[0] == ['record3', 'record4']
+        spool.close()
+
+    def test_partial_record(self):
+        spool = Spool(self._dir_path)
+        spool.append(['a', 'b'])
+        spool.close()
+
+        # Record partially written by crash is dropped.
+        with open(os.path.join(self._dir_path, '0000000000.spool'), 'ab') as fp:
+            fp.write('\x00\x00\x00\x05ab')
+
+        spool = Spool(self._dir_path)
+        assert spool.depth == 2
+        spool.append(['c'])
+        assert spool.read(10)[0] == ['a', 'b', 'c']
+        spool.close()
+
+
+class TestSpoolReplayer(TestCase):
+
+    def test_retry(self):
+        spool = Spool(os.path.join(tempfile.mkdtemp(), 'spool'))
+        spool.append(['a', 'b', 'c', 'd'])
+
+        sent = []
+        failures = [2]
+
+        def send(records):
+            sent.append(list(records))
+            if failures[0] > 0:
+                # 'c' fails twice
+                failures[0] -= 1
+                return [record != 'c' for record in records]
+            return [True] * len(records)
+
+        replayer = SpoolReplayer(spool, send, batch_size=10, min_interval=0.01, max_interval=0.02)
+        replayer.start()
+        for i in range(100):
+            if spool.depth == 0:
+                break
+            time.sleep(0.01)
+        replayer.stop()
+        spool.close()
+
+        # Records are committed up to the failed one, and the rest are retried.
+        assert spool.depth == 0
+        assert sent == [['a', 'b', 'c', 'd'], ['c', 'd'], ['c', 'd']]
+
+
+if __name__ == "__main__":
+    unittest.main()
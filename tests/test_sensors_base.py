@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import TestCase
+
+import uds.logging
+from uds.sensors.base import Sensor
+
+
+class _CountingSensor(Sensor):
+    """Sensor which fetches cycle numbers up to max_cycles, and stores them by a slow fake store."""
+
+    def __init__(self, project_home, max_cycles):
+        super(_CountingSensor, self).__init__(project_home)
+        self.sensor_name = 'TestPipeline'
+        self.time_offset = '+09:00'
+        self.m2m_info = {'formatVersion': '1.02', 'createdContact': 'test'}
+        self.m2m_data_schema = [{'type': 'datetime', 'name': 'time'}]
+        self.primary_keys = ['time', 'longitude', 'latitude']
+        self.filter_type = 'no_filter'
+        self.store_type = 'console'
+        self.pipeline_enabled = True
+
+        self.max_cycles = max_cycles
+        self.fetched = []
+        self.stored = []
+        self.store_time = 0.0
+        self.store_errors = {}
+        self.store_started = threading.Event()
+        self.store_released = threading.Event()
+        self.store_released.set()
+
+    def fetch(self):
+        cycle = len(self.fetched) + 1
+        if cycle > self.max_cycles:
+            self.abort()
+            return False
+        self.fetched.append(cycle)
+        return cycle
+
+    def parse(self, source):
+        m2m_data = self.data_builder.create_m2m_data()
+        m2m_data.append({'time': '2015-02-16T00:00:00', 'longitude': 130.0 + source, 'latitude': 35.0})
+        return [m2m_data]
+
+    def store(self, m2m_data_list):
+        cycle = int(round(m2m_data_list[0][0]['longitude'] - 130.0))
+        self.store_started.set()
+        self.store_released.wait()
+        time.sleep(self.store_time)
+        if cycle in self.store_errors:
+            raise self.store_errors[cycle]
+        self.stored.append(cycle)
+
+
+def _wait_until(condition, timeout=5.0):
+    end_time = time.time() + timeout
+    while not condition() and time.time() < end_time:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestPipeline(TestCase):
+
+    def setUp(self):
+        self._project_home = tempfile.mkdtemp()
+        for dir_name in ['conf', '_log', '_cache', '_out']:
+            os.mkdir(os.path.join(self._project_home, dir_name))
+        self._sensors = []
+
+    def tearDown(self):
+        for sensor in self._sensors:
+            sensor.close()
+        # Sensor.open() configures uds.logging only once per process.
+        uds.logging._configured = False
+
+    def _create_sensor(self, max_cycles, queue_size):
+        sensor = _CountingSensor(self._project_home, max_cycles)
+        sensor.pipeline_params = {'queue_size': queue_size}
+        sensor.open()
+        self._sensors.append(sensor)
+        return sensor
+
+    def test_fetch_while_storing(self):
+        sensor = self._create_sensor(5, queue_size=2)
+        sensor.store_released.clear()
+        thread = threading.Thread(target=sensor._run_pipelined)
+        thread.daemon = True
+        thread.start()
+
+        # While the first cycle is stored, next cycles are fetched.
+        assert sensor.store_started.wait(5.0)
+        assert _wait_until(lambda: len(sensor.fetched) == 3)
+
+        # Fetch waits while queue_size cycles are in filter/store stage. (back pressure)
+        time.sleep(0.1)
+        assert sensor.fetched == [1, 2, 3]
+        assert sensor.stored == []
+
+        sensor.store_released.set()
+        thread.join(5.0)
+        assert not thread.is_alive()
+        assert sensor.stored == [1, 2, 3, 4, 5]
+
+    def test_back_stage_error(self):
+        sensor = self._create_sensor(5, queue_size=1)
+        sensor.store_errors = {2: IOError('store failed')}
+
+        messages = []
+        critical = uds.logging.critical
+        uds.logging.critical = lambda message, *args: messages.append(message % args)
+        try:
+            # Error in filter/store stage is logged, and raised after the stage is stopped.
+            self.assertRaises(IOError, sensor._run_pipelined)
+        finally:
+            uds.logging.critical = critical
+
+        assert len(messages) == 1
+        assert 'store failed' in messages[0]
+
+        # The stage keeps releasing cycles after the error, so fetch is not blocked and the stage is joined.
+        # Cycles after the error are discarded.
+        assert sensor.stored == [1]
+
+    def test_abort_drains_queued_cycles(self):
+        sensor = self._create_sensor(5, queue_size=3)
+        sensor.store_time = 0.02
+
+        sensor._run_pipelined()
+
+        # Cycles queued before abort are stored in order.
+        assert sensor.fetched == [1, 2, 3, 4, 5]
+        assert sensor.stored == [1, 2, 3, 4, 5]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import itertools
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+import uds.logging
+import uds.sensors.csvfile
+from uds.sensors.csvfile import CSVFileSensor
+from uds.sensors.csvfile import CSVFileSource
+from uds.sensors.csvfile import _iter_csv
+from uds.sensors.csvfile import _open_csv
+from uds.sensors.csvfile import _read_csv
+
+
+class TestStreamingCSV(TestCase):
+
+    def setUp(self):
+        self._file_path = os.path.join(tempfile.mkdtemp(), 'TestStreamingCSV.csv')
+        with open(self._file_path, 'wb') as fp:
+            fp.write(u'都市,観測所,雨量\r\n'.encode('shift_jis'))
+            for i in range(1000):
+                fp.write(u'京都,"舞鶴\r\n{0}",{1}\r\n'.format(i, i * 0.5).encode('shift_jis'))
+
+        self._detect_size = uds.sensors.csvfile._DETECT_SIZE
+
+    def tearDown(self):
+        uds.sensors.csvfile._DETECT_SIZE = self._detect_size
+
+    def test_same_rows(self):
+        with open(self._file_path, 'rb') as fp:
+            expected = _read_csv(fp, self._file_path)
+
+        # Multibyte character is split by the detection size.
+        uds.sensors.csvfile._DETECT_SIZE = 1001
+
+        fp = _open_csv(self._file_path)
+        rows = _iter_csv(fp, self._file_path)
+        chunks = []
+        while True:
+            chunk = list(itertools.islice(rows, 300))
+            if len(chunk) == 0:
+                break
+            chunks.append(chunk)
+        fp.close()
+
+        assert [len(chunk) for chunk in chunks] == [300, 300, 300, 101]
+        assert list(itertools.chain(*chunks)) == expected
+        assert expected[1] == [u'京都', u'舞鶴\r\n0', u'0.0']
+
+    def test_ascii_head(self):
+        # utf-8 file whose leading lines are ascii only.
+        with open(self._file_path, 'wb') as fp:
+            for i in range(100):
+                fp.write('Kyoto,Maizuru,{0}\r\n'.format(i))
+            # The first line can be decoded by shift_jis too.
+            fp.write(u'京都,舞鶴,100\r\n'.encode('utf-8'))
+            for i in range(100):
+                fp.write(u'京都,観測所,{0}\r\n'.format(i).encode('utf-8'))
+
+        # Encoding of the same file path is not known yet.
+        uds.sensors.csvfile._DETECT_SIZE = 1001
+        fp = _open_csv(self._file_path)
+        rows = list(_iter_csv(fp, self._file_path))
+        fp.close()
+
+        with open(self._file_path, 'rb') as fp:
+            expected = _read_csv(fp, self._file_path)
+        assert rows == expected
+        assert rows[100] == [u'京都', u'舞鶴', u'100']
+        assert len(rows) == 201
+
+
+class _RowSensor(CSVFileSensor):
+    """Sensor which parses each csv row to a M2M Data, and fails on 'error' row."""
+
+    def __init__(self, project_home):
+        super(_RowSensor, self).__init__(project_home)
+        self.sensor_name = 'TestParallelParse'
+        self.time_offset = '+09:00'
+        self.m2m_info = {'formatVersion': '1.02', 'createdContact': 'test'}
+        self.m2m_data_schema = [{'type': 'datetime', 'name': 'time'}, {'type': 'string', 'name': 'name'}]
+        self.primary_keys = ['time', 'longitude', 'latitude']
+        self.filter_type = 'no_filter'
+        self.store_type = 'console'
+        self.header_row_count = 1
+
+    def parse_rows(self, rows, file_path):
+        assert rows[0] == [u'name', u'longitude']
+        m2m_data_list = []
+        for row in rows[1:]:
+            if row[0] == u'error':
+                raise ValueError('Invalid row.')
+            m2m_data = self.data_builder.create_m2m_data()
+            m2m_data.append({'time': '2015-02-16T00:00:00', 'name': row[0], 'longitude': float(row[1]),
+                             'latitude': 35.0})
+            m2m_data_list.append(m2m_data)
+        return m2m_data_list
+
+
+class TestParallelParse(TestCase):
+
+    def setUp(self):
+        self._project_home = tempfile.mkdtemp()
+        for dir_name in ['conf', '_log', '_cache', '_out']:
+            os.mkdir(os.path.join(self._project_home, dir_name))
+
+        self._source = CSVFileSource()
+        self._source.rows = [[u'name', u'longitude']] + [[u'観測所' + unicode(i), unicode(130.0 + i * 0.01)]
+                                                          for i in range(100)]
+        self._source.file_path = 'TestParallelParse.csv'
+
+    def tearDown(self):
+        self._sensor.close()
+        # Sensor.open() configures uds.logging only once per process.
+        uds.logging._configured = False
+
+    def _open_sensor(self, parallel_parse_enabled):
+        self._sensor = _RowSensor(self._project_home)
+        self._sensor.parallel_parse_enabled = parallel_parse_enabled
+        self._sensor.parallel_parse_params = {'workers': 3, 'chunk_size': 7}
+        self._sensor.open()
+        return self._sensor
+
+    def test_same_as_serial(self):
+        sensor = self._open_sensor(False)
+        expected = [m2m_data.data_values for m2m_data in sensor._parse(self._source)]
+        sensor.close()
+        uds.logging._configured = False
+
+        # Rows are split into 15 chunks, with the header row.
+        sensor = self._open_sensor(True)
+        assert sensor._parse_pool is not None
+        chunks = sensor.split_source(self._source)
+        assert [len(chunk.rows) for chunk in chunks] == [8] * 14 + [3]
+        assert all(chunk.rows[0] == [u'name', u'longitude'] for chunk in chunks)
+
+        # Parsed M2M Data are same as serial parsing, and in the same order.
+        actual = [m2m_data.data_values for m2m_data in sensor._parse(self._source)]
+        assert len(actual) == 100
+        assert actual == expected
+        assert actual[0][0]['name'] == u'観測所0'
+
+    def test_worker_error(self):
+        sensor = self._open_sensor(True)
+        self._source.rows[50][0] = u'error'
+
+        # Error in worker process is raised in the main process.
+        self.assertRaises(ValueError, sensor._parse, self._source)
+
+        # Worker processes are still available.
+        self._source.rows[50][0] = u'ok'
+        assert len(sensor._parse(self._source)) == 100
+
+
+if __name__ == "__main__":
+    unittest.main()
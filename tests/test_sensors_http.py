@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import BaseHTTPServer
+import os
+import SocketServer
+import tempfile
+import threading
+import unittest
+from unittest import TestCase
+
+import uds.logging
+from uds.sensors.http import HttpSensor
+from uds.utils.benchmark import Timer
+from uds.utils.benchmark import TimeRecord
+
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class _ETagHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Handler which returns the same content with ETag."""
+
+    protocol_version = 'HTTP/1.1'
+    requests = []
+
+    def do_GET(self):
+        if self.headers.getheader('If-None-Match') == '"1"':
+            self.requests.append(304)
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.requests.append(200)
+        self.send_response(200)
+        self.send_header('Content-Length', '1')
+        self.send_header('ETag', '"1"')
+        self.end_headers()
+        self.wfile.write('1')
+
+    def log_message(self, *args):
+        pass
+
+
+class _ConditionalSensor(HttpSensor):
+
+    def __init__(self, project_home, url):
+        super(_ConditionalSensor, self).__init__(project_home)
+        self.sensor_name = 'TestConditionalFetch'
+        self.time_offset = '+09:00'
+        self.m2m_info = {'formatVersion': '1.02', 'createdContact': 'test'}
+        self.m2m_data_schema = [{'type': 'datetime', 'name': 'time'}]
+        self.primary_keys = ['time', 'longitude', 'latitude']
+        self.filter_type = 'no_filter'
+        self.store_type = 'console'
+        self.conditional_fetch_enabled = True
+        self.store_error = None
+        self.filter_out = False
+        self._url = url
+
+    def create_request(self):
+        return self._url, None
+
+    def parse_content(self, content, url):
+        m2m_data = self.data_builder.create_m2m_data()
+        m2m_data.append({'time': '2015-02-16T00:00:00', 'longitude': 130.0, 'latitude': 35.0})
+        return [m2m_data]
+
+    def filter(self, m2m_data_list):
+        if self.filter_out:
+            return []
+        return super(_ConditionalSensor, self).filter(m2m_data_list)
+
+    def store(self, m2m_data_list):
+        if self.store_error is not None:
+            raise self.store_error
+
+
+class TestConditionalFetch(TestCase):
+
+    def setUp(self):
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), _ETagHandler)
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        _ETagHandler.requests = []
+
+        project_home = tempfile.mkdtemp()
+        for dir_name in ['conf', '_log', '_cache', '_out']:
+            os.mkdir(os.path.join(project_home, dir_name))
+        self._sensor = _ConditionalSensor(project_home, 'http://127.0.0.1:{0}/'.format(self._server.server_address[1]))
+        self._sensor.open()
+
+    def tearDown(self):
+        self._sensor.close()
+        self._server.shutdown()
+        # Sensor.open() configures uds.logging only once per process.
+        uds.logging._configured = False
+
+    def _run_cycle(self):
+        time_record = TimeRecord()
+        timer0 = Timer()
+        timer0.start()
+        m2m_data_list = self._sensor._run_front_stage(time_record)
+        if m2m_data_list is None:
+            return 'skipped'
+        try:
+            self._sensor._run_back_stage(m2m_data_list, time_record, timer0)
+        except IOError:
+            return 'failed'
+        return 'stored'
+
+    def test_validators_saved_after_store(self):
+        # Validators of the failed cycle are discarded, and the page is fetched again.
+        self._sensor.store_error = IOError('store failed')
+        assert self._run_cycle() == 'failed'
+        assert self._run_cycle() == 'failed'
+
+        self._sensor.store_error = None
+        assert self._run_cycle() == 'stored'
+        assert self._run_cycle() == 'skipped'
+        assert _ETagHandler.requests == [200, 200, 200, 304]
+
+    def test_validators_saved_after_filtered_out(self):
+        # Validators are saved even if all data are filtered out. (e.g. not modified feed)
+        self._sensor.filter_out = True
+        assert self._run_cycle() == 'stored'
+        assert self._run_cycle() == 'skipped'
+        assert _ETagHandler.requests == [200, 304]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+import datetime
+import json
+import os
+import tempfile
+import time
+import timeit
+import unittest
+from unittest import TestCase
+
+from evwh_server import FakeEventWarehouse
+from uds.data.build import M2MDataBuilder
+from uds.data.commit import M2MDataCommitter
+from uds.io.evwh import EventWarehouseDao
+from uds.stores import EventWarehouseStore
+
+
+def _handler(query):
+    if query == 'SELECT GetTables':
+        return json.dumps({'tables': {}})
+    if 'failure' in query:
+        return json.dumps({'error': 'failure'})
+    return json.dumps({'result': True})
+
+
+class _UnavailableHandler(object):
+    """Handler which does not respond to INSERT until available."""
+
+    def __init__(self):
+        self.available = False
+        self.inserted_queries = []
+
+    def __call__(self, query):
+        if query.startswith('INSERT'):
+            if not self.available:
+                return None
+            self.inserted_queries.append(query)
+        return _handler(query)
+
+
+def _create_m2m_data_list(count, failure_indexes=()):
+    builder = M2MDataBuilder()
+    builder.title = 'TestEventWarehouseStore'
+    builder.timezone = '+09:00'
+    builder.m2m_info = {'formatVersion': '1.02', 'createdContact': 'test'}
+    builder.m2m_data_schema = [{'type': 'datetime', 'name': 'time'}, {'type': 'string', 'name': 'status'}]
+    builder.primary_keys = ['time', 'longitude', 'latitude']
+
+    m2m_data_list = []
+    for i in range(count):
+        m2m_data = builder.create_m2m_data()
+        m2m_data.append({'time': '2015-02-16T00:00:00', 'longitude': 130.0 + i * 0.01, 'latitude': 35.0,
+                         'status': 'failure' if i in failure_indexes else 'ok'})
+        m2m_data_list.append(M2MDataCommitter().process(m2m_data))
+    return m2m_data_list
+
+
+class TestEventWarehouseStore(TestCase):
+
+    def _create_store(self, server, connections, insert_batch_size=1, insert_batch_bytes=1048576,
+                      spool_enabled=False):
+        self._error_dir_path = tempfile.mkdtemp()
+        evwh_params = {
+            'host': '127.0.0.1',
+            'port': server.port,
+            'table_name': 'TestEventWarehouseStore',
+            'insert_timeout': 1,
+            'select_timeout': 1,
+            'primary_keys_enabled': False,
+            'max_in_flight': 4,
+            'connections': connections,
+            'insert_batch_size': insert_batch_size,
+            'insert_batch_bytes': insert_batch_bytes,
+            'error_dir_path': self._error_dir_path,
+            'spool_enabled': spool_enabled,
+            'spool_dir_path': os.path.join(self._error_dir_path, 'spool'),
+            'replay_batch_size': 100,
+            'replay_max_interval': 1
+        }
+        store = EventWarehouseStore(evwh_params, {'dir_file_max': 100}, 'TestEventWarehouseStore',
+                                    datetime.datetime.now())
+        store.open()
+        return store
+
+    def test_store(self):
+        server = FakeEventWarehouse(_handler, reorder=True).start()
+        store = self._create_store(server, 3)
+        store.store(_create_m2m_data_list(20, failure_indexes=(2, 17)))
+        store.close()
+        server.stop()
+
+        # Table creation and 20 inserts are sent over 3 connections, and 2 connections with failure reconnect.
+        assert server.connection_count == 3 + 2
+        assert len(server.queries) == 2 + 20
+
+        # Failed data are written to error directory.
+        error_files = [name for _, _, names in os.walk(self._error_dir_path) for name in names]
+        assert len([name for name in error_files if name.startswith('M2MData')]) == 2
+
+    def test_store_batches(self):
+        server = FakeEventWarehouse(_handler).start()
+        store = self._create_store(server, 1, insert_batch_size=8)
+        store.store(_create_m2m_data_list(20, failure_indexes=(10,)))
+        store.close()
+        server.stop()
+
+        # 20 inserts are packed into 3 queries, and the rejected batch of 8 is retried one by one.
+        inserts = [query for query in server.queries if query.startswith('INSERT')]
+        assert [query.count('M2M(') for query in inserts] == [8, 8, 4] + [1] * 8
+
+        # Only failed data is written to error directory.
+        error_files = [name for _, _, names in os.walk(self._error_dir_path) for name in names]
+        assert len([name for name in error_files if name.startswith('M2MData')]) == 1
+
+    def test_store_batches_by_bytes(self):
+        server = FakeEventWarehouse(_handler).start()
+        m2m_data_list = _create_m2m_data_list(10)
+        store = self._create_store(server, 1, insert_batch_size=100,
+                                   insert_batch_bytes=len(EventWarehouseDao(None, None)._create_insert_values(
+                                       m2m_data_list[0])) * 3 + 10)
+        store.store(m2m_data_list)
+        store.close()
+        server.stop()
+
+        inserts = [query for query in server.queries if query.startswith('INSERT')]
+        assert [query.count('M2M(') for query in inserts] == [3, 3, 3, 1]
+
+    def test_spool(self):
+        handler = _UnavailableHandler()
+        server = FakeEventWarehouse(handler).start()
+        store = self._create_store(server, 1, spool_enabled=True)
+        store._clients[0].timeout = 0.2
+        store._replay_client.timeout = 0.2
+        m2m_data_list = _create_m2m_data_list(10)
+
+        # Data failed to store and following data are appended to spool.
+        store.store(m2m_data_list[:5])
+        assert store.metrics() == {'spool_depth': 5}
+        start = time.time()
+        store.store(m2m_data_list[5:8])
+        assert time.time() - start < 0.2
+        assert store.metrics() == {'spool_depth': 8}
+
+        # Spool is replayed after Event Warehouse is available.
+        handler.available = True
+        for i in range(100):
+            if store.metrics()['spool_depth'] == 0:
+                break
+            time.sleep(0.05)
+        assert store.metrics() == {'spool_depth': 0}
+
+        store.store(m2m_data_list[8:])
+        store.close()
+        server.stop()
+
+        # All data are inserted in order, without error files.
+        data_ids = [m2m_data.data_id for m2m_data in m2m_data_list]
+        assert [data_id for query in handler.inserted_queries for data_id in data_ids if data_id in query] == data_ids
+        assert not any(name.startswith('M2MData') for _, _, names in os.walk(self._error_dir_path) for name in names)
+
+    def test_spool_append_failure(self):
+        server = FakeEventWarehouse(_handler).start()
+        store = self._create_store(server, 1, spool_enabled=True)
+        m2m_data_list = _create_m2m_data_list(3)
+
+        dao = store._evwh_daos[0]
+        create_insert_query = dao.create_insert_query
+
+        def _create_insert_query(m2m_data):
+            if m2m_data is m2m_data_list[1]:
+                raise ValueError('failure')
+            return create_insert_query(m2m_data)
+
+        def _append(queries):
+            raise IOError('failure')
+
+        inserted_data_ids = []
+        file_insert = store._file_dao.insert
+
+        def _file_insert(m2m_data):
+            inserted_data_ids.append(m2m_data.data_id)
+            file_insert(m2m_data)
+
+        dao.create_insert_query = _create_insert_query
+        store._spool.append = _append
+        store._file_dao.insert = _file_insert
+        store._append_to_spool(m2m_data_list)
+        store.close()
+        server.stop()
+
+        # Each data is written to error directory once.
+        assert sorted(inserted_data_ids) == sorted(m2m_data.data_id for m2m_data in m2m_data_list)
+
+    def test_multiple_connections(self):
+        server = FakeEventWarehouse(_handler, latency=0.01).start()
+        m2m_data_list = _create_m2m_data_list(64)
+
+        single_store = self._create_store(server, 1)
+        single = min(timeit.repeat(lambda: single_store.store(m2m_data_list), number=1, repeat=3))
+        single_store.close()
+
+        multiple_store = self._create_store(server, 4)
+        multiple = min(timeit.repeat(lambda: multiple_store.store(m2m_data_list), number=1, repeat=3))
+        multiple_store.close()
+        server.stop()
+
+        print 'evwh store: connections=1 {0:.4f}s, connections=4 {1:.4f}s'.format(single, multiple)
+
+        # Inserts are split evenly over connections.
+        insert_counts = [len([query for query in queries if query.startswith('INSERT')])
+                         for queries in server.connection_queries]
+        assert insert_counts == [64 * 3] + [16 * 3] * 4
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import unittest
+from unittest import TestCase
+
+from uds.utils.cache import BoundedSet
+
+
+class _CountingKey(object):
+    """Key which counts comparisons."""
+
+    eq_count = 0
+
+    def __init__(self, value):
+        self._value = value
+
+    def __hash__(self):
+        return hash(self._value)
+
+    def __eq__(self, other):
+        _CountingKey.eq_count += 1
+        return self._value == other._value
+
+
+class TestBoundedSet(TestCase):
+
+    def test_fifo(self):
+        keys = BoundedSet(3)
+        assert keys.add('a')
+        assert keys.add('b')
+        assert not keys.add('a')
+        assert keys.add('c')
+        assert keys.add('d')
+
+        # 'a' is evicted even though it was added twice.
+        assert 'a' not in keys
+        assert 'b' in keys
+        assert len(keys) == 3
+
+    def test_lru(self):
+        keys = BoundedSet(3, lru=True)
+        keys.add('a')
+        keys.add('b')
+        keys.add('c')
+        keys.add('a')
+        keys.add('d')
+
+        # 'b' is the least recently added.
+        assert 'a' in keys
+        assert 'b' not in keys
+        assert len(keys) == 3
+
+    def test_constant_time(self):
+        keys = BoundedSet(100000)
+        for i in xrange(100000):
+            keys.add(_CountingKey(i))
+
+        _CountingKey.eq_count = 0
+        for i in xrange(100000, 101000):
+            keys.add(_CountingKey(i))
+            assert _CountingKey(i) in keys
+
+        # Keys are not compared one by one. (With list based buffer, each add compares 100000 keys.)
+        assert _CountingKey.eq_count <= 1000
+        assert len(keys) == 100000
+
+if __name__ == "__main__":
+    unittest.main()
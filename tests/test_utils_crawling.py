@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import BaseHTTPServer
+import SocketServer
+import os
+import tempfile
+import threading
+import unittest
+import urllib2
+from multiprocessing.pool import ThreadPool
+from unittest import TestCase
+
+from uds.utils.crawling import HttpValidatorCache
+from uds.utils.crawling import KeepAliveHandler
+
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class _PageHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.client_ports.add(self.client_address[1])
+        body = 'page ' + self.path
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+        # Close the connection without notice to client.
+        if self.path == '/drop':
+            self.close_connection = 1
+
+    def log_message(self, *args):
+        pass
+
+
+class TestKeepAliveHandler(TestCase):
+
+    def setUp(self):
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), _PageHandler)
+        self._server.client_ports = set()
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        self._base_url = 'http://127.0.0.1:{0}'.format(self._server.server_address[1])
+
+        self._handler = KeepAliveHandler()
+        self._opener = urllib2.build_opener(urllib2.ProxyHandler({}), self._handler)
+
+    def tearDown(self):
+        self._handler.close()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _fetch(self, path):
+        sock = self._opener.open(self._base_url + path, None, 5)
+        content = sock.read()
+        sock.close()
+        return content
+
+    def test_reuse_connection(self):
+        for i in range(5):
+            assert self._fetch('/' + str(i)) == 'page /' + str(i)
+
+        # All requests are sent on a single connection.
+        assert len(self._server.client_ports) == 1
+
+    def test_reconnect(self):
+        assert self._fetch('/drop') == 'page /drop'
+
+        # Kept connection is closed by server, so the request is retried on a new connection.
+        assert self._fetch('/2') == 'page /2'
+        assert len(self._server.client_ports) == 2
+
+    def test_concurrent(self):
+        pool = ThreadPool(4)
+        paths = ['/' + str(i) for i in range(40)]
+        contents = pool.map(self._fetch, paths, 1)
+        pool.close()
+        pool.join()
+
+        # Results are in order of requests, and connections are kept per thread.
+        assert contents == ['page ' + path for path in paths]
+        assert len(self._server.client_ports) <= 4
+
+
+class TestHttpValidatorCache(TestCase):
+
+    def test_save_and_load(self):
+        file_path = os.path.join(tempfile.mkdtemp(), 'http_cache', 'TestHttpValidatorCache.json')
+
+        cache = HttpValidatorCache(file_path)
+        cache.load()
+        assert cache.get('http://example.com/') is None
+
+        cache.set('http://example.com/', '"abc"', None, 'd41d8cd98f00b204e9800998ecf8427e')
+        cache.save()
+
+        cache = HttpValidatorCache(file_path)
+        cache.load()
+        assert cache.get('http://example.com/') == {
+            'etag': '"abc"', 'last_modified': None, 'content_hash': 'd41d8cd98f00b204e9800998ecf8427e'}
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import timeit
+import unittest
+from unittest import TestCase
+
+import dateutil.parser
+
+from uds.utils.datetime import parse_time
+
+
+class TestParseTime(TestCase):
+
+    def test_same_as_dateutil(self):
+        for time, offset in [
+            ('2015-02-16T01:00:00.000', '+09:00'),
+            ('2015-02-16T01:00:00.123456', '-05:00'),
+            ('2015-02-16T01:00:00', '+0900'),
+            ('2015-02-16 01:00:00.5', '+00:00'),
+            ('2015-02-16T01:00:00', 'Z'),
+            ('2015-02-16T01:00:00', ''),
+            ('2015-02-16T01:00:00+09:00', ''),
+            ('2015/02/16 01:00', '+09:00'),
+        ]:
+            expected = dateutil.parser.parse(time + offset)
+            actual = parse_time(time, offset)
+            assert actual == expected
+            assert actual.utcoffset() == expected.utcoffset()
+
+    def test_invalid_time(self):
+        self.assertRaises(ValueError, parse_time, '2015-13-16T01:00:00', '+09:00')
+        # Raises same error as dateutil.
+        self.assertRaises(Exception, parse_time, 'invalid', '+09:00')
+
+    def test_fast_path(self):
+        times = ['2015-02-16T01:%02d:%02d.000' % (i / 60, i % 60) for i in range(1000)]
+
+        parse = dateutil.parser.parse
+        parsed_values = []
+        dateutil.parser.parse = lambda value, *args, **kwargs: parsed_values.append(value) or parse(value)
+        try:
+            # ISO 8601 format is not parsed by dateutil.
+            assert [parse_time(t, '+08:00') for t in times] == [parse(t + '+08:00') for t in times]
+            assert parsed_values == []
+
+            # Other format is parsed by dateutil once, then cached.
+            assert parse_time('2015/02/16 01:00', '+08:00') == parse_time('2015/02/16 01:00', '+08:00')
+            assert parsed_values == ['2015/02/16 01:00+08:00']
+        finally:
+            dateutil.parser.parse = parse
+
+        before = min(timeit.repeat(lambda: [dateutil.parser.parse(t + '+09:00') for t in times], number=1, repeat=3))
+        after = min(timeit.repeat(lambda: [parse_time(t, '+09:00') for t in times], number=1, repeat=3))
+        print 'parse_time x 1000: dateutil={0:.4f}s, parse_time={1:.4f}s'.format(before, after)
+
+if __name__ == "__main__":
+    unittest.main()
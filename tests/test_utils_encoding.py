@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import csv
+import os
+import timeit
+import unittest
+from StringIO import StringIO
+from unittest import TestCase
+
+from uds.sensors.csvfile import _read_csv
+from uds.utils.encoding import decode
+from uds.utils.encoding import get_charset
+from uds.utils.encoding import get_known_encoding
+
+SAMPLE_DIR_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '../uds/templates/project/examples/sample_rainfall/pre1h')
+
+
+def _read_sample(file_name):
+    with open(os.path.join(SAMPLE_DIR_PATH, file_name), 'rb') as fp:
+        return fp.read()
+
+
+class _RecordingBytes(str):
+    """Byte string which records encodings tried to decode it."""
+
+    def __new__(cls, value):
+        self = super(_RecordingBytes, cls).__new__(cls, value)
+        self.encodings = []
+        return self
+
+    def decode(self, encoding, *args):
+        self.encodings.append(encoding)
+        return super(_RecordingBytes, self).decode(encoding, *args)
+
+
+class _RecordingFile(object):
+
+    def __init__(self, data):
+        self._data = data
+
+    def read(self):
+        return self._data
+
+
+class TestEncoding(TestCase):
+
+    def test_get_charset(self):
+        assert get_charset('text/html; charset=EUC-JP') == 'EUC-JP'
+        assert get_charset('text/html', '<html><head><meta charset="Shift_JIS"/></head>') == 'Shift_JIS'
+        assert get_charset(None, _read_sample('20140809T0900.html')) == 'UTF-8'
+        assert get_charset('text/html; charset=unknown-charset') is None
+        assert get_charset('text/html', '<html></html>') is None
+
+    def test_decode(self):
+        text = u'京都 舞鶴'
+        assert decode(text.encode('shift_jis')) == text
+        assert decode(text.encode('euc-jp')) == text
+        assert decode(text.encode('utf-8'), charset='utf-8') == text
+        assert decode(text.encode('utf-8'), encodings=('utf-8', 'shift_jis')) == text
+        assert decode(text) is text
+
+        # Encoding is remembered per key.
+        decode(text.encode('euc-jp'), key='http://example.com/euc')
+        assert get_known_encoding('http://example.com/euc') == 'euc-jp'
+
+    def test_benchmark_html(self):
+        # Sample pages with Japanese rows
+        content = _read_sample('20140809T0900.html').replace(
+            '</tbody>', u'<tr><td>京都</td><td>舞鶴</td><td>1.5</td><td>テスト</td></tr>'.encode('utf-8') * 1000 + '</tbody>')
+
+        def decode_cascade():
+            try:
+                return unicode(content, "shift_jis")
+            except:
+                try:
+                    return unicode(content, "euc-jp")
+                except:
+                    try:
+                        return unicode(content, "utf-8")
+                    except:
+                        return content
+
+        def decode_declared():
+            return decode(content, key='http://example.com/sample', charset=get_charset('text/html', content))
+
+        assert decode_cascade() == decode_declared()
+
+        # Only the declared charset is tried.
+        recording_content = _RecordingBytes(content)
+        decode(recording_content, key='http://example.com/sample', charset=get_charset('text/html', recording_content))
+        assert recording_content.encodings == ['UTF-8']
+
+        before = min(timeit.repeat(decode_cascade, number=20, repeat=3))
+        after = min(timeit.repeat(decode_declared, number=20, repeat=3))
+        print 'html: cascade={0:.4f}s, declared={1:.4f}s'.format(before, after)
+
+    def test_benchmark_csv(self):
+        # Sample file with Japanese rows
+        sample = _read_sample('20140809T0900.csv')
+        data = sample + (sample.split('\n', 1)[1] + u'京都,舞鶴,1.5,テスト\r\n\r\n'.encode('shift_jis')) * 500
+        file_path = os.path.join(SAMPLE_DIR_PATH, 'benchmark.csv')
+
+        def read_per_cell():
+            return [[unicode(col, "Shift_JIS") for col in row] for row in csv.reader(StringIO(data))]
+
+        def read_whole():
+            return _read_csv(StringIO(data), file_path)
+
+        assert read_per_cell() == read_whole()
+
+        # Whole file is decoded at once, not cell by cell.
+        recording_data = _RecordingBytes(data)
+        _read_csv(_RecordingFile(recording_data), file_path)
+        assert recording_data.encodings == ['shift_jis']
+
+        before = min(timeit.repeat(read_per_cell, number=5, repeat=3))
+        after = min(timeit.repeat(read_whole, number=5, repeat=3))
+        print 'csv: per_cell={0:.4f}s, whole={1:.4f}s'.format(before, after)
+
+
+if __name__ == "__main__":
+    unittest.main()
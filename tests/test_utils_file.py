@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+from uds.utils.file import write_atomic
+
+
+class TestWriteAtomic(TestCase):
+
+    def test_write_atomic(self):
+        file_path = os.path.join(tempfile.mkdtemp(), 'dir', 'TestWriteAtomic.json')
+
+        # Parent directory is created.
+        write_atomic(file_path, '{"entries": []}')
+        with open(file_path) as fp:
+            assert fp.read() == '{"entries": []}'
+
+        # Existing file is replaced, and temporary file is not left.
+        write_atomic(file_path, '{}', fsync=True)
+        with open(file_path) as fp:
+            assert fp.read() == '{}'
+        assert os.listdir(os.path.dirname(file_path)) == ['TestWriteAtomic.json']
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import collections
+import decimal
+import json
+import timeit
+import unittest
+from unittest import TestCase
+
+from uds.data import create_m2m_data_from_dict
+from uds.data import create_m2m_data_from_json
+from uds.utils import jsoncodec
+from data import TEST_M2M_DATA1
+from data import TEST_M2M_DATA2
+
+
+class TestJsonCodec(TestCase):
+
+    def tearDown(self):
+        jsoncodec.configure('json')
+
+    def test_compatibility(self):
+        for codec in ['json', 'simplejson', 'ujson', 'auto']:
+            jsoncodec.configure(codec)
+            for fixture in [TEST_M2M_DATA1, TEST_M2M_DATA2]:
+                # Encoded text must be same byte-for-byte as stdlib json.
+                text = jsoncodec.dumps(fixture)
+                assert text == json.dumps(fixture)
+                assert jsoncodec.loads(text) == json.loads(text)
+
+                m2m_data = create_m2m_data_from_json(text)
+                assert m2m_data.json == text
+                assert m2m_data.metadata_json == json.dumps(m2m_data.metadata_dict)
+                assert m2m_data.data_json == json.dumps(m2m_data.data_dict)
+
+    def test_special_values(self):
+        point = collections.namedtuple('Point', ['longitude', 'latitude'])
+        values = [
+            float('nan'),
+            float('inf'),
+            -float('inf'),
+            point(135.0, 35.0),
+            {'values': [point(float('nan'), 1e300), (1, 2)], 'name': u'\u4eac\u90fd'},
+        ]
+        for codec in ['json', 'simplejson', 'auto']:
+            jsoncodec.configure(codec)
+            for value in values:
+                assert jsoncodec.dumps(value) == json.dumps(value)
+            self.assertRaises(TypeError, jsoncodec.dumps, decimal.Decimal('1.5'))
+
+    def test_unknown_codec(self):
+        self.assertRaises(ValueError, jsoncodec.configure, 'unknown')
+
+    def test_throughput(self):
+        m2m_data = create_m2m_data_from_dict(json.loads(json.dumps(TEST_M2M_DATA1)))
+        values = m2m_data.data_values * (1000 / len(m2m_data.data_values) + 1)
+        text = json.dumps(values)
+
+        for codec in ['json', 'auto']:
+            jsoncodec.configure(codec)
+            dumps_time = min(timeit.repeat(lambda: jsoncodec.dumps(values), number=10, repeat=3))
+            loads_time = min(timeit.repeat(lambda: jsoncodec.loads(text), number=10, repeat=3))
+            print '{0}: encoder={1}, decoder={2}, dumps={3:.6f}s, loads={4:.6f}s'.format(
+                codec, jsoncodec.get_codec_names()[0], jsoncodec.get_codec_names()[1], dumps_time, loads_time)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -23,12 +23,30 @@ CACHE_DIR_PATH = '{PROJECT_HOME}/_cache'
 #: Default value of :attr:`uds.sensors.base.Sensor.filter_type` .
 FILTER_TYPE = 'time_order_filter'
 
+#: Default value of :attr:`uds.sensors.base.Sensor.filter_params` .
+FILTER_PARAMS = {
+    'time_order_filter': {
+        'cache_enabled': False,
+        'cache_max_age': 3600,
+        'cache_save_interval': 60,
+    },
+    'limited_buffer_filter': {
+        'buffer_size': 1000,
+    },
+}
+
 #: Default value of :attr:`uds.sensors.base.Sensor.time_offset` .
 TIME_OFFSET = '+00:00'
 
 #: Default value of :attr:`uds.sensors.base.Sensor.store_type` .
 STORE_TYPE = 'file'
 
+#: Default value of 'pool_size' of MySQL connection parameters. (See :func:`uds.io.mysql.create_client`)
+MYSQL_POOL_SIZE = 4
+
+#: Default value of 'ping_interval' of MySQL connection parameters. (See :func:`uds.io.mysql.create_client`)
+MYSQL_PING_INTERVAL = 60
+
 #: Default value of :attr:`uds.sensors.base.Sensor.store_params` .
 STORE_PARAMS = {
     'console': {},
@@ -41,7 +59,10 @@ STORE_PARAMS = {
         'password': None,
         'host': None,
         'db': None,
-        'table_name': None
+        'table_name': None,
+        'insert_batch_size': 1000,
+        'pool_size': MYSQL_POOL_SIZE,
+        'ping_interval': MYSQL_PING_INTERVAL
     },
     'evwh': {
         'host': None,
@@ -50,6 +71,14 @@ STORE_PARAMS = {
         'insert_timeout': 2,
         'select_timeout': 2,
         'primary_keys_enabled': False,
+        'max_in_flight': 16,
+        'connections': 1,
+        'insert_batch_size': 1,
+        'insert_batch_bytes': 1048576,
+        'spool_enabled': False,
+        'spool_dir_path': '{OUT_DIR_PATH}/evwh_spool',
+        'replay_batch_size': 100,
+        'replay_max_interval': 60,
         'error_dir_path': '{OUT_DIR_PATH}/evwh_error'
     },
     'scn': {
@@ -65,6 +94,34 @@ STORE_PARAMS = {
 #: Default value of :attr:`uds.sensors.base.Sensor.time_record_enabled` .
 TIME_RECORD_ENABLED = False
 
+#: Default value of :attr:`uds.sensors.base.Sensor.pipeline_enabled` .
+PIPELINE_ENABLED = False
+
+#: Default value of :attr:`uds.sensors.base.Sensor.pipeline_params` .
+PIPELINE_PARAMS = {
+    'queue_size': 1
+}
+
+#: Default value of :attr:`uds.sensors.base.Sensor.parallel_parse_enabled` .
+PARALLEL_PARSE_ENABLED = False
+
+#: Default value of :attr:`uds.sensors.base.Sensor.parallel_parse_params` .
+PARALLEL_PARSE_PARAMS = {
+    'workers': None,
+    'chunk_size': 10000
+}
+
+#: Default value of :attr:`uds.sensors.base.Sensor.check_params` .
+CHECK_PARAMS = {
+    'drop_invalid': False
+}
+
+#: Default value of :attr:`uds.sensors.base.Sensor.columnar_enabled` .
+COLUMNAR_ENABLED = False
+
+#: Default value of :attr:`uds.sensors.base.Sensor.json_codec` .
+JSON_CODEC = 'auto'
+
 #: Default value of :attr:`uds.sensors.base.Sensor.log_enabled` .
 LOG_FILE_ENABLED = True
 
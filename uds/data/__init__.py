@@ -11,8 +11,10 @@ from abc import ABCMeta
 from abc import abstractmethod
 from abc import abstractproperty
 
-import json
-import dateutil.parser
+import copy
+
+from uds.utils import jsoncodec
+from uds.utils.datetime import parse_time
 
 
 class M2MDataVisitor(object):
@@ -63,6 +65,9 @@ class M2MData(object):
         self._is_commit = False
         self._primary_keys = {}
         self._info_summary = None
+        self._bounds = None
+        self._bounds_key = None
+        self._json_cache = {}
 
     @abstractmethod
     def __getitem__(self, i):
@@ -166,6 +171,32 @@ class M2MData(object):
         """
         return len(self.data_values)
 
+    @property
+    def is_columnar(self):
+        """Whether datum are kept as columns or not.
+
+        :getter: Returns this parameter
+        :type: :class:`bool`
+        """
+        return False
+
+    def column(self, name):
+        """Returns values of the name for all datum.
+        If datum does not have the name, the value is None.
+
+        :param str name: Name of value
+        :return: Values (Do not modify)
+        :rtype: :class:`list` or :class:`array.array`
+        """
+        return [datum.get(name) for datum in self.data_values]
+
+    def iter_data(self):
+        """Returns iterator of datum.
+
+        :return: Iterator of datum
+        """
+        return iter(self.data_values)
+
     @abstractproperty
     def min_time(self):
         """Minimum time of datum.
@@ -236,8 +267,7 @@ class M2MData(object):
         :getter: Returns this parameter
         :type: :class:`str`
         """
-        # return json.dumps(self._dict, ensure_ascii=False)  # FIXME
-        return json.dumps(self._dict)
+        return self._compose_json(self._dict)
 
     @property
     def metadata_dict(self):
@@ -245,8 +275,7 @@ class M2MData(object):
 
     @property
     def metadata_json(self):
-        # return json.dumps(self.metadata_dict, ensure_ascii=False)  # FIXME
-        return json.dumps(self.metadata_dict)
+        return self._compose_json(self.metadata_dict)
 
     @property
     def data_dict(self):
@@ -254,8 +283,74 @@ class M2MData(object):
 
     @property
     def data_json(self):
-        # return json.dumps(self.data_dict, ensure_ascii=False)  # FIXME
-        return json.dumps(self.data_dict)
+        return self._compose_json(self.data_dict)
+
+    def mark_dirty(self, *part_keys):
+        """Clear serialized JSON cache of parts.
+        Call this after editing :attr:`dict` directly.
+
+        * :meth:`append` and :meth:`extend` mark 'data' part dirty automatically.
+
+        :param part_keys: 'primary', 'sensor_info' or 'data'. If omitted, all parts are marked dirty.
+        :return: None
+        """
+        if len(part_keys) == 0:
+            self._json_cache.clear()
+        else:
+            for part_key in part_keys:
+                self._json_cache.pop(part_key, None)
+
+    def cache_part_json(self, part_key, part_json):
+        """Keep serialized part to reuse as JSON text of the part.
+
+        :param str part_key: 'primary', 'sensor_info' or 'data'
+        :param str part_json: Same string as ``json.dumps(self.dict[part_key])``
+        :return: None
+        """
+        self._json_cache[part_key] = part_json
+
+    def dumps_values(self):
+        """Serialize 'data'->'values' part to JSON text.
+
+        :return: JSON text
+        :rtype: :class:`str`
+        """
+        return jsoncodec.dumps(self.data_values)
+
+    def dumps_data_part(self, values_json=None):
+        """Serialize 'data' part to JSON text.
+        The result is same as ``json.dumps(self.dict['data'])``.
+
+        :param str values_json: Serialized 'data'->'values' part. If omitted, :meth:`dumps_values` is used.
+        :return: JSON text
+        :rtype: :class:`str`
+        """
+        if values_json is None:
+            values_json = self.dumps_values()
+
+        items = []
+        for key, value in self._dict['data'].iteritems():
+            if key == 'values':
+                items.append(jsoncodec.dumps(key) + ': ' + values_json)
+            else:
+                items.append(jsoncodec.dumps(key) + ': ' + jsoncodec.dumps(value))
+        return '{' + ', '.join(items) + '}'
+
+    def _get_part_json(self, part_key):
+        part_json = self._json_cache.get(part_key)
+        if part_json is None:
+            # part_json = json.dumps(self._dict[part_key], ensure_ascii=False)  # FIXME
+            if part_key == 'data':
+                part_json = self.dumps_data_part()
+            else:
+                part_json = jsoncodec.dumps(self._dict[part_key])
+            self._json_cache[part_key] = part_json
+        return part_json
+
+    def _compose_json(self, parts):
+        # Same string as json.dumps(parts), but each part is serialized at most once.
+        return '{' + ', '.join([jsoncodec.dumps(part_key) + ': ' + self._get_part_json(part_key)
+                                for part_key in parts]) + '}'
 
     def append(self, datum):
         """Append datum to this M2M Data.
@@ -264,6 +359,8 @@ class M2MData(object):
         :return: None
         """
         self.data_values.append(datum)
+        self._bounds = None
+        self.mark_dirty('data')
 
     def extend(self, data):
         """Extend this M2M Data with argument data.
@@ -272,6 +369,52 @@ class M2MData(object):
         :return: None
         """
         self.data_values.extend(data)
+        self._bounds = None
+        self.mark_dirty('data')
+
+    def _get_bounds(self):
+        """Returns spatiotemporal bounds of datum.
+        All bounds are calculated in a single pass over datum and cached.
+
+        The cache is invalidated by :meth:`append` and :meth:`extend`,
+        or when number of datum or timezone is changed.
+
+        :return: Tuple of (min_time, max_time, south, north, west, east)
+        :rtype: :class:`tuple`
+        """
+        bounds_key = self._get_bounds_key()
+        if self._bounds is None or self._bounds_key != bounds_key:
+            self._bounds = self._calculate_bounds()
+            self._bounds_key = bounds_key
+        return self._bounds
+
+    def _get_bounds_key(self):
+        data_values = self.data_values
+        return id(data_values), len(data_values), self._dict['primary']['timezone']
+
+    def _calculate_bounds(self):
+        timezone = self._dict['primary']['timezone']
+        min_time = max_time = south = north = west = east = None
+        for datum in self.data_values:
+            if 'time' in datum:
+                time = parse_time(datum['time'], timezone)
+                if min_time is None or time < min_time:
+                    min_time = time
+                if max_time is None or max_time < time:
+                    max_time = time
+            if 'latitude' in datum:
+                latitude = datum['latitude']
+                if south is None or latitude < south:
+                    south = latitude
+                if north is None or north < latitude:
+                    north = latitude
+            if 'longitude' in datum:
+                longitude = datum['longitude']
+                if west is None or longitude < west:
+                    west = longitude
+                if east is None or east < longitude:
+                    east = longitude
+        return min_time, max_time, south, north, west, east
 
     def commit(self):
         """Change commit state to True.
@@ -290,6 +433,36 @@ class M2MData(object):
         """
         return self._is_commit
 
+    def copy_without_values(self):
+        """Returns a copy of this M2M Data which has no datum.
+
+        Unlike :func:`copy.deepcopy`, 'data'->'values' part is not copied.
+        Other parts and commit state are copied as is.
+
+        :return: M2MData object with empty 'data'->'values' part
+        :rtype: :class:`M2MData`
+        """
+        m2m_dict = {}
+        for part_key, part in self._dict.iteritems():
+            if part_key == 'data':
+                data_part = {}
+                for key, value in part.iteritems():
+                    if key != 'values':
+                        data_part[key] = copy.deepcopy(value)
+                data_part['values'] = []
+                m2m_dict[part_key] = data_part
+            else:
+                m2m_dict[part_key] = copy.deepcopy(part)
+
+        clone = copy.copy(self)
+        clone._dict = m2m_dict
+        clone._bounds = None
+        clone._json_cache = dict((part_key, part_json) for part_key, part_json in self._json_cache.iteritems()
+                                 if part_key != 'data')
+        clone._primary_keys = copy.deepcopy(self._primary_keys)
+        clone._info_summary = copy.deepcopy(self._info_summary)
+        return clone
+
     @abstractmethod
     def accept(self, visitor):
         """Accept M2MDataVisitor object to do something about this M2MData.
@@ -345,23 +518,13 @@ class M2MDataV101(M2MData):
     def min_time(self):
         """Implementation of abstractproperty.
         """
-        result = None
-        for datum in self.data_values:
-            time = dateutil.parser.parse(datum['time']+self._dict['primary']['timezone'])
-            if result is None or time < result:
-                result = time
-        return result
+        return self._get_bounds()[0]
 
     @property
     def max_time(self):
         """Implementation of abstractproperty.
         """
-        result = None
-        for datum in self.data_values:
-            time = dateutil.parser.parse(datum['time']+self._dict['primary']['timezone'])
-            if result is None or result < time:
-                result = time
-        return result
+        return self._get_bounds()[1]
 
     @property
     def south(self):
@@ -499,63 +662,37 @@ class M2MDataV102(M2MData):
     def min_time(self):
         """Implementation of abstractproperty.
         """
-        result = None
-        for datum in self.data_values:
-            time = dateutil.parser.parse(datum['time']+self._dict['primary']['timezone'])
-            if result is None or time < result:
-                result = time
-        return result
+        return self._get_bounds()[0]
 
     @property
     def max_time(self):
         """Implementation of abstractproperty.
         """
-        result = None
-        for datum in self.data_values:
-            time = dateutil.parser.parse(datum['time']+self._dict['primary']['timezone'])
-            if result is None or result < time:
-                result = time
-        return result
+        return self._get_bounds()[1]
 
     @property
     def south(self):
         """Implementation of abstractproperty.
         """
-        result = None
-        for datum in self.data_values:
-            if result is None or datum['latitude'] < result:
-                result = datum['latitude']
-        return result
+        return self._get_bounds()[2]
 
     @property
     def north(self):
         """Implementation of abstractproperty.
         """
-        result = None
-        for datum in self.data_values:
-            if result is None or result < datum['latitude']:
-                result = datum['latitude']
-        return result
+        return self._get_bounds()[3]
 
     @property
     def west(self):
         """Implementation of abstractproperty.
         """
-        result = None
-        for datum in self.data_values:
-            if result is None or datum['longitude'] < result:
-                result = datum['longitude']
-        return result
+        return self._get_bounds()[4]
 
     @property
     def east(self):
         """Implementation of abstractproperty.
         """
-        result = None
-        for datum in self.data_values:
-            if result is None or result < datum['longitude']:
-                result = datum['longitude']
-        return result
+        return self._get_bounds()[5]
 
     def accept(self, visitor):
         """Implementation of abstractproperty.
@@ -619,7 +756,7 @@ def create_m2m_data_from_json(m2m_data_json):
     :param m2m_data_json:
     :return:
     """
-    m2m_data_dict = json.loads(m2m_data_json)
+    m2m_data_dict = jsoncodec.loads(m2m_data_json)
     return create_m2m_data_from_dict(m2m_data_dict)
 
 
@@ -637,4 +774,14 @@ def create_m2m_data_from_dict(m2m_data_dict):
         raise AssertionError()
 
     m2m_data._dict = m2m_data_dict
-    return m2m_data
\ No newline at end of file
+    return m2m_data
+
+
+def _copy_structure(obj):
+    # Copy dict and list recursively, in the same key order as copy.deepcopy. Other objects are treated as immutable.
+    if type(obj) is dict:
+        return {key: _copy_structure(value) for key, value in obj.iteritems()}
+    elif type(obj) is list:
+        return [_copy_structure(value) for value in obj]
+    else:
+        return obj
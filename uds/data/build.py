@@ -12,11 +12,16 @@ import uds.utils.dict
 from uds.data import M2MDataV101
 from uds.data import M2MDataV102
 from uds.data import M2MDataVisitor
+from uds.data import _copy_structure
+from uds.data.columnar import ColumnarM2MDataV102
 
 
 class M2MDataBuilder(M2MDataVisitor):
     """M2MDataBuilder build M2MData object with any parameters
     like 'title', 'timezone' and others.
+
+    If :meth:`prepare` is called, M2MData object is created from the prepared template,
+    by copying only dict and list of the template. Setting any parameter clears the template.
     """
 
     def __init__(self):
@@ -26,6 +31,8 @@ class M2MDataBuilder(M2MDataVisitor):
         self._m2m_info = None
         self._m2m_data_schema = None
         self._primary_keys = None
+        self._columnar = False
+        self._template = None
 
     @property
     def title(self):
@@ -40,6 +47,7 @@ class M2MDataBuilder(M2MDataVisitor):
     @title.setter
     def title(self, value):
         self._title = value
+        self._template = None
 
     @property
     def timezone(self):
@@ -54,6 +62,7 @@ class M2MDataBuilder(M2MDataVisitor):
     @timezone.setter
     def timezone(self, value):
         self._timezone = value
+        self._template = None
 
     @property
     def m2m_info(self):
@@ -68,6 +77,7 @@ class M2MDataBuilder(M2MDataVisitor):
     @m2m_info.setter
     def m2m_info(self, value):
         self._m2m_info = value
+        self._template = None
 
     @property
     def m2m_data_schema(self):
@@ -82,6 +92,7 @@ class M2MDataBuilder(M2MDataVisitor):
     @m2m_data_schema.setter
     def m2m_data_schema(self, value):
         self._m2m_data_schema = value
+        self._template = None
 
     @property
     def primary_keys(self):
@@ -96,14 +107,44 @@ class M2MDataBuilder(M2MDataVisitor):
     @primary_keys.setter
     def primary_keys(self, value):
         self._primary_keys = value
+        self._template = None
+
+    @property
+    def columnar(self):
+        """If True, v1.02 M2M Data is created as :class:`~uds.data.columnar.ColumnarM2MDataV102`.
+
+        :getter: Returns this parameter
+        :setter: Sets this parameter
+        :type: :class:`bool`
+        """
+        return self._columnar
+
+    @columnar.setter
+    def columnar(self, value):
+        self._columnar = value
+        self._template = None
+
+    def prepare(self):
+        """Prepare the template of M2MData object with current parameters.
+        Call this again if parameters are modified in place.
+
+        :return: None
+        """
+        self._template = None
+        self._template = self.create_m2m_data()
 
     def create_m2m_data(self):
         """Create M2MData object.
 
         :rtype: :class:`uds.data.M2MData`
         """
+        if self._template is not None:
+            return self._stamp()
+
         if self.m2m_info['formatVersion'] == '1.01':
             m2m_data = M2MDataV101()
+        elif self.m2m_info['formatVersion'] == '1.02' and self.columnar:
+            m2m_data = ColumnarM2MDataV102()
         elif self.m2m_info['formatVersion'] == '1.02':
             m2m_data = M2MDataV102()
         else:
@@ -112,6 +153,24 @@ class M2MDataBuilder(M2MDataVisitor):
         m2m_data = self.process(m2m_data)
         return m2m_data
 
+    def _stamp(self):
+        template = self._template
+        m2m_data = type(template)()
+
+        m2m_dict = {}
+        for part_key, part in template.dict.iteritems():
+            if part_key == 'sensor_info':
+                # Same as visit_v101, schema is shared.
+                m2m_dict[part_key] = {key: value if key == 'schema' else _copy_structure(value)
+                                      for key, value in part.iteritems()}
+            else:
+                m2m_dict[part_key] = _copy_structure(part)
+        m2m_data._dict = m2m_dict
+
+        m2m_data.primary_keys = self.primary_keys
+        m2m_data.info_summary = self.m2m_info
+        return m2m_data
+
     def visit_v101(self, m2m_data):
         """Implementation of abstractmethod --- Initialize v1.01 M2MData.
 
@@ -8,19 +8,67 @@ uds.data.check
 """
 import re
 import datetime
-import dateutil.parser
+import itertools
 import pytz
 
 import uds.logging
 from uds.data import M2MDataVisitor
+from uds.data import M2MDataV101
+from uds.utils.datetime import parse_time
 
 
 class M2MDataChecker(M2MDataVisitor):
     """M2MDataChecker check validity of M2M Data object.
+
+    M2M Data is accepted at once without checking each datum,
+    if all values of time, longitude and latitude are valid as a whole.
+    Each datum is checked only when the M2M Data has invalid values.
     """
 
     def __init__(self):
-        pass
+        self._now_time = None
+
+    def check_list(self, m2m_data_list, drop_invalid=False):
+        """Check list of M2M Data at once. Current time is got once per call.
+
+        If drop_invalid is True, invalid datum are dropped instead of rejecting whole list.
+        The list is modified in place as follows.
+
+        * M2M Data including invalid datum is replaced with the copy which has only valid datum.
+          (The copy has to be committed again.)
+        * M2M Data without valid datum is removed.
+
+        :param list m2m_data_list: list of M2M Data
+        :param bool drop_invalid: If True, drop invalid datum.
+        :return: If the list is valid (or valid datum remains in drop_invalid mode), return True, else return False.
+        :rtype: :class:`bool`
+        """
+        self._now_time = pytz.utc.localize(datetime.datetime.utcnow())
+        try:
+            if not drop_invalid:
+                for m2m_data in m2m_data_list:
+                    if self.process(m2m_data) is False:
+                        return False
+                return True
+
+            checked_list = []
+            drop_count = 0
+            for m2m_data in m2m_data_list:
+                if self._is_all_valid(m2m_data):
+                    checked_list.append(m2m_data)
+                    continue
+
+                valid_m2m_data = self._drop_invalid_datum(m2m_data)
+                drop_count += m2m_data.size - valid_m2m_data.size
+                if valid_m2m_data.size > 0:
+                    checked_list.append(valid_m2m_data)
+
+            if drop_count > 0:
+                uds.logging.warning('[check] Dropped invalid datum. count=%s', drop_count)
+            m2m_data_list[:] = checked_list
+            return len(m2m_data_list) > 0
+        finally:
+            self._now_time = None
 
     def visit_v101(self, m2m_data):
         """Check v1.01 M2M Data.
@@ -29,6 +77,38 @@ class M2MDataChecker(M2MDataVisitor):
         :return: If the target is valid, return true, else return False.
         :rtype: :class:`bool`
         """
+        if self._is_all_valid(m2m_data):
+            return True
+
+        if self._check_device_info(m2m_data) is False:
+            return False
+
+        for datum in m2m_data.iter_data():
+            if self._check_datum_v101(datum, m2m_data.dict['primary']['timezone']) is False:
+                return False
+
+        return True
+
+    def visit_v102(self, m2m_data):
+        """Check v1.02 M2M Data.
+
+        :param M2MDataV102 m2m_data: Check target
+        :return: If the target is valid, return true, else return False.
+        :rtype: :class:`bool`
+        """
+        if self._is_all_valid(m2m_data):
+            return True
+
+        # Check info schema
+        # => nothing to do
+
+        for datum in m2m_data.iter_data():
+            if self._check_datum_v102(datum, m2m_data.dict['primary']['timezone']) is False:
+                return False
+
+        return True
+
+    def _check_device_info(self, m2m_data):
         device_info = m2m_data.device_info
 
         # Check info schema
@@ -43,49 +123,112 @@ class M2MDataChecker(M2MDataVisitor):
         if self._check_geo_point(m2m_data.device_info['longitude'], m2m_data.device_info['latitude']) is False:
             return False
 
-        for datum in m2m_data.data_values:
-            # Check datum schema
-            if 'time' not in datum or datum['time'] is None:
-                uds.logging.error('[check] M2M Data schema is invalid. time is none.')
-                return False
+        return True
 
-            # Check datum values
-            if self._check_time(datum['time'], m2m_data.dict['primary']['timezone']) is False:
-                return False
+    def _check_datum_v101(self, datum, timezone):
+        # Check datum schema
+        if 'time' not in datum or datum['time'] is None:
+            uds.logging.error('[check] M2M Data schema is invalid. time is none.')
+            return False
+
+        # Check datum values
+        if self._check_time(datum['time'], timezone) is False:
+            return False
 
         return True
 
-    def visit_v102(self, m2m_data):
-        """Check v1.02 M2M Data.
+    def _check_datum_v102(self, datum, timezone):
+        # Check datum schema
+        if 'time' not in datum or datum['time'] is None:
+            uds.logging.error('[check] M2M Data schema is invalid. time is none.')
+            return False
+        if 'longitude' not in datum or datum['longitude'] is None:
+            uds.logging.error('[check] M2M Data schema is invalid. longitude is none.')
+            return False
+        if 'latitude' not in datum or datum['latitude'] is None:
+            uds.logging.error('[check] M2M Data schema is invalid. latitude is none.')
+            return False
 
-        :param M2MDataV102 m2m_data: Check target
-        :return: If the target is valid, return true, else return False.
+        # Check datum values
+        if self._check_geo_point(datum['longitude'], datum['latitude']) is False:
+            return False
+
+        if self._check_time(datum['time'], timezone) is False:
+            return False
+
+        return True
+
+    def _drop_invalid_datum(self, m2m_data):
+        valid_m2m_data = m2m_data.copy_without_values()
+        if isinstance(m2m_data, M2MDataV101):
+            if self._check_device_info(m2m_data) is False:
+                return valid_m2m_data
+            check_datum = self._check_datum_v101
+        else:
+            check_datum = self._check_datum_v102
+
+        timezone = m2m_data.dict['primary']['timezone']
+        for datum in m2m_data.iter_data():
+            if check_datum(datum, timezone):
+                valid_m2m_data.append(datum)
+        return valid_m2m_data
+
+    def _is_all_valid(self, m2m_data):
+        """Check whether all datum of M2M Data are valid, without logging.
+        Values are checked per column, and each time string is parsed once.
+
+        :param M2MData m2m_data: Check target
+        :return: If all datum are surely valid, return True.
         :rtype: :class:`bool`
         """
-        # Check info schema
-        # => nothing to do
+        timezone = m2m_data.dict['primary']['timezone']
+        if timezone is None:
+            return False
 
-        for datum in m2m_data.data_values:
-            # Check datum schema
-            if 'time' not in datum or datum['time'] is None:
-                uds.logging.error('[check] M2M Data schema is invalid. time is none.')
-                return False
-            if 'longitude' not in datum or datum['longitude'] is None:
-                uds.logging.error('[check] M2M Data schema is invalid. longitude is none.')
-                return False
-            if 'latitude' not in datum or datum['latitude'] is None:
-                uds.logging.error('[check] M2M Data schema is invalid. latitude is none.')
-                return False
+        try:
+            if isinstance(m2m_data, M2MDataV101):
+                device_info = m2m_data.device_info
+                if device_info.get('longitude') is None or device_info.get('latitude') is None:
+                    return False
+                if not self._is_valid_geo_point(device_info['longitude'], device_info['latitude']):
+                    return False
+                names = ['time']
+            else:
+                names = ['time', 'longitude', 'latitude']
 
-            # Check datum values
-            if self._check_geo_point(datum['longitude'], datum['latitude']) is False:
-                return False
+            columns = {}
+            for name in names:
+                columns[name] = m2m_data.column(name)
+                if None in columns[name]:
+                    return False
 
-            if self._check_time(datum['time'], m2m_data.dict['primary']['timezone']) is False:
-                return False
+            if m2m_data.size == 0:
+                return True
+
+            for time in set(columns['time']):
+                if not self._is_valid_time(time, timezone):
+                    return False
+
+            if 'longitude' in columns:
+                if m2m_data.west < -180 or 180 < m2m_data.east or m2m_data.south < -90 or 90 < m2m_data.north:
+                    return False
+                if 0 in columns['longitude'] and 0 in columns['latitude']:
+                    for longitude, latitude in itertools.izip(columns['longitude'], columns['latitude']):
+                        if longitude == 0 and latitude == 0:
+                            return False
+        except Exception:
+            return False
 
         return True
 
+    @staticmethod
+    def _is_valid_geo_point(longitude, latitude):
+        if longitude < -180 or 180 < longitude or latitude < -90 or 90 < latitude:
+            return False
+        if longitude == 0 and latitude == 0:
+            return False
+        return True
+
     @staticmethod
     def _check_geo_point(longitude, latitude):
         # Check whether longitude and latitude is within validity range.
@@ -97,16 +240,24 @@ class M2MDataChecker(M2MDataVisitor):
             return False
         return True
 
-    @staticmethod
-    def _check_time(time, offset):
+    def _get_now_time(self):
+        if self._now_time is not None:
+            return self._now_time
+        return pytz.utc.localize(datetime.datetime.utcnow())
+
+    def _is_valid_time(self, time, offset):
+        # 10分以上未来の場合、エラーとする
+        return (self._get_now_time() - parse_time(time, offset)) > datetime.timedelta(minutes=-10)
+
+    def _check_time(self, time, offset):
         if offset is None:
             uds.logging.error('[check] timezone is none.')
             return False
 
         # Check whether sensor time is earlier than current time.
         try:
-            sensor_time = dateutil.parser.parse(time+offset)          # sensor time
-            now_time = pytz.utc.localize(datetime.datetime.utcnow())  # current time
+            sensor_time = parse_time(time, offset)                    # sensor time
+            now_time = self._get_now_time()                           # current time
         except Exception as e:
             uds.logging.error(
                 '[check] time or timezone format is invalid. time={0}, timezone={1}, parse_error={2}'.format(
@@ -119,7 +270,3 @@ class M2MDataChecker(M2MDataVisitor):
         else:
             uds.logging.error('[check] Sensing time is out of range.')
             return False
-
-
-
-
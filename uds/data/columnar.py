@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+uds.data.columnar
+~~~~~~~~~~~~~~~~~
+
+Columnar implementation of M2MData for large data part.
+
+:copyright: Copyright (c) 2015, National Institute of Information and Communications Technology.All rights reserved.
+:license: GPL2, see LICENSE for more details.
+"""
+import array
+import collections
+
+from uds.data import M2MDataV102
+from uds.utils import jsoncodec
+from uds.utils.datetime import parse_time
+
+
+class _Missing(object):
+    """Placeholder of a value which datum does not have. (Singleton even if copied or pickled)
+    """
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return '_MISSING'
+
+
+_MISSING = _Missing()
+
+#: Number of datum serialized at once.
+_DUMPS_CHUNK_SIZE = 1000
+
+
+class ColumnarM2MDataV102(M2MDataV102):
+    """Implementation of M2MData class as M2M Data Format v1.02, which keeps datum as columns.
+
+    * Each value name has one column. Columns are ordered by data schema.
+    * float or int column is kept as :class:`array.array`,
+      and demoted to :class:`list` when other type of value or missing value is appended.
+    * Bounds, checks and filters use columns directly.
+    * When :attr:`data_values` is accessed, datum are materialized as list of dict,
+      and then this object works as same as :class:`~uds.data.M2MDataV102`.
+
+    Until datum are materialized, ``dict['data']['values']`` is empty. Use :attr:`data_values` instead.
+    """
+
+    def __init__(self):
+        super(ColumnarM2MDataV102, self).__init__()
+        self._columns = collections.OrderedDict()
+        self._size = 0
+        self._is_columnar = True
+
+    def __getitem__(self, i):
+        if not self._is_columnar:
+            return super(ColumnarM2MDataV102, self).__getitem__(i)
+        if isinstance(i, slice):
+            return [self._get_datum(j) for j in xrange(*i.indices(self._size))]
+        if i < 0:
+            i += self._size
+        if i < 0 or self._size <= i:
+            raise IndexError('datum index out of range')
+        return self._get_datum(i)
+
+    @property
+    def is_columnar(self):
+        """Overridden property.
+        """
+        return self._is_columnar
+
+    @property
+    def data_values(self):
+        """Overridden property --- Datum are materialized at first access.
+        """
+        if self._is_columnar:
+            self._dict['data']['values'] = [self._get_datum(i) for i in xrange(self._size)]
+            self._is_columnar = False
+            self._columns = None
+        return self._dict['data']['values']
+
+    @property
+    def size(self):
+        """Overridden property.
+        """
+        if self._is_columnar:
+            return self._size
+        return super(ColumnarM2MDataV102, self).size
+
+    def column(self, name):
+        """Overridden method.
+        """
+        if not self._is_columnar:
+            return super(ColumnarM2MDataV102, self).column(name)
+        if name not in self._columns:
+            return [None] * self._size
+
+        column = self._columns[name]
+        if isinstance(column, list) and _MISSING in column:
+            return [None if value is _MISSING else value for value in column]
+        return column
+
+    def iter_data(self):
+        """Overridden method --- Datum are created one by one without materializing.
+        """
+        if not self._is_columnar:
+            return super(ColumnarM2MDataV102, self).iter_data()
+        return (self._get_datum(i) for i in xrange(self._size))
+
+    def append(self, datum):
+        """Overridden method.
+        """
+        if not self._is_columnar:
+            return super(ColumnarM2MDataV102, self).append(datum)
+
+        self._add_columns(datum)
+        for name, column in self._columns.iteritems():
+            value = datum.get(name, _MISSING)
+            if isinstance(column, list):
+                column.append(value)
+            elif self._is_typed_value(column.typecode, value):
+                column.append(value)
+            else:
+                # Demote to list
+                column = list(column)
+                column.append(value)
+                self._columns[name] = column
+        self._size += 1
+
+        self._bounds = None
+        self.mark_dirty('data')
+
+    def extend(self, data):
+        """Overridden method.
+        """
+        if not self._is_columnar:
+            return super(ColumnarM2MDataV102, self).extend(data)
+
+        for datum in data:
+            self.append(datum)
+
+    def dumps_values(self):
+        """Overridden method --- Datum are serialized by chunk without materializing.
+        """
+        if not self._is_columnar:
+            return super(ColumnarM2MDataV102, self).dumps_values()
+
+        chunks = []
+        for start in xrange(0, self._size, _DUMPS_CHUNK_SIZE):
+            end = min(start + _DUMPS_CHUNK_SIZE, self._size)
+            chunks.append(jsoncodec.dumps([self._get_datum(i) for i in xrange(start, end)])[1:-1])
+        return '[' + ', '.join(chunks) + ']'
+
+    def copy_without_values(self):
+        """Overridden method.
+        """
+        clone = super(ColumnarM2MDataV102, self).copy_without_values()
+        clone._columns = collections.OrderedDict()
+        clone._size = 0
+        clone._is_columnar = True
+        return clone
+
+    def _get_datum(self, i):
+        datum = {}
+        for name, column in self._columns.iteritems():
+            value = column[i]
+            if value is not _MISSING:
+                datum[name] = value
+        return datum
+
+    def _add_columns(self, datum):
+        new_names = [name for name in datum if name not in self._columns]
+        if len(new_names) == 0:
+            return
+
+        # Order by data schema
+        schema_names = [value_schema['name'] for value_schema in self.data_schema]
+        new_names.sort(key=lambda name: schema_names.index(name) if name in schema_names else len(schema_names))
+
+        for name in new_names:
+            value = datum[name]
+            if self._size == 0 and type(value) is float:
+                self._columns[name] = array.array('d')
+            elif self._size == 0 and type(value) is int:
+                self._columns[name] = array.array('l')
+            else:
+                self._columns[name] = [_MISSING] * self._size
+
+    @staticmethod
+    def _is_typed_value(typecode, value):
+        if typecode == 'd':
+            return type(value) is float
+        else:
+            return type(value) is int
+
+    def _get_bounds_key(self):
+        """Overridden method.
+        """
+        if not self._is_columnar:
+            return super(ColumnarM2MDataV102, self)._get_bounds_key()
+        return id(self._columns), self._size, self._dict['primary']['timezone']
+
+    def _calculate_bounds(self):
+        """Overridden method --- Bounds are calculated per column.
+        """
+        if not self._is_columnar:
+            return super(ColumnarM2MDataV102, self)._calculate_bounds()
+
+        min_time = max_time = south = north = west = east = None
+
+        times = self._get_present_values('time')
+        if len(times) > 0:
+            timezone = self._dict['primary']['timezone']
+            parsed_times = [parse_time(time, timezone) for time in set(times)]
+            min_time = min(parsed_times)
+            max_time = max(parsed_times)
+
+        latitudes = self._get_present_values('latitude')
+        if len(latitudes) > 0:
+            south = min(latitudes)
+            north = max(latitudes)
+
+        longitudes = self._get_present_values('longitude')
+        if len(longitudes) > 0:
+            west = min(longitudes)
+            east = max(longitudes)
+
+        return min_time, max_time, south, north, west, east
+
+    def _get_present_values(self, name):
+        if name not in self._columns:
+            return []
+
+        column = self._columns[name]
+        if isinstance(column, list) and _MISSING in column:
+            return [value for value in column if value is not _MISSING]
+        return column
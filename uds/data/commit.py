@@ -8,7 +8,6 @@ uds.data.commit
 """
 import re
 import copy
-import json
 import hashlib
 import dateutil.parser
 import datetime
@@ -16,15 +15,22 @@ import uds.utils.datetime
 
 from uds.utils.datetime import normalize_timezone
 from uds.data import M2MDataVisitor
+from uds.data import _copy_structure
 
 
 class M2MDataCommitter(M2MDataVisitor):
     """M2MDataCommitter process the M2MData object, then set 'data_id', 'data_size' and other.
 
+    Values of data part are serialized to JSON only once per M2MData,
+    and the serialized data part is kept on the committed object for later JSON access.
+
+    :param bool in_place: If True, commit the target object itself instead of the deep copy of it.
+        Use this if the target before commit is not needed.
+        Committed JSON is the same as the deep copy, but deprecated 'timeOffset' is kept on the target.
     """
 
-    def __init__(self):
-        pass
+    def __init__(self, in_place=False):
+        self._in_place = in_place
 
     def visit_v101(self, m2m_data):
         """Commit v1.01 M2M Data.
@@ -33,31 +39,48 @@ class M2MDataCommitter(M2MDataVisitor):
         :return: Committed M2M Data
         :rtype: :class:`uds.data.M2MDataV101`
         """
-        # Calculate data_id
-        committed = copy.deepcopy(m2m_data)
-        date_time_now = datetime.datetime.now()
-        data_id = m2m_data.dict['primary']['title'] + date_time_now.strftime('%Y%m%d%H%M%S') + "%06d" % date_time_now.microsecond
-
         # Normalize time offset.
         if 'timeOffset' in m2m_data.device_info:
             # For deprecated spec.
-            m2m_data.dict['primary']['timezone'] = normalize_timezone(m2m_data.device_info.pop('timeOffset'))
+            timezone = normalize_timezone(m2m_data.device_info['timeOffset'])
+        else:
+            timezone = normalize_timezone(m2m_data.dict['primary']['timezone'])
+
+        if self._in_place:
+            # Rebuild dict and list without copying values, in the same key order as the deep copy.
+            committed = m2m_data
+            committed._dict = _copy_structure(m2m_data.dict)
         else:
-            m2m_data.dict['primary']['timezone'] = normalize_timezone(m2m_data.dict['primary']['timezone'])
+            committed = copy.deepcopy(m2m_data)
+
+            # Normalized time offset is set to the target, not to the committed copy.
+            m2m_data.device_info.pop('timeOffset', None)
+            m2m_data.dict['primary']['timezone'] = timezone
+            m2m_data.mark_dirty('primary', 'sensor_info')
+
+        # Calculate data_id
+        date_time_now = datetime.datetime.now()
+        data_id = m2m_data.dict['primary']['title'] + date_time_now.strftime('%Y%m%d%H%M%S') + "%06d" % date_time_now.microsecond
+
+        # Serialize values once, which are shared by data_size and data_hash.
+        values_json = committed.dumps_values()
+        data_size = len('{"data": ' + committed.dumps_data_part(values_json) + '}')
 
         # Commit data part.
         committed.dict['data']['data_id'] = data_id
 
         # Commit primary part.
-        committed.dict['primary']['provenance']['create_by']['time'] = uds.utils.datetime.get_now_time(m2m_data.dict['primary']['timezone'])
+        committed.dict['primary']['provenance']['create_by']['time'] = uds.utils.datetime.get_now_time(timezone)
         committed.dict['primary']["id"] = "http://m2m.nict.go.jp/m2m_data/?id=" + data_id
 
         # Commit sensor_info part.
-        committed.dict['sensor_info']['data_size'] = len(m2m_data.data_json)
-        json_data = json.dumps(committed.dict['data'])
+        committed.dict['sensor_info']['data_size'] = data_size
+        json_data = committed.dumps_data_part(values_json)
         committed.dict['sensor_info']['data_hash'] = hashlib.md5(json_data).hexdigest()
         committed.dict['sensor_info']['data_link']['uri'] = 'next_data'
         committed.dict['sensor_info']['data_link']['data_id'] = data_id
+        committed.mark_dirty()
+        committed.cache_part_json('data', json_data)
 
         return committed
 
@@ -6,21 +6,30 @@ uds.filters
 :copyright: Copyright (c) 2015, National Institute of Information and Communications Technology.All rights reserved.
 :license: GPL2, see LICENSE for more details.
 """
-import dateutil.parser
-import copy
+import os
+import time
+import json
+import collections
 from abc import ABCMeta, abstractmethod
 
 import uds.logging
 import uds.io
+from uds.utils.cache import BoundedSet
+from uds.utils.datetime import parse_time
+from uds.utils.file import write_atomic
 
 
-def get_filter(filter_type, store_type, store_params, sensor_name, start_time):
+def get_filter(filter_type, store_type, store_params, sensor_name, start_time,
+               filter_params=None, cache_dir_path=None):
     if filter_type.lower() == 'no_filter':
         flt = NullFilter()
         return flt
 
     if filter_type.lower() == 'limited_buffer_filter':
-        flt = LimitedBufferedFilter()
+        if filter_params is not None:
+            flt = LimitedBufferedFilter(filter_params['limited_buffer_filter']['buffer_size'])
+        else:
+            flt = LimitedBufferedFilter()
         return flt
 
     if filter_type.lower() == 'time_order_filter':
@@ -28,7 +37,16 @@ def get_filter(filter_type, store_type, store_params, sensor_name, start_time):
         client.connect()
         dao = uds.io.get_dao(store_type, store_params, sensor_name, start_time, client)
         finder = LastDataFinder(dao)
-        filter_obj = TimeOrderFilter(finder)
+
+        params = filter_params['time_order_filter'] if filter_params is not None else {}
+        if params.get('cache_enabled', False) and cache_dir_path is not None:
+            filter_obj = TimeOrderFilter(
+                finder,
+                cache_file_path=os.path.join(cache_dir_path, 'time_order_filter', sensor_name + '.json'),
+                cache_max_age=params['cache_max_age'],
+                cache_save_interval=params['cache_save_interval'])
+        else:
+            filter_obj = TimeOrderFilter(finder)
         return filter_obj
 
     raise AssertionError()
@@ -67,24 +85,39 @@ class TimeOrderFilter(Filter):
     * If new data has not latest time, delete the date.
     * Last data is kept for each primary keys except 'time'.
     * Last data is found from store by LastDataFinder.
+    * If cache_file_path is given, buffer of last data is saved to the file periodically and on close,
+      and loaded on open. Entries not confirmed within cache_max_age seconds are found from store again.
     """
     
-    def __init__(self, finder):
+    def __init__(self, finder, cache_file_path=None, cache_max_age=3600, cache_save_interval=60):
         super(TimeOrderFilter, self).__init__()
         self._finder = finder
+        self._cache_file_path = cache_file_path
+        self._cache_max_age = cache_max_age
+        self._cache_save_interval = cache_save_interval
+        self._cache_saved_time = None
 
         # Buffer of last data
         self._last_data = {}
 
+        # Confirmed time (epoch seconds) of each last data
+        self._confirmed_times = {}
+
     def open(self):
-        pass
+        if self._cache_file_path is not None:
+            self._load_cache()
+            self._cache_saved_time = time.time()
 
     def close(self):
-        pass
+        if self._cache_file_path is not None:
+            self._save_cache()
 
     def filter(self, m2m_data_list):
         """Implementation of super class's method.
         """
+        # Find last data of all unknown keys at once.
+        self._find_missing_last_data(m2m_data_list)
+
         filtered_m2m_data_list = []
 
         for m2m_data in m2m_data_list:
@@ -106,8 +139,80 @@ class TimeOrderFilter(Filter):
             before_data_count, after_data_count, len(self._last_data)
         )
 
+        # Save buffer of last data periodically.
+        if self._cache_file_path is not None and time.time() - self._cache_saved_time >= self._cache_save_interval:
+            self._save_cache()
+            self._cache_saved_time = time.time()
+
         return filtered_m2m_data_list
+
+    def _load_cache(self):
+        """Load buffer of last data from cache file.
+        Entries older than cache_max_age are ignored.
+
+        :return: None
+        """
+        if not os.path.exists(self._cache_file_path):
+            return
+
+        try:
+            with open(self._cache_file_path, 'r') as fp:
+                entries = json.load(fp)['entries']
+        except Exception as e:
+            uds.logging.warning('[filter] Failed to load cache of last data. path=%s, e=%s', self._cache_file_path, e)
+            return
+
+        now = time.time()
+        for key, str_time, confirmed_time in entries:
+            if now - confirmed_time > self._cache_max_age:
+                continue
+            key = tuple(key)
+            self._last_data[key] = parse_time(str_time) if str_time is not None else None
+            self._confirmed_times[key] = confirmed_time
+
+        uds.logging.info('[filter] Loaded cache of last data. path=%s, entry_count=%s/%s',
+                         self._cache_file_path, len(self._last_data), len(entries))
+
+    def _save_cache(self):
+        """Save buffer of last data to cache file.
+
+        :return: None
+        """
+        entries = []
+        for key, last_time in self._last_data.items():
+            str_time = last_time.isoformat() if last_time is not None else None
+            entries.append([list(key), str_time, self._confirmed_times[key]])
+
+        try:
+            write_atomic(self._cache_file_path, json.dumps({'entries': entries}, separators=(',', ':')))
+        except Exception as e:
+            uds.logging.warning('[filter] Failed to save cache of last data. path=%s, e=%s', self._cache_file_path, e)
     
+    def _find_missing_last_data(self, m2m_data_list):
+        """Find last data of keys not in buffer by LastDataFinder at once, and save to buffer.
+
+        :param m2m_data_list: List of M2M Data.
+        :return: None
+        """
+        missing = collections.OrderedDict()
+        for m2m_data in m2m_data_list:
+            for datum in m2m_data.iter_data():
+                pk_values = m2m_data.get_pk_values(datum)
+                key = self._to_buffer_key(pk_values)
+                if key not in self._last_data and key not in missing:
+                    missing[key] = self._to_key_values(pk_values)
+
+        if len(missing) == 0:
+            return
+
+        str_times = self._finder.find_many(missing.values())
+        now = time.time()
+        for key, str_time in zip(missing.keys(), str_times):
+            self._last_data[key] = parse_time(str_time) if str_time is not None else None
+            self._confirmed_times[key] = now
+
+        uds.logging.info('[filter] Found last data. key_count=%s', len(missing))
+
     def _filter_one(self, m2m_data):
         """
 
@@ -118,14 +223,13 @@ class TimeOrderFilter(Filter):
         assert 'time' in m2m_data.primary_keys, "Primary keys must include 'time'."
         
         # Prepare result list
-        filtered_m2m_data = copy.deepcopy(m2m_data)
-        del filtered_m2m_data.data_values[:]
+        filtered_m2m_data = m2m_data.copy_without_values()
 
         # Create sorted data order by time
         sorted_tuples = self._to_time_sorted_datum_tuples(m2m_data)
 
         for tp in sorted_tuples:
-            datum = tp[1]
+            datum = m2m_data[tp[1]]
             pk_values = m2m_data.get_pk_values(datum)
             key = self._to_buffer_key(pk_values)
             key_values = self._to_key_values(pk_values)
@@ -135,7 +239,8 @@ class TimeOrderFilter(Filter):
                 str_time = self._finder.find(key_values)
                 assert str_time is not False
 
-                self._last_data[key] = dateutil.parser.parse(str_time) if str_time is not None else None
+                self._last_data[key] = parse_time(str_time) if str_time is not None else None
+                self._confirmed_times[key] = time.time()
                 uds.logging.debug(
                     "[filter] Found last data. location=" + str(key) + ", time=" + str(self._last_data[key]))
             else:
@@ -150,6 +255,7 @@ class TimeOrderFilter(Filter):
                 
                 # Update buffer
                 self._last_data[key] = sensing_time
+                self._confirmed_times[key] = time.time()
             else:
                 # print "[Delete Overlap Data]     location=" + str(key) + ", time=" + str(sensorTime)
                 pass
@@ -158,19 +264,17 @@ class TimeOrderFilter(Filter):
 
     @staticmethod
     def _to_time_sorted_datum_tuples(m2m_data):
-        tuples = []
-        for datum in m2m_data.data_values:
-            # Override time_offset in spatial(legacy) case
-            if 'timeOffset' in m2m_data.device_info and m2m_data.device_info['timeOffset'] is not None:
-                time_offset = m2m_data.device_info['timeOffset']
-            else:
-                time_offset = m2m_data.dict['primary']['timezone']
-
-            # Calculate datetime with time offset
-            sensing_time = dateutil.parser.parse(datum['time'] + time_offset)
+        # Override time_offset in spatial(legacy) case
+        if 'timeOffset' in m2m_data.device_info and m2m_data.device_info['timeOffset'] is not None:
+            time_offset = m2m_data.device_info['timeOffset']
+        else:
+            time_offset = m2m_data.dict['primary']['timezone']
 
-            tp = (sensing_time, datum)
-            tuples.append(tp)
+        # Calculate datetime with time offset, and pair with index of datum
+        tuples = []
+        for i, time in enumerate(m2m_data.column('time')):
+            sensing_time = parse_time(time, time_offset)
+            tuples.append((sensing_time, i))
 
         # Sort order by time
         tuples.sort()
@@ -201,10 +305,10 @@ class LimitedBufferedFilter(Filter):
     * Limited number of last data is kept in buffer.
     """
 
-    def __init__(self):
+    def __init__(self, buffer_size=1000):
         super(LimitedBufferedFilter, self).__init__()
-        self._buffer_size = 1000
-        self._buffer_keys = []
+        self._buffer_size = buffer_size
+        self._buffer_keys = BoundedSet(buffer_size)
 
     def filter(self, m2m_data_list):
         """Implementation of super class's method.
@@ -240,10 +344,9 @@ class LimitedBufferedFilter(Filter):
         :rtype: M2MData
         """
         # Prepare result list
-        filtered_m2m_data = copy.deepcopy(m2m_data)
-        del filtered_m2m_data.data_values[:]
+        filtered_m2m_data = m2m_data.copy_without_values()
 
-        for datum in m2m_data.data_values:
+        for datum in m2m_data.iter_data():
             buffer_key = self._to_buffer_key(m2m_data.get_pk_values(datum))
             if self._is_overlap(buffer_key) is False:
                 filtered_m2m_data.append(datum)
@@ -254,13 +357,7 @@ class LimitedBufferedFilter(Filter):
         return filtered_m2m_data
 
     def _is_overlap(self, buffer_key):
-        if buffer_key in self._buffer_keys:
-            return True
-        else:
-            if len(self._buffer_keys) >= self._buffer_size:
-                self._buffer_keys.pop(0)
-            self._buffer_keys.append(buffer_key)
-            return False
+        return not self._buffer_keys.add(buffer_key)
 
     @staticmethod
     def _to_buffer_key(pk_values):
@@ -284,8 +381,17 @@ class NullFilter(Filter):
 
 class LastDataFinder(object):
     """LastDataFinder find last data to access destination for storing M2M Data.
+
+    When access fails, the connection is reconnected and access is retried
+    after interval doubled from min_retry_interval up to max_retry_interval.
     """
-    
+
+    #: Interval in seconds before the first retry.
+    min_retry_interval = 0.5
+
+    #: Max interval in seconds between retries.
+    max_retry_interval = 30.0
+
     def __init__(self, dao):
         self._dao = dao
 
@@ -295,12 +401,56 @@ class LastDataFinder(object):
         :param key_data:
         :return:
         """
+        interval = self.min_retry_interval
         while True:
             last_datetime = self._find_onetime(key_data)
             if last_datetime is not False:
                 return last_datetime
 
-            uds.logging.error('[filter] Failed to find last data. Retry to find...')
+            interval = self._wait_retry(interval)
+
+    def find_many(self, key_values_list):
+        """Find last data for each key values by a few accesses.
+
+        :param list key_values_list: list of key values
+        :return: list of last time in the same order as key_values_list.
+        """
+        interval = self.min_retry_interval
+        while True:
+            last_datetimes = self._find_many_onetime(key_values_list)
+            if last_datetimes is not False:
+                return last_datetimes
+
+            interval = self._wait_retry(interval)
+
+    def _wait_retry(self, interval):
+        """Reconnect and wait before retry.
+
+        :param float interval: Interval to wait
+        :return: Interval before the next retry
+        """
+        uds.logging.error('[filter] Failed to find last data. Retry to find after %s seconds...', interval)
+
+        # Reconnect for next access
+        try:
+            self._dao.reconnect()
+        except Exception as e:
+            uds.logging.error(e)
+
+        time.sleep(interval)
+        return min(interval * 2, self.max_retry_interval)
+
+    def _find_many_onetime(self, key_values_list):
+        """
+        :return: list of last_date
+        """
+        try:
+            str_datetimes = self._dao.select_last_many(key_values_list)
+        except Exception as e:
+            uds.logging.error(e)
+            str_datetimes = False
+
+        return str_datetimes
 
     def _find_onetime(self, key_data):
         """
@@ -310,13 +460,6 @@ class LastDataFinder(object):
             str_datetime = self._dao.select_last(key_data)
         except Exception as e:
             uds.logging.error(e)
-
-            # Reconnect for next access
-            try:
-                self._dao.reconnect()
-            except Exception as e:
-                uds.logging.error(e)
-
             str_datetime = False
         
         return str_datetime
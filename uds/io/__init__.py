@@ -12,6 +12,7 @@ from uds.io.base import IOClient
 from uds.io.base import M2MDataDao
 from uds.io.console import ConsoleDao
 from uds.io.file import FileDao
+from uds.io import mysql
 from uds.io.mysql import MySQLClient
 from uds.io.mysql import MySQLDao
 from uds.io.evwh import EventWarehouseClient
@@ -32,15 +33,13 @@ def get_client(store_type, store_params):
         return NullClient()
 
     if store_type == 'mysql':
-        client = MySQLClient(store_params['mysql']['user'],
-                             store_params['mysql']['password'],
-                             store_params['mysql']['host'],
-                             store_params['mysql']['db'])
-        return client
+        return mysql.create_client(store_params['mysql'])
 
     if store_type == 'evwh':
         client = EventWarehouseClient(store_params['evwh']['host'],
                                       store_params['evwh']['port'])
+        client.timeout = store_params['evwh']['select_timeout']
+        client.max_in_flight = store_params['evwh']['max_in_flight']
         return client
 
     if store_type == 'scn':
@@ -64,7 +63,9 @@ def get_dao(store_type, store_params, sensor_name, start_time, client):
         return FileDao(sensor_name, start_time, store_params['file']['dir_path'], store_params['file']['dir_file_max'])
 
     if store_type == 'mysql':
-        return MySQLDao(client, store_params['mysql']['table_name'])
+        return MySQLDao(client,
+                        store_params['mysql']['table_name'],
+                        store_params['mysql']['insert_batch_size'])
 
     if store_type == 'evwh':
         return EventWarehouseDao(client,
@@ -109,6 +110,14 @@ class NullDao(M2MDataDao):
         """
         return None
 
+    def select_last_many(self, key_values_list):
+        """Do nothing.
+
+        :param key_values_list:
+        :return: list of None.
+        """
+        return [None] * len(key_values_list)
+
     def insert(self, m2m_data):
         """Do nothing.
 
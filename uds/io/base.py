@@ -52,6 +52,23 @@ class M2MDataDao(object):
         """
         pass
 
+    def select_last_many(self, key_values_list):
+        """Select time of last data for each key values.
+        Subclasses can override this to resolve many keys by a few queries.
+        By default, :meth:`select_last` is called for each key values.
+
+        :param list key_values_list: list of key values
+        :return: list of last time in the same order as key_values_list. If failed, returns False.
+        :rtype: list
+        """
+        results = []
+        for key_values in key_values_list:
+            result = self.select_last(key_values)
+            if result is False:
+                return False
+            results.append(result)
+        return results
+
     @abstractmethod
     def insert(self, m2m_data):
         """
@@ -23,6 +23,9 @@ class ConsoleDao(M2MDataDao):
     def select_last(self, key_data):
         return None
 
+    def select_last_many(self, key_values_list):
+        return [None] * len(key_values_list)
+
     def insert(self, m2m_data):
         """
 
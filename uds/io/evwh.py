@@ -10,21 +10,32 @@ import socket
 import struct
 import datetime
 import select
-import json
+import collections
 
 import uds.logging
 from uds.io.base import M2MDataDao
+from uds.utils import jsoncodec
+
+_HEADER = struct.Struct('>II')
+_SEND_SIZE = 64 * 1024
+_RECV_SIZE = 64 * 1024
+_MAX_RECV_SIZE = 4 * 1024 * 1024
 
 
 class EventWarehouseDao(M2MDataDao):
     """
+    If primary keys are not enabled, :meth:`insert_many` packs M2M Data into INSERT queries of
+    up to insert_batch_size rows and insert_batch_bytes bytes.
     """
 
-    def __init__(self, client, table_name, primary_keys_enabled=False):
+    def __init__(self, client, table_name, primary_keys_enabled=False,
+                 insert_batch_size=1, insert_batch_bytes=1024 * 1024):
         self._client = client
         self._table_name = table_name
         self._column = 'observation'
         self._primary_keys_enabled = primary_keys_enabled
+        self._insert_batch_size = insert_batch_size
+        self._insert_batch_bytes = insert_batch_bytes
 
     def reconnect(self):
         self._client.disconnect()
@@ -35,8 +46,27 @@ class EventWarehouseDao(M2MDataDao):
         query = self._create_select_query(key_values)
         str_response = self._client.send(query)
 
-        # Handle response
-        dict_response = json.loads(str_response)
+        return self._handle_select_response(str_response)
+
+    def select_last_many(self, key_values_list):
+        """Overridden method --- Queries are pipelined. (See :meth:`EventWarehouseClient.send_many`)
+        """
+        queries = [self._create_select_query(key_values) for key_values in key_values_list]
+        str_responses = self._client.send_many(queries)
+
+        results = []
+        for str_response in str_responses:
+            result = self._handle_select_response(str_response)
+            if result is False:
+                return False
+            results.append(result)
+        return results
+
+    def _handle_select_response(self, str_response):
+        if str_response is False:
+            return False
+
+        dict_response = jsoncodec.loads(str_response)
         if 'events' in dict_response:
             # Success case
             events = dict_response['events']
@@ -55,8 +85,138 @@ class EventWarehouseDao(M2MDataDao):
         query = self._create_insert_query(m2m_data)
         str_response = self._client.send(query)
 
-        # Handle response
-        dict_response = json.loads(str_response)
+        return self._handle_insert_response(query, str_response)
+
+    def insert_many(self, m2m_data_list):
+        """Insert list of M2M Data. Queries are pipelined. (See :meth:`EventWarehouseClient.send_many`)
+
+        If primary keys are not enabled and insert_batch_size is more than 1, many M2M Data are inserted
+        by a query. When the server returns error for a query of many M2M Data, they are inserted one by one
+        to find the failed ones.
+
+        :param m2m_data_list: list of M2M Data
+        :return: list of results (True if succeeded) in the same order as m2m_data_list
+        :rtype: list of bool
+        """
+        if not self._primary_keys_enabled and self._insert_batch_size > 1:
+            return self._insert_batches(m2m_data_list)
+
+        queries = []
+        for m2m_data in m2m_data_list:
+            try:
+                queries.append(self._create_insert_query(m2m_data))
+            except Exception as e:
+                uds.logging.error('[io.evwh] Failed to create INSERT query. data_id=%s, e=%s', m2m_data.data_id, e)
+                queries.append(None)
+
+        str_responses = self._client.send_many([query for query in queries if query is not None])
+        str_responses = iter(str_responses)
+
+        results = []
+        for query in queries:
+            if query is None:
+                results.append(False)
+            else:
+                results.append(self._handle_insert_response(query, next(str_responses)))
+        return results
+
+    def create_insert_query(self, m2m_data):
+        """Create INSERT query of M2M Data, to be sent later by :meth:`insert_queries`.
+
+        :param m2m_data: M2M Data
+        :return: INSERT query
+        :rtype: str
+        """
+        return self._create_insert_query(m2m_data)
+
+    def insert_queries(self, queries):
+        """Send INSERT queries created by :meth:`create_insert_query`. Queries are pipelined.
+
+        :param list queries: list of INSERT queries
+        :return: list of results in the same order as queries.
+            True if succeeded, None if Event Warehouse returns error, False if failed to send or timed out.
+        :rtype: list
+        """
+        str_responses = self._client.send_many(queries)
+
+        results = []
+        for query, str_response in zip(queries, str_responses):
+            if str_response is False:
+                results.append(False)
+            elif self._handle_insert_response(query, str_response):
+                results.append(True)
+            else:
+                results.append(None)
+        return results
+
+    def _insert_batches(self, m2m_data_list):
+        values_list = []
+        for m2m_data in m2m_data_list:
+            try:
+                values_list.append(self._create_insert_values(m2m_data))
+            except Exception as e:
+                uds.logging.error('[io.evwh] Failed to create INSERT query. data_id=%s, e=%s', m2m_data.data_id, e)
+                values_list.append(None)
+
+        # Pack indexes of M2M Data into batches
+        batches = []
+        batch = []
+        batch_bytes = 0
+        for index, values in enumerate(values_list):
+            if values is None:
+                continue
+            if len(batch) > 0 and (len(batch) >= self._insert_batch_size or
+                                   batch_bytes + len(values) > self._insert_batch_bytes):
+                batches.append(batch)
+                batch = []
+                batch_bytes = 0
+            batch.append(index)
+            batch_bytes += len(values)
+        if len(batch) > 0:
+            batches.append(batch)
+
+        queries = [self._create_batch_insert_query([values_list[index] for index in batch]) for batch in batches]
+        str_responses = self._client.send_many(queries)
+
+        results = [False] * len(m2m_data_list)
+        retry_indexes = []
+        for batch, query, str_response in zip(batches, queries, str_responses):
+            if len(batch) == 1:
+                results[batch[0]] = self._handle_insert_response(query, str_response)
+            elif self._handle_batch_insert_response(query, str_response, len(batch)):
+                for index in batch:
+                    results[index] = True
+            elif str_response is not False:
+                retry_indexes.extend(batch)
+
+        # Insert M2M Data of rejected batches one by one
+        if len(retry_indexes) > 0:
+            uds.logging.warning('[io.evwh] Retry INSERT one by one. count=%s', len(retry_indexes))
+            queries = [self._create_batch_insert_query([values_list[index]]) for index in retry_indexes]
+            str_responses = self._client.send_many(queries)
+            for index, query, str_response in zip(retry_indexes, queries, str_responses):
+                results[index] = self._handle_insert_response(query, str_response)
+
+        return results
+
+    def _handle_batch_insert_response(self, query, str_response, row_count):
+        if str_response is False:
+            return False
+
+        dict_response = jsoncodec.loads(str_response)
+        if 'result' in dict_response and dict_response['result'] is True:
+            uds.logging.info("[io.evwh] Succeed in storing. rows=%s", row_count)
+            return True
+        else:
+            uds.logging.error("[io.evwh] EvWH returns error result for INSERT of %s rows. response=%s",
+                              row_count, _get_limit_string(str_response, 200))
+            return False
+
+    def _handle_insert_response(self, query, str_response):
+        if str_response is False:
+            return False
+
+        dict_response = jsoncodec.loads(str_response)
         if 'result' in dict_response and dict_response['result'] is True:
             # Success case:
             uds.logging.info("[io.evwh] Succeed in storing.")
@@ -136,7 +296,7 @@ class EventWarehouseDao(M2MDataDao):
         :rtype: str
         """
         # Create stmt_values
-        stmt_values = "VALUES( M2M(\"" + m2m_data.json.replace('"', '""').replace("'", "''") + "\"))"
+        stmt_values = "VALUES( " + self._create_insert_values(m2m_data) + ")"
 
         # Get primary keys with datum value
         if not self._primary_keys_enabled:
@@ -173,6 +333,30 @@ class EventWarehouseDao(M2MDataDao):
 
         return result
 
+    def _create_insert_values(self, m2m_data):
+        """Create value of M2M Data in INSERT statement.
+
+        :param m2m_data:
+        :return: M2M("M2M Format Data")
+        :rtype: str
+        """
+        return "M2M(\"" + m2m_data.json.replace('"', '""').replace("'", "''") + "\")"
+
+    def _create_batch_insert_query(self, values_list):
+        """Create INSERT statement of MPQL for many M2M Data without conditions.
+        Query Example::
+
+            INSERT INTO
+                table_name(column_name) VALUES( M2M("M2M Format Data")), ( M2M("M2M Format Data"))
+
+        :param values_list: list of values created by :meth:`_create_insert_values`
+        :return: INSERT statement
+        :rtype: str
+        """
+        stmt_values = "VALUES" + ", ".join("( " + values + ")" for values in values_list)
+        return "INSERT INTO {table}({column}) {stmt_values}".format(
+            table=self._table_name, column=self._column, stmt_values=stmt_values)
+
 
 class EventWarehouseClient(object):
     """
@@ -184,9 +368,14 @@ class EventWarehouseClient(object):
         self._table_hash = {}
 
         self._timeout = 2
+        self._max_in_flight = 16
         self._host = host
         self._port = int(port)
         self._sock = None
+        self._seq = 10000
+
+        # True if the connection must be reopened before next queries
+        self._is_broken = False
 
     @property
     def timeout(self):
@@ -201,6 +390,20 @@ class EventWarehouseClient(object):
     def timeout(self, value):
         self._timeout = value
 
+    @property
+    def max_in_flight(self):
+        """Max number of queries sent without waiting for the responses. Default value is 16.
+
+        :getter: Returns this parameter
+        :setter: Sets this parameter
+        :type: int
+        """
+        return self._max_in_flight
+
+    @max_in_flight.setter
+    def max_in_flight(self, value):
+        self._max_in_flight = value
+
     def connect(self):
         """Connect to Event Warehouse.
 
@@ -209,72 +412,207 @@ class EventWarehouseClient(object):
         try:
             self._sock = socket.socket()
             self._sock.connect((self._host, self._port))
+            self._is_broken = False
         except Exception as e:
             uds.logging.error('[io.evwh] Failed to connect EvWH. error=%s', e)
+            self._is_broken = True
 
     def disconnect(self):
         """ Disconnect.
 
         :return: None.
         """
-        self._sock.close()
+        if self._sock is not None:
+            self._sock.close()
 
     def send(self, query):
         """Send query to Event Warehouse.
 
         :param query: MPQL query.
-        :return: response
+        :return: response. If failed, returns False.
         :rtype: JSON string.
         """
-        seq = 10001
-        self._sock.sendall(data_to_byte(seq, query))
-        container = MessageContainer()
+        return self.send_many([query])[0]
 
-        while True:
-            ready_to_read, ready_to_write, in_error = select.select([self._sock], [], [self._sock], self._timeout)
-            if len(in_error) > 0 and in_error[0] == self._sock:
-                uds.logging.error('[io.evwh] ' + string_now() + ',' + str(seq) + ',error')
-                return False
+    def send_many(self, queries):
+        """Send queries to Event Warehouse on one connection.
+
+        * Up to :attr:`max_in_flight` queries are sent without waiting for the responses.
+        * Each query has a unique sequence number, and responses are matched with queries by it.
+        * If the connection fails or times out, queries without responses fail.
+          Then the connection is closed, because a frame may be sent partially or a response may come late,
+          and it is reopened on the next call.
 
-            elif len(ready_to_read) > 0 and ready_to_read[0] == self._sock:
-                recv = self._sock.recv(1024)
-                if len(recv) > 0:
-                    container.add(recv)
-                    if container.complete():
-                        # Print response for debug
-                        # print(string_now() + ',' + str(container.get_seq()) + ',end')
-                        # print("return = " + str(container.get_json()) + ", query = " + query)
-                        # print(string_now() + ',' + str(container.get_seq()) + ',size,' + str(container.get_size()+8))
-                        break
-                else:
-                    container.clear()
-                    uds.logging.error('[io.evwh] Event Warehouse time out.')
-                    return False
-            elif len(ready_to_write) > 0:
-                continue  # ignore
-
-            elif len(ready_to_write) == 0:
-                container.clear()
+        :param queries: list of MPQL queries.
+        :return: list of responses in the same order as queries. Response of failed query is False.
+        :rtype: list of JSON string.
+        """
+        responses = [False] * len(queries)
+        if self._is_broken:
+            uds.logging.info('[io.evwh] Reconnect to EvWH.')
+            self.disconnect()
+            self.connect()
+            if self._is_broken:
+                return responses
+
+        waiting_indexes = {}
+        try:
+            self._send_many(queries, responses, waiting_indexes)
+        except socket.error as e:
+            uds.logging.error('[io.evwh] Failed to communicate with EvWH. error=%s', e)
+
+        if len(waiting_indexes) > 0:
+            self._sock.close()
+            self._is_broken = True
+        return responses
+
+    def _send_many(self, queries, responses, waiting_indexes):
+        next_index = 0
+
+        out_frames = collections.deque()
+        out_offset = 0
+        reader = FrameReader()
+
+        while next_index < len(queries) or len(waiting_indexes) > 0:
+            # Queue queries up to max_in_flight.
+            while next_index < len(queries) and len(waiting_indexes) < self._max_in_flight:
+                seq = self._next_seq()
+                out_frames.append(data_to_byte(seq, queries[next_index]))
+                waiting_indexes[seq] = next_index
+                next_index += 1
+
+            write_socks = [self._sock] if len(out_frames) > 0 else []
+            ready_to_read, ready_to_write, in_error = select.select(
+                [self._sock], write_socks, [self._sock], self._timeout)
+
+            if len(in_error) > 0:
+                uds.logging.error('[io.evwh] ' + string_now() + ',' + str(sorted(waiting_indexes)) + ',error')
+                break
+
+            if len(ready_to_read) == 0 and len(ready_to_write) == 0:
                 uds.logging.error('[io.evwh] Event Warehouse time out.')
-                return False
+                break
+
+            if len(ready_to_write) > 0:
+                frame = out_frames[0]
+                out_offset += self._sock.send(buffer(frame, out_offset, _SEND_SIZE))
+                if out_offset == len(frame):
+                    out_frames.popleft()
+                    out_offset = 0
+
+            if len(ready_to_read) > 0:
+                if reader.recv_from(self._sock) == 0:
+                    uds.logging.error('[io.evwh] Event Warehouse closed connection.')
+                    break
+
+                # Demultiplex complete responses by sequence number.
+                for seq, response in reader.frames():
+                    index = waiting_indexes.pop(seq, None)
+                    if index is None:
+                        uds.logging.warning('[io.evwh] Response of unknown sequence number is ignored. seq=%s', seq)
+                    else:
+                        responses[index] = response
+
+    def _next_seq(self):
+        self._seq = self._seq % 0xFFFFFFFF + 1
+        return self._seq
+
+
+class FrameReader(object):
+    """Reader of frames (header of size and sequence number, then body) from socket.
+
+    * Received bytes are written into a preallocated buffer by ``recv_into``, without concatenating strings.
+    * Header of each frame is parsed once, and the buffer is grown to hold the whole frame.
+    * Read size is doubled while reads fill it, up to max_read_size.
+
+    :param int read_size: Initial read size
+    :param int max_read_size: Max read size
+    """
+
+    def __init__(self, read_size=_RECV_SIZE, max_read_size=_MAX_RECV_SIZE):
+        self._buffer = bytearray(read_size)
+        self._view = memoryview(self._buffer)
+        self._read_size = read_size
+        self._max_read_size = max_read_size
 
-        return container.get_json()
+        # Range of received bytes not consumed yet
+        self._start = 0
+        self._end = 0
+
+        # (size, seq) of the frame whose header is consumed
+        self._header = None
+
+    def recv_from(self, sock):
+        """Receive bytes from the socket.
+
+        :param sock: Socket
+        :return: Number of received bytes. 0 if the connection is closed.
+        :rtype: int
+        """
+        self._reserve()
+        free_size = len(self._buffer) - self._end
+        size = sock.recv_into(self._view[self._end:], free_size)
+        self._end += size
+
+        if size >= self._read_size and self._read_size < self._max_read_size:
+            self._read_size = min(self._read_size * 2, self._max_read_size)
+        return size
+
+    def frames(self):
+        """Returns complete frames received so far.
+
+        :return: list of tuples of (sequence number, body)
+        :rtype: list of (int, str)
+        """
+        frames = []
+        while True:
+            if self._header is None:
+                if self._end - self._start < _HEADER.size:
+                    break
+                self._header = _HEADER.unpack_from(self._buffer, self._start)
+                self._start += _HEADER.size
+
+            size, seq = self._header
+            if self._end - self._start < size:
+                break
+            frames.append((seq, self._view[self._start:self._start + size].tobytes()))
+            self._start += size
+            self._header = None
+
+        if self._start == self._end:
+            self._start = self._end = 0
+        return frames
+
+    def _reserve(self):
+        # Free space for the next read, or for the rest of the current frame if larger.
+        required_size = self._read_size
+        if self._header is not None:
+            required_size = max(required_size, self._header[0] - (self._end - self._start))
+        if len(self._buffer) - self._end >= required_size:
+            return
+
+        # Move unconsumed bytes to the head, and grow the buffer if still short.
+        length = self._end - self._start
+        if length + required_size <= len(self._buffer):
+            self._buffer[:length] = self._view[self._start:self._end]
+        else:
+            buf = bytearray(max(len(self._buffer) * 2, length + required_size))
+            buf[:length] = self._view[self._start:self._end]
+            self._buffer = buf
+            self._view = memoryview(buf)
+        self._start = 0
+        self._end = length
 
 
 class MessageContainer:
     def __init__(self):
-        self.recv = None
+        self.recv = bytearray()
         self.size = None
         self.seq = None
         self.json = None
 
     def add(self, recv):
-        if self.recv is None:
-            self.recv = recv
-            self.size = len(recv)
-        else:
-            self.recv += recv
-            self.size += len(recv)
+        self.recv.extend(recv)
 
     def get_size(self):
         return self.size
@@ -286,15 +624,16 @@ class MessageContainer:
         return self.json
 
     def clear(self):
-        self.recv = None
+        self.recv = bytearray()
         self.size = None
 
     def complete(self):
-        if len(self.recv) >= 8:
-            self.size, self.seq = struct.Struct('>II').unpack_from(self.recv)
-            if len(self.recv) >= self.size + 8:
-                self.json = str(struct.Struct('>' + str(self.size) + 's').unpack_from(self.recv, 8)[0])
-                return True
+        # Header is parsed once.
+        if self.size is None and len(self.recv) >= _HEADER.size:
+            self.size, self.seq = _HEADER.unpack_from(self.recv)
+        if self.size is not None and len(self.recv) >= self.size + _HEADER.size:
+            self.json = str(self.recv[_HEADER.size:self.size + _HEADER.size])
+            return True
         return False
 
 
@@ -332,7 +671,7 @@ def check_table(client, table_name):
     if table_name is None or table_name == '':
         raise AssertionError()
 
-    table_hash = json.loads(get_tables(client))
+    table_hash = jsoncodec.loads(get_tables(client))
 
     if table_hash.has_key('tables') and table_hash['tables'].has_key(table_name):
         return True
@@ -30,6 +30,9 @@ class FileDao(M2MDataDao):
     def select_last(self, key_data):
         return None
 
+    def select_last_many(self, key_values_list):
+        return [None] * len(key_values_list)
+
     def insert(self, m2m_data):
         """
 
@@ -64,6 +67,7 @@ class FileDao(M2MDataDao):
         # Commit data_link uri of metadata.
         file_name = dir_name + 'M2MData' + m2m_data.dict['sensor_info']['data_link']['data_id'] + '.json'
         m2m_data.dict['sensor_info']['data_link']['uri'] = file_name
+        m2m_data.mark_dirty('sensor_info')
 
         # Write data part
         self._write_data_part(file_name, m2m_data)
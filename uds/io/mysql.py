@@ -6,9 +6,15 @@ uds.is.mysql
 :copyright: Copyright (c) 2015, National Institute of Information and Communications Technology.All rights reserved.
 :license: GPL2, see LICENSE for more details.
 """
+import atexit
+import time
+import threading
+import collections
+import decimal
 import MySQLdb
 
 import uds.logging
+from uds.config import default_config
 from uds.io.base import M2MDataDao
 
 
@@ -16,57 +22,220 @@ class MySQLDao(M2MDataDao):
     """
     """
 
-    def __init__(self, client, table_name):
+    def __init__(self, client, table_name, insert_batch_size=1000):
         super(MySQLDao, self).__init__()
 
         self._client = client
         self._table_name = table_name
+        self._insert_batch_size = insert_batch_size
+        self._select_batch_size = 500
 
     def reconnect(self):
         self._client.disconnect()
         self._client.connect()
 
     def select_last(self, key_data):
-        pass
+        """Select time of last data with key values.
+
+        :param dict key_data: key values
+        :return: last time (ISO 8601 format with timezone) or None. If failed, returns False.
+        """
+        results = self.select_last_many([key_data])
+        if results is False:
+            return False
+        return results[0]
+
+    def select_last_many(self, key_values_list):
+        """Select time of last data for each key values by grouped SELECT statements.
+
+        Query example::
+
+            SELECT t.`longitude`, t.`latitude`, t.`time`, MAX(t.`timezone`) FROM RainSensor t
+            JOIN (SELECT `longitude`, `latitude`, MAX(`time`) AS `last_time` FROM RainSensor
+                  WHERE (`longitude`, `latitude`) IN ((%s, %s), (%s, %s))
+                  GROUP BY `longitude`, `latitude`) l
+            ON t.`longitude` = l.`longitude` AND t.`latitude` = l.`latitude` AND t.`time` = l.`last_time`
+            GROUP BY t.`longitude`, t.`latitude`, t.`time`
+
+        :param list key_values_list: list of key values
+        :return: list of last time in the same order as key_values_list. If failed, returns False.
+        """
+        results = [None] * len(key_values_list)
+
+        # Group key values by key names
+        index_groups = collections.OrderedDict()
+        for index, key_values in enumerate(key_values_list):
+            index_groups.setdefault(tuple(sorted(key_values.keys())), []).append(index)
+
+        for names, indexes in index_groups.items():
+            if len(names) == 0:
+                # Last data of whole table
+                rows = self._select_last_rows(names, [])
+                if rows is False:
+                    return False
+                for index in indexes:
+                    results[index] = rows.get((), None)
+                continue
+
+            for i in range(0, len(indexes), self._select_batch_size):
+                batch = indexes[i:i + self._select_batch_size]
+                rows = self._select_last_rows(names, [key_values_list[index] for index in batch])
+                if rows is False:
+                    return False
+                for index in batch:
+                    key = tuple(_to_match_key(key_values_list[index][name]) for name in names)
+                    results[index] = rows.get(key, None)
+
+        return results
+
+    def _select_last_rows(self, names, key_values_list):
+        # Last time of each key is selected by sub query, then timezone is taken from the row of the last time.
+        columns = ', '.join('`' + name + '`' for name in names)
+        sub_query = 'SELECT ' + (columns + ', ' if len(names) > 0 else '')
+        sub_query += 'MAX(`time`) AS `last_time` FROM ' + self._table_name
+        args = []
+        if len(names) > 0:
+            placeholders = '(' + ', '.join(['%s'] * len(names)) + ')'
+            sub_query += ' WHERE (' + columns + ') IN (' + ', '.join([placeholders] * len(key_values_list)) + ')'
+            sub_query += ' GROUP BY ' + columns
+            for key_values in key_values_list:
+                args.extend(key_values[name] for name in names)
+
+        group_columns = ', '.join(['t.`' + name + '`' for name in names] + ['t.`time`'])
+        query = 'SELECT ' + group_columns + ', MAX(t.`timezone`) FROM ' + self._table_name + ' t'
+        query += ' JOIN (' + sub_query + ') l ON '
+        query += ' AND '.join(['t.`' + name + '` = l.`' + name + '`' for name in names] + ['t.`time` = l.`last_time`'])
+        query += ' GROUP BY ' + group_columns
+
+        rows = self._client.select(query, args)
+        if rows is False:
+            return False
+
+        result = {}
+        for row in rows:
+            last_time, timezone = row[-2], row[-1]
+            if last_time is None:
+                continue
+            key = tuple(_to_match_key(value) for value in row[:-2])
+            result[key] = last_time.isoformat() + (timezone if timezone is not None else '')
+        return result
 
     def insert(self, m2m_data):
+        """Insert rows of M2M Data. (See :meth:`insert_many`)
+
+        :param m2m_data: M2M Data
+        :return: Number of inserted rows
+        """
+        return self.insert_many([m2m_data])
 
-        columns = []  # Column Names
-        values = []   # Datum Values
+    def insert_many(self, m2m_data_list):
+        """Insert rows of M2M Data list by parameterized multi-row INSERT statements.
 
-        for datum in m2m_data.data_values:
+        * A row is created for each datum.
+        * Rows are grouped by columns, then sent by ``insert_batch_size`` rows per statement.
+        * Commit is executed once per statement.
+        * If a statement fails, its rows are inserted one by one, so that only failed rows are lost.
+          Rows which already exist (duplicate key) are skipped.
+
+        :param m2m_data_list: list of M2M Data
+        :return: Number of inserted rows (Skipped and failed rows are not counted.)
+        """
+        # Group rows by columns (with geometry flags)
+        row_groups = collections.OrderedDict()
+        for m2m_data in m2m_data_list:
+            for row in self._to_rows(m2m_data):
+                columns = tuple((column, _is_geometry(value)) for column, value in row.items())
+                row_groups.setdefault(columns, []).append(tuple(row.values()))
+
+        count = 0
+        for columns, rows in row_groups.items():
+            for i in range(0, len(rows), self._insert_batch_size):
+                batch = rows[i:i + self._insert_batch_size]
+                query = self._create_insert_query(columns, len(batch))
+                args = [value for row in batch for value in row]
+
+                if len(batch) > 1 and self._client.execute(query, args) is not False:
+                    self._client.commit()
+                    count += len(batch)
+                    continue
 
+                if len(batch) > 1:
+                    uds.logging.warning('[io.mysql] Failed to insert %s rows at once. Insert rows one by one.',
+                                        len(batch))
+                count += self._insert_one_by_one(columns, batch)
+
+        return count
+
+    def _insert_one_by_one(self, columns, rows):
+        query = self._create_insert_query(columns, 1)
+
+        count = 0
+        duplicate_count = 0
+        for row in rows:
+            if self._client.execute(query, list(row)) is not False:
+                self._client.commit()
+                count += 1
+            elif _is_duplicate_error(self._client.last_error):
+                duplicate_count += 1
+            else:
+                uds.logging.error('[io.mysql] Failed to insert row. row=%s',
+                                  dict((column, value) for (column, is_geometry), value in zip(columns, row)))
+
+        if duplicate_count > 0:
+            uds.logging.warning('[io.mysql] Skipped rows which already exist. count=%s', duplicate_count)
+        return count
+
+    def _to_rows(self, m2m_data):
+        # Values shared by all datum
+        common = collections.OrderedDict()
+        for key, value in m2m_data.device_info.items():
+            if value is not None:
+                common[key] = value
+
+        for key, value in m2m_data.data_units.items():
+            if key in ['time', 'longitude', 'latitude']:
+                continue
+            if value is not None:
+                common['unit_' + key] = value
+
+        for key, value in m2m_data.info_summary.items():
+            if value is not None:
+                common[key] = value
+
+        rows = []
+        for datum in m2m_data.data_values:
+            row = collections.OrderedDict()
             for key, value in datum.items():
                 if value is not None:
-                    columns.append(key)
-                    values.append(value)
+                    row[key] = _to_column_value(value)
 
-            for key, value in m2m_data.device_info.items():
-                if value is not None:
-                    columns.append(key)
-                    values.append(value)
+            for key, value in common.items():
+                if key not in row:
+                    row[key] = _to_column_value(value)
 
-            for key, value in m2m_data.data_units.items():
-                if key in ['time', 'longitude', 'latitude']:
-                    continue
-                if value is not None:
-                    columns.append('unit_' + key)
-                    values.append(value)
+            if 'timezone' not in row:
+                row['timezone'] = m2m_data.dict['primary']['timezone']
 
-            for key, value in m2m_data.info_summary.items():
-                if value is not None:
-                    columns.append(key)
-                    values.append(value)
+            rows.append(row)
+        return rows
 
-            if 'timezone' in columns:
-                pass
-            else:
-                columns.append('timezone')
-                values.append(m2m_data.dict['primary']['timezone'])
+    def _create_insert_query(self, columns, row_count):
+        """Create multi-row INSERT statement with placeholders.
+
+        Query example::
 
-        self.insert_values(columns, values)
+            INSERT INTO RainSensor(`time`, `rainfall`, `geo_loc`)
+            VALUES (%s, %s, GeomFromText(%s)), (%s, %s, GeomFromText(%s))
 
-        self._client.commit()
+        :param columns: tuple of (column name, geometry flag)
+        :param row_count: Number of rows
+        :return: INSERT statement
+        :rtype: str
+        """
+        names = ', '.join('`' + column + '`' for column, is_geometry in columns)
+        placeholders = ', '.join('GeomFromText(%s)' if is_geometry else '%s' for column, is_geometry in columns)
+        values = ', '.join(['(' + placeholders + ')'] * row_count)
+        return 'INSERT INTO ' + self._table_name + '(' + names + ') VALUES ' + values
 
     def insert_json(self, hash):
         """Insert JSON data.
@@ -223,6 +392,9 @@ class MySQLClient(object):
         self._con = None
         self._cur = None
 
+        #: Exception raised by the last failed statement
+        self.last_error = None
+
     @property
     def db_name(self):
         return self._db
@@ -247,13 +419,19 @@ class MySQLClient(object):
 
         :return: None
         """
+        if self._con is None:
+            return
+
         self._cur.close()
         self._con.close()
+        self._con = None
+        self._cur = None
 
-    def send(self, query):
+    def send(self, query, args=None):
         """Send SQL statement.
 
         :param query: SQL statement
+        :param args: Parameters for placeholders of the statement
         :return: response of execute query
         """
         try:
@@ -264,13 +442,44 @@ class MySQLClient(object):
                 f = open('sql_log_{0}.txt'.format(os.getpid()), 'a')
                 f.write("{0}\n".format(query))
                 f.close()'''
-            self._cur.execute(query)
+            self._cur.execute(query, args)
             res = self._cur.fetchall()
         except Exception, e:
             uds.logging.error('sql:%s,\nmessage:%s', query, e)
+            self._handle_error(e)
             return []
         return res
 
+    def select(self, query, args=None):
+        """Send SELECT statement.
+        Unlike :meth:`send`, failure is distinguished from empty result.
+
+        :param query: SQL statement
+        :param args: Parameters for placeholders of the statement
+        :return: Result rows. If failed, returns False.
+        """
+        try:
+            self._cur.execute(query, args)
+            return self._cur.fetchall()
+        except Exception, e:
+            uds.logging.error('sql:%s,\nmessage:%s', _get_limit_string(query, 200), e)
+            self._handle_error(e)
+            return False
+
+    def execute(self, query, args=None):
+        """Execute parameterized SQL statement without fetching result rows.
+
+        :param query: SQL statement
+        :param args: Parameters for placeholders of the statement
+        :return: Number of affected rows. If failed, returns False.
+        """
+        try:
+            return self._cur.execute(query, args)
+        except Exception, e:
+            uds.logging.error('sql:%s,\nmessage:%s', _get_limit_string(query, 200), e)
+            self._handle_error(e)
+            return False
+
     def commit(self):
         """Commit connection.
 
@@ -281,6 +490,238 @@ class MySQLClient(object):
     def insert_id(self):
         return self._con.insert_id()
 
+    def _handle_error(self, e):
+        self.last_error = e
+
+
+class PooledMySQLClient(MySQLClient):
+    """PooledMySQLClient is a MySQLClient which borrows connections from shared MySQLConnectionPool.
+
+    * :meth:`connect` borrows a connection from the pool instead of opening new one.
+    * :meth:`disconnect` returns the connection to the pool instead of closing it.
+    * The pool is shared by every client with the same user, password, host and db.
+    * Before each statement, the connection is borrowed again if the held one failed before,
+      or if it is idle longer than ``ping_interval`` seconds and lost. So long-lived clients
+      (e.g. held by filters) recover from lost connections.
+    """
+
+    def __init__(self, user, password, host, db, pool_size=default_config.MYSQL_POOL_SIZE,
+                 ping_interval=default_config.MYSQL_PING_INTERVAL):
+        super(PooledMySQLClient, self).__init__(user, password, host, db)
+        self._pool = get_connection_pool(user, password, host, db, pool_size, ping_interval)
+        self._ping_interval = ping_interval
+        self._is_broken = False
+        self._last_used_time = 0
+
+    def connect(self):
+        """Borrow a connection from the pool.
+
+        :return: None
+        """
+        if self._con is not None:
+            return
+
+        self._con = self._pool.acquire()
+        self._cur = self._con.cursor(cursorclass=MySQLdb.cursors.SSCursor)
+        self._is_broken = False
+        self._last_used_time = time.time()
+
+    def disconnect(self):
+        """Return the connection to the pool.
+        If the connection seems to be lost, it is closed instead.
+
+        :return: None
+        """
+        if self._con is None:
+            return
+
+        _close_quietly(self._cur)
+        if self._is_broken:
+            _close_quietly(self._con)
+        else:
+            self._pool.release(self._con)
+
+        self._con = None
+        self._cur = None
+
+    def send(self, query, args=None):
+        self._prepare_connection()
+        return super(PooledMySQLClient, self).send(query, args)
+
+    def select(self, query, args=None):
+        self._prepare_connection()
+        return super(PooledMySQLClient, self).select(query, args)
+
+    def execute(self, query, args=None):
+        self._prepare_connection()
+        return super(PooledMySQLClient, self).execute(query, args)
+
+    def _prepare_connection(self):
+        # Replace the held connection if it failed before, or it is idle too long and lost.
+        if self._con is not None:
+            if self._is_broken:
+                uds.logging.info("Previous MySQL statement failed. Reconnect to MySQL. db_name=%s", self._db)
+                self.disconnect()
+            elif time.time() - self._last_used_time >= self._ping_interval and not _ping(self._con):
+                uds.logging.info("MySQL connection is lost. Reconnect to MySQL. db_name=%s", self._db)
+                self._is_broken = True
+                self.disconnect()
+
+        if self._con is None:
+            self.connect()
+        self._last_used_time = time.time()
+
+    def _handle_error(self, e):
+        super(PooledMySQLClient, self)._handle_error(e)
+
+        # The connection may be lost or in an unknown state, so it is not reused.
+        # (Except duplicate key error, which is expected on inserting rows one by one.)
+        if not _is_duplicate_error(e):
+            self._is_broken = True
+
+
+class MySQLConnectionPool(object):
+    """MySQLConnectionPool keeps warm connections to a MySQL database.
+
+    * Connections are created lazily when no idle connection is available.
+    * At most ``pool_size`` idle connections are kept, and others are closed when released.
+    * Before reuse, connections idle longer than ``ping_interval`` seconds are checked by ``ping``.
+      Lost connections are replaced with new ones.
+    """
+
+    def __init__(self, user, password, host, db, pool_size=default_config.MYSQL_POOL_SIZE,
+                 ping_interval=default_config.MYSQL_PING_INTERVAL):
+        self._user = user
+        self._password = password
+        self._host = host
+        self._db = db
+        self._pool_size = pool_size
+        self._ping_interval = ping_interval
+
+        self._idle = []  # list of (connection, released time)
+        self._lock = threading.Lock()
+        self._is_closed = False
+
+    def acquire(self):
+        """Get a connection from the pool.
+
+        :return: MySQLdb connection
+        """
+        while True:
+            with self._lock:
+                if len(self._idle) == 0:
+                    break
+                con, released_time = self._idle.pop()
+
+            if time.time() - released_time < self._ping_interval or _ping(con):
+                return con
+
+            uds.logging.info("MySQL connection is lost. Reconnect to MySQL. db_name=%s", self._db)
+            _close_quietly(con)
+
+        con = MySQLdb.connect(
+            user=self._user,
+            passwd=self._password,
+            host=self._host,
+            db=self._db,
+            use_unicode=True,
+            charset="utf8")
+        uds.logging.info("Connect to MySQL. db_name=%s", self._db)
+        return con
+
+    def release(self, con):
+        """Return the connection to the pool.
+
+        :param con: MySQLdb connection
+        :return: None
+        """
+        # End the transaction so that next user does not see the old snapshot.
+        try:
+            con.rollback()
+        except Exception:
+            _close_quietly(con)
+            return
+
+        with self._lock:
+            if not self._is_closed and len(self._idle) < self._pool_size:
+                self._idle.append((con, time.time()))
+                return
+
+        _close_quietly(con)
+
+    def close(self):
+        """Close all idle connections.
+        Connections released after this are closed immediately.
+
+        :return: None
+        """
+        with self._lock:
+            self._is_closed = True
+            idle = self._idle
+            self._idle = []
+
+        for con, released_time in idle:
+            _close_quietly(con)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(user, password, host, db, pool_size=default_config.MYSQL_POOL_SIZE,
+                        ping_interval=default_config.MYSQL_PING_INTERVAL):
+    """Get the MySQLConnectionPool shared in the process.
+    The pool is created by the first call with the same user, password, host and db.
+
+    :return: MySQLConnectionPool object
+    """
+    key = (user, password, host, db)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = MySQLConnectionPool(user, password, host, db, pool_size, ping_interval)
+        return _pools[key]
+
+
+def close_connection_pools():
+    """Close all idle connections of shared pools.
+    This is called at process exit, because pools are shared by filters and stores of sensors in the process.
+
+    :return: None
+    """
+    with _pools_lock:
+        pools = _pools.values()
+        _pools.clear()
+
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_connection_pools)
+
+
+def create_client(mysql_params):
+    """Create MySQLClient object from parameters like :attr:`uds.sensors.base.Sensor.store_params` ['mysql'].
+
+    If 'pool_size' is greater than 0, returns PooledMySQLClient.
+    Omitted 'pool_size' and 'ping_interval' are same as :mod:`uds.config.default_config`.
+
+    :param dict mysql_params: Parameters for MySQL connection
+    :return: MySQLClient object
+    """
+    pool_size = mysql_params.get('pool_size', default_config.MYSQL_POOL_SIZE)
+    if pool_size > 0:
+        return PooledMySQLClient(mysql_params['user'],
+                                 mysql_params['password'],
+                                 mysql_params['host'],
+                                 mysql_params['db'],
+                                 pool_size,
+                                 mysql_params.get('ping_interval', default_config.MYSQL_PING_INTERVAL))
+    else:
+        return MySQLClient(mysql_params['user'],
+                           mysql_params['password'],
+                           mysql_params['host'],
+                           mysql_params['db'])
+
 
 def try_create_database(user_name, password, host_name, db_name):
     """Create database if not exist.
@@ -411,4 +852,53 @@ def _type_to_string(data):
     if isinstance(data, int) or isinstance(data, float) or isinstance(data, long) or isinstance(data, complex):
         return 'float'
     else:
-        return 'VARCHAR(200)'
\ No newline at end of file
+        return 'VARCHAR(200)'
+
+
+def _to_column_value(value):
+    if isinstance(value, (int, long, float, basestring)):
+        return value
+    else:
+        return str(value)
+
+
+def _to_match_key(value):
+    # DECIMAL and integer columns are compared as float.
+    if isinstance(value, (int, long, float, decimal.Decimal)):
+        return float(value)
+    else:
+        return value
+
+
+def _is_geometry(value):
+    if isinstance(value, basestring):
+        return value.find("Point") >= 0 or value.find("Polygon") >= 0
+    else:
+        return False
+
+
+def _get_limit_string(value, limit):
+    if len(value) > limit:
+        return value[0:limit] + "..."
+    else:
+        return value
+
+
+def _is_duplicate_error(e):
+    # ER_DUP_ENTRY
+    return e is not None and len(getattr(e, 'args', ())) > 0 and e.args[0] == 1062
+
+
+def _ping(con):
+    try:
+        con.ping()
+        return True
+    except Exception:
+        return False
+
+
+def _close_quietly(obj):
+    try:
+        obj.close()
+    except Exception:
+        pass
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+uds.io.spool
+~~~~~~~~~~~~
+
+Durable queue of records on local files, and a thread to replay them.
+
+:copyright: Copyright (c) 2015, National Institute of Information and Communications Technology.All rights reserved.
+:license: GPL2, see LICENSE for more details.
+"""
+import os
+import re
+import struct
+import threading
+
+import uds.logging
+from uds.utils.file import write_atomic
+
+_LENGTH = struct.Struct('>I')
+_SEGMENT_FILE_PATTERN = re.compile(r'^(\d{10})\.spool$')
+_OFFSET_FILE_NAME = 'offset'
+
+
+class Spool(object):
+    """Durable append-only queue of records (byte strings) on local files.
+
+    *   Records are appended to segment files (``0000000000.spool``, ``0000000001.spool``, ...)
+        with length prefix, and flushed to disk on each :meth:`append`.
+    *   Read position (segment number and offset) is saved to ``offset`` file by :meth:`commit`,
+        and segments before the position are removed.
+    *   Records after the saved position are read again after restart.
+
+    :param str dir_path: Directory of spool files
+    :param int segment_bytes: Size of segment file to start next segment
+    """
+
+    def __init__(self, dir_path, segment_bytes=16 * 1024 * 1024):
+        self._dir_path = dir_path
+        self._segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        self._write_fp = None
+        self._write_segment = 0
+        self._position = (0, 0)
+        self._depth = 0
+
+        if not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+        self._load()
+
+    @property
+    def depth(self):
+        """Number of records not committed yet.
+
+        :getter: Returns this parameter
+        :type: :class:`int`
+        """
+        return self._depth
+
+    def append(self, records):
+        """Append records, and flush them to disk.
+
+        :param list records: list of byte strings
+        :return: None
+        """
+        if len(records) == 0:
+            return
+
+        data = ''.join(_LENGTH.pack(len(record)) + record for record in records)
+        with self._lock:
+            if self._write_fp is None or self._write_fp.tell() >= self._segment_bytes:
+                self._open_next_segment()
+            self._write_fp.write(data)
+            self._write_fp.flush()
+            os.fsync(self._write_fp.fileno())
+            self._depth += len(records)
+
+    def read(self, max_count):
+        """Read records from the committed position. The position is not moved until :meth:`commit`.
+
+        :param int max_count: Max number of records to read
+        :return: tuple of (list of records, list of position after each record)
+        :rtype: tuple
+        """
+        records = []
+        positions = []
+        with self._lock:
+            segment, offset = self._position
+            while len(records) < max_count and segment <= self._write_segment:
+                file_path = self._get_segment_file_path(segment)
+                if os.path.exists(file_path):
+                    with open(file_path, 'rb') as fp:
+                        fp.seek(offset)
+                        while len(records) < max_count:
+                            record = _read_record(fp)
+                            if record is None:
+                                break
+                            records.append(record)
+                            positions.append((segment, fp.tell()))
+                    if len(records) >= max_count:
+                        break
+                segment += 1
+                offset = 0
+        return records, positions
+
+    def commit(self, position, count):
+        """Move the read position after committed records, and save it.
+
+        :param tuple position: Position after the last committed record, returned by :meth:`read`
+        :param int count: Number of committed records
+        :return: None
+        """
+        with self._lock:
+            self._position = position
+            self._depth = max(self._depth - count, 0)
+            self._save_position()
+
+            # Remove read segments
+            for segment in self._list_segments():
+                if segment < position[0]:
+                    os.remove(self._get_segment_file_path(segment))
+
+    def close(self):
+        """Close the segment file to write.
+
+        :return: None
+        """
+        with self._lock:
+            if self._write_fp is not None:
+                self._write_fp.close()
+                self._write_fp = None
+
+    def _load(self):
+        file_path = os.path.join(self._dir_path, _OFFSET_FILE_NAME)
+        if os.path.exists(file_path):
+            with open(file_path) as fp:
+                segment, offset = fp.read().split()
+            self._position = (int(segment), int(offset))
+
+        segments = self._list_segments()
+        if len(segments) > 0:
+            self._write_segment = max(segments[-1], self._position[0])
+        else:
+            self._write_segment = self._position[0]
+
+        # Count records to replay, and drop a record partially written at the end.
+        for segment in segments:
+            if segment < self._position[0]:
+                continue
+            with open(self._get_segment_file_path(segment), 'r+b') as fp:
+                if segment == self._position[0]:
+                    fp.seek(self._position[1])
+                end = fp.tell()
+                while _read_record(fp) is not None:
+                    self._depth += 1
+                    end = fp.tell()
+                fp.truncate(end)
+
+        if self._depth > 0:
+            uds.logging.info('[spool] Loaded spool. path=%s, depth=%s', self._dir_path, self._depth)
+
+    def _save_position(self):
+        file_path = os.path.join(self._dir_path, _OFFSET_FILE_NAME)
+        write_atomic(file_path, '{0} {1}'.format(*self._position), fsync=True)
+
+    def _open_next_segment(self):
+        if self._write_fp is not None:
+            self._write_fp.close()
+            self._write_segment += 1
+        self._write_fp = open(self._get_segment_file_path(self._write_segment), 'ab')
+
+    def _list_segments(self):
+        segments = []
+        for file_name in os.listdir(self._dir_path):
+            match = _SEGMENT_FILE_PATTERN.match(file_name)
+            if match:
+                segments.append(int(match.group(1)))
+        return sorted(segments)
+
+    def _get_segment_file_path(self, segment):
+        return os.path.join(self._dir_path, '{0:010d}.spool'.format(segment))
+
+
+class SpoolReplayer(object):
+    """Thread which replays records of spool.
+
+    Records are read from spool and passed to ``send``, which returns list of results (True if done).
+    Records are committed up to the first failed one, and failed records are retried
+    after interval doubled from min_interval to max_interval.
+
+    :param Spool spool: Spool to replay
+    :param send: Function which receives list of records and returns list of bool
+    :param int batch_size: Max number of records passed to ``send`` at once
+    :param float min_interval: Interval of polling the spool, and retry after the first failure
+    :param float max_interval: Max interval of retry
+    """
+
+    def __init__(self, spool, send, batch_size=100, min_interval=1.0, max_interval=60.0):
+        self._spool = spool
+        self._send = send
+        self._batch_size = batch_size
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start replay thread.
+
+        :return: None
+        """
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='SpoolReplayer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop replay thread, and wait for it. Records not replayed remain in spool.
+
+        :return: None
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        interval = self._min_interval
+        while not self._stop_event.is_set():
+            records, positions = self._spool.read(self._batch_size)
+            if len(records) == 0:
+                self._stop_event.wait(self._min_interval)
+                continue
+
+            try:
+                results = self._send(records)
+            except Exception as e:
+                uds.logging.error('[spool] Unexpected error occurred during replay. e=%s', e)
+                results = [False] * len(records)
+
+            # Commit records before the first failure
+            done_count = 0
+            for result in results:
+                if result is not True:
+                    break
+                done_count += 1
+            if done_count > 0:
+                self._spool.commit(positions[done_count - 1], done_count)
+                uds.logging.info('[spool] Replayed records. count=%s, depth=%s', done_count, self._spool.depth)
+
+            if done_count < len(records):
+                uds.logging.warning('[spool] Failed to replay records. Retry after %s seconds. depth=%s',
+                                    interval, self._spool.depth)
+                self._stop_event.wait(interval)
+                interval = min(interval * 2, self._max_interval)
+            else:
+                interval = self._min_interval
+
+
+def _read_record(fp):
+    header = fp.read(_LENGTH.size)
+    if len(header) < _LENGTH.size:
+        return None
+    length, = _LENGTH.unpack(header)
+    record = fp.read(length)
+    if len(record) < length:
+        return None
+    return record
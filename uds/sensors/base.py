@@ -8,13 +8,20 @@ uds.sensors.base
 """
 
 import os
+import sys
 import datetime
+import signal
+import threading
+import traceback
+import multiprocessing
+import Queue
 from abc import ABCMeta
 from abc import abstractmethod
 
 import uds.logging
 import uds.utils.datetime
 import uds.utils.dict
+import uds.utils.jsoncodec
 from uds.utils.benchmark import get_time_recorder
 from uds.utils.benchmark import TimeRecord
 from uds.utils.benchmark import Timer
@@ -57,10 +64,16 @@ class Sensor():
         self._time_recorder = None
         self._data_builder = None
         self._geocoder = Geocoder(self.cache_dir_path)
-        self._data_committer = M2MDataCommitter()
+        self._data_committer = M2MDataCommitter(in_place=True)
         self._data_checker = M2MDataChecker()
         self._filter = None
         self._store = None
+        self._parse_pool = None
+
+        # TimeRecord of the cycle in fetch/parse stage
+        self._front_time_record = None
+        # TimeRecord of the cycle in filter/store stage
+        self._back_time_record = None
 
         self._abort_requested = False
 
@@ -247,6 +260,32 @@ class Sensor():
     def filter_type(self, value):
         self._config['FILTER_TYPE'] = value
 
+    @property
+    def filter_params(self):
+        """Configuration parameters for each filter.
+
+        *   'time_order_filter':
+
+            *   'cache_enabled' -- enable/disable saving last data of each key to file under
+                :attr:`cache_dir_path`, and loading it at next startup.
+            *   'cache_max_age' -- Cached last data older than this seconds is found from store again.
+            *   'cache_save_interval' -- Second-scale interval of saving cache file.
+
+        *   'limited_buffer_filter':
+
+            *   'buffer_size' -- Max number of primary key values kept to detect overlap data.
+                (Also used for overlap tweet ids in :class:`~uds.sensors.twitter.TwitterSensor`)
+
+        :getter: Returns this parameter
+        :setter: Sets this parameter
+        :type: :class:`dict`
+        """
+        return self._config['FILTER_PARAMS']
+
+    @filter_params.setter
+    def filter_params(self, value):
+        self._config['FILTER_PARAMS'] = uds.utils.dict.override_dict(value, self._config['FILTER_PARAMS'])
+
     @property
     def store_type(self):
         """Type of output location.
@@ -288,6 +327,10 @@ class Sensor():
             *   'host' --
             *   'db' --
             *   'table_name' --
+            *   'insert_batch_size' -- Max number of rows in a single INSERT statement.
+            *   'pool_size' -- Max number of idle connections kept in the connection pool.
+                If 0, connection pool is not used.
+            *   'ping_interval' -- Pooled connections idle longer than this seconds are checked before reuse.
 
         *   'evwh':
 
@@ -300,6 +343,18 @@ class Sensor():
             *   'select_timeout' -- Timeout for EventWarehouse connections in SELECT query.
             *   'primary_keys_enabled' -- In INSERT query, use primary key constraints
                 by use of Event Warehouse's Conditional Insert.
+            *   'max_in_flight' -- Max number of queries sent without waiting for the responses.
+            *   'connections' -- Number of connections to Event Warehouse.
+                M2M Data list is split over the connections and inserted concurrently.
+            *   'insert_batch_size' -- Max number of M2M Data in a single INSERT query.
+                Used only if 'primary_keys_enabled' is False. If 1, M2M Data are inserted one by one.
+            *   'insert_batch_bytes' -- Max bytes of M2M Data in a single INSERT query.
+            *   'spool_enabled' -- If True, M2M Data failed to store is appended to spool,
+                and replayed by a background thread. While the spool is not empty,
+                M2M Data is appended to the spool without waiting for Event Warehouse.
+            *   'spool_dir_path' -- Directory path for spool files.
+            *   'replay_batch_size' -- Max number of M2M Data replayed at once.
+            *   'replay_max_interval' -- Max seconds of interval to retry replay.
 
         *   'scn':
 
@@ -335,6 +390,135 @@ class Sensor():
     def time_record_enabled(self, value):
         self._config['TIME_RECORD_ENABLED'] = value
 
+    @property
+    def pipeline_enabled(self):
+        """enable/disable pipelined execution of crawling cycles.
+
+        If enabled, fetch/parse/check of the next cycle runs concurrently with filter/store of the current cycle.
+
+        * :meth:`before_cycle` is called in the fetch/parse stage.
+        * :meth:`after_cycle` is called in the filter/store stage. (in another thread)
+
+        :getter: Returns this parameter
+        :setter: Sets this parameter
+        :type: :class:`bool`
+        """
+        return self._config['PIPELINE_ENABLED']
+
+    @pipeline_enabled.setter
+    def pipeline_enabled(self, value):
+        self._config['PIPELINE_ENABLED'] = value
+
+    @property
+    def pipeline_params(self):
+        """Configuration parameters for pipelined execution.
+
+        * 'queue_size': Max number of cycles waiting for or executing filter/store stage.
+          When the number is reached, fetch/parse stage waits. (back pressure)
+
+        :getter: Returns this parameter
+        :setter: Sets this parameter
+        :type: :class:`dict`
+        """
+        return self._config['PIPELINE_PARAMS']
+
+    @pipeline_params.setter
+    def pipeline_params(self, value):
+        self._config['PIPELINE_PARAMS'] = uds.utils.dict.override_dict(value, self._config['PIPELINE_PARAMS'])
+
+    @property
+    def parallel_parse_enabled(self):
+        """enable/disable parallel execution of parse step.
+
+        If enabled, fetched source is split into chunks by :meth:`split_source`,
+        and the chunks are parsed by :meth:`parse` on a pool of worker processes.
+        Parsed lists of M2M Data are merged in order of the chunks.
+
+        The sensor must keep the following contract.
+
+        * Worker processes are forked in :meth:`open`.
+          Changes of sensor attributes after that are not seen by :meth:`parse`,
+          and changes made in :meth:`parse` are not seen by the sensor.
+        * Chunks returned by :meth:`split_source` and M2M Data returned by :meth:`parse` must be picklable.
+
+        :getter: Returns this parameter
+        :setter: Sets this parameter
+        :type: :class:`bool`
+        """
+        return self._config['PARALLEL_PARSE_ENABLED']
+
+    @parallel_parse_enabled.setter
+    def parallel_parse_enabled(self, value):
+        self._config['PARALLEL_PARSE_ENABLED'] = value
+
+    @property
+    def parallel_parse_params(self):
+        """Configuration parameters for parallel execution of parse step.
+
+        * 'workers': Number of worker processes. If None, number of CPUs is used.
+        * 'chunk_size': Max size of a chunk split by :meth:`split_source`. (e.g. Number of csv rows)
+
+        :getter: Returns this parameter
+        :setter: Sets this parameter
+        :type: :class:`dict`
+        """
+        return self._config['PARALLEL_PARSE_PARAMS']
+
+    @parallel_parse_params.setter
+    def parallel_parse_params(self, value):
+        self._config['PARALLEL_PARSE_PARAMS'] = uds.utils.dict.override_dict(value, self._config['PARALLEL_PARSE_PARAMS'])
+
+    @property
+    def check_params(self):
+        """Configuration parameters for checking M2M Data.
+
+        * 'drop_invalid': If True, only invalid datum are dropped (and logged),
+          instead of rejecting all M2M Data of the crawling cycle.
+
+        :getter: Returns this parameter
+        :setter: Sets this parameter
+        :type: :class:`dict`
+        """
+        return self._config['CHECK_PARAMS']
+
+    @check_params.setter
+    def check_params(self, value):
+        self._config['CHECK_PARAMS'] = uds.utils.dict.override_dict(value, self._config['CHECK_PARAMS'])
+
+    @property
+    def columnar_enabled(self):
+        """enable/disable columnar M2M Data.
+
+        If enabled, v1.02 M2M Data keeps datum as columns. (See :class:`uds.data.columnar.ColumnarM2MDataV102`)
+        It reduces memory usage of sensors which produce many datum per cycle.
+
+        :getter: Returns this parameter
+        :setter: Sets this parameter
+        :type: :class:`bool`
+        """
+        return self._config['COLUMNAR_ENABLED']
+
+    @columnar_enabled.setter
+    def columnar_enabled(self, value):
+        self._config['COLUMNAR_ENABLED'] = value
+
+    @property
+    def json_codec(self):
+        """JSON codec used to encode/decode M2M Data.
+
+        * 'auto' -- simplejson with C speedups if available, else json.
+        * 'json', 'simplejson' or 'ujson' -- See :func:`uds.utils.jsoncodec.configure`.
+
+        :getter: Returns this parameter
+        :setter: Sets this parameter
+        :type: :class:`str`
+        """
+        return self._config['JSON_CODEC']
+
+    @json_codec.setter
+    def json_codec(self, value):
+        self._config['JSON_CODEC'] = value
+
     @property
     def log_file_enabled(self):
         """enable/disable writing log to file.
@@ -402,6 +586,9 @@ class Sensor():
     def run(self):
         """Run sensor.
 
+        When :attr:`pipeline_enabled` is True, fetch/parse of the next crawling cycle is executed
+        concurrently with filter/store of the current one. (See :attr:`pipeline_params`)
+
         :return: None
         """
 
@@ -415,6 +602,14 @@ class Sensor():
 
         self.open()
 
+        if self.pipeline_enabled:
+            self._run_pipelined()
+        else:
+            self._run_sequential()
+
+        self.close()
+
+    def _run_sequential(self):
         while not self._abort_requested:
             # Begin record time
             time_record = TimeRecord()
@@ -422,63 +617,156 @@ class Sensor():
             timer0 = Timer()
             timer0.start()
 
-            # Before cycle
-            self.before_cycle()
+            m2m_data_list = self._run_front_stage(time_record)
+            if m2m_data_list is None:
+                continue
 
-            # Fetch
-            with Timer() as timer1:
-                source = self.fetch()
-            time_record.fetch_time = timer1.secs
+            self._run_back_stage(m2m_data_list, time_record, timer0)
+
+    def _run_pipelined(self):
+        # Bounded number of cycles handed over to filter/store stage. (back pressure)
+        slots = threading.Semaphore(self.pipeline_params['queue_size'])
+        stage_queue = Queue.Queue()
+        exc_infos = []
+
+        worker = threading.Thread(target=self._back_stage_loop, args=(stage_queue, slots, exc_infos))
+        worker.daemon = True
+        worker.start()
+
+        try:
+            while not self._abort_requested:
+                # Begin record time
+                time_record = TimeRecord()
+                time_record.interval_start_time = datetime.datetime.now()
+                timer0 = Timer()
+                timer0.start()
+
+                m2m_data_list = self._run_front_stage(time_record)
+                if m2m_data_list is None:
+                    continue
+
+                # Wait until filter/store stage accepts the cycle.
+                with Timer() as timer:
+                    slots.acquire()
+                time_record.fetch_wait_time = timer.secs
+
+                stage_queue.put((m2m_data_list, time_record, timer0))
+        finally:
+            # Queued cycles are stored before stopping the stage.
+            stage_queue.put(None)
+            worker.join()
+
+        if len(exc_infos) > 0:
+            exc_type, exc_value, exc_traceback = exc_infos[0]
+            raise exc_type, exc_value, exc_traceback
+
+    def _back_stage_loop(self, stage_queue, slots, exc_infos):
+        while True:
+            with Timer() as timer:
+                item = stage_queue.get()
+            if item is None:
+                break
+
+            m2m_data_list, time_record, timer0 = item
+            time_record.store_wait_time = timer.secs
+
+            try:
+                # After an error, discard the remaining cycles.
+                if len(exc_infos) == 0:
+                    self._run_back_stage(m2m_data_list, time_record, timer0)
+            except Exception as e:
+                uds.logging.critical('[run] Unexpected error occurred in filter/store stage. Abort sensor! e=%s', e)
+                exc_infos.append(sys.exc_info())
+                self.abort()
+            finally:
+                slots.release()
+
+    def _run_front_stage(self, time_record):
+        """Execute fetch, parse, commit and check steps of a single crawling cycle.
+
+        :param time_record: TimeRecord object of the cycle
+        :return: list of M2M Data, or None if the cycle does not go on to filter/store steps.
+        """
+        self._front_time_record = time_record
 
-            if not source:
-                self._time_recorder.write_record(time_record)
-                uds.logging.info('[fetch] Fetch result is none. Continue to next crawling cycle.')
-                continue
+        # Before cycle
+        self.before_cycle()
 
-            # Parse
-            with Timer() as timer2:
-                m2m_data_list = self.parse(source)
-            time_record.parse_time = timer2.secs
+        # Fetch
+        with Timer() as timer1:
+            source = self.fetch()
+        time_record.fetch_time = timer1.secs
 
-            if len(m2m_data_list) == 0:
-                uds.logging.info('[parse] Parse result is none. Continue to next crawling cycle.')
-                continue
+        if not source:
+            self._time_recorder.write_record(time_record)
+            uds.logging.info('[fetch] Fetch result is none. Continue to next crawling cycle.')
+            return None
 
-            # Commit
-            m2m_data_list = self._commit(m2m_data_list)
+        # Parse
+        with Timer() as timer2:
+            m2m_data_list = self._parse(source)
+        time_record.parse_time = timer2.secs
 
-            # Check
-            with Timer() as timer3:
-                check_result = self.check(m2m_data_list)
-            time_record.check_time = timer3.secs
+        if len(m2m_data_list) == 0:
+            uds.logging.info('[parse] Parse result is none. Continue to next crawling cycle.')
+            return None
 
-            if check_result is False:
-                uds.logging.error("[check] Parsed m2m_data_list is invalid. Continue to next crawling cycle.")
-                continue
+        # Commit
+        m2m_data_list = self._commit(m2m_data_list)
 
-            # Filter
-            with Timer() as timer4:
-                m2m_data_list = self.filter(m2m_data_list)
-            time_record.filter_time = timer4.secs
+        # Check
+        with Timer() as timer3:
+            check_result = self.check(m2m_data_list)
+        time_record.check_time = timer3.secs
 
-            if len(m2m_data_list) == 0:
-                uds.logging.info("[filter] Filtered m2m_data_list is none. Continue to next crawling cycle.")
-                continue
+        if check_result is False:
+            uds.logging.error("[check] Parsed m2m_data_list is invalid. Continue to next crawling cycle.")
+            return None
 
-            # Store
-            with Timer() as timer5:
-                self.store(m2m_data_list)
-            time_record.store_time = timer5.secs
+        return m2m_data_list
 
-            # After cycle
-            self.after_cycle()
+    def _run_back_stage(self, m2m_data_list, time_record, timer0):
+        """Execute filter and store steps of a single crawling cycle.
 
-            # End record time
-            timer0.stop()
-            time_record.crawl_time = timer0.secs
-            self._time_recorder.write_record(time_record)
+        :param m2m_data_list: list of M2M Data
+        :param time_record: TimeRecord object of the cycle
+        :param timer0: Timer started at the beginning of the cycle
+        :return: None
+        """
+        self._back_time_record = time_record
 
-        self.close()
+        # Filter
+        with Timer() as timer4:
+            m2m_data_list = self.filter(m2m_data_list)
+        time_record.filter_time = timer4.secs
+
+        if len(m2m_data_list) == 0:
+            uds.logging.info("[filter] Filtered m2m_data_list is none. Continue to next crawling cycle.")
+            self._complete_back_stage()
+            return
+
+        # Store
+        with Timer() as timer5:
+            self.store(m2m_data_list)
+        time_record.store_time = timer5.secs
+        time_record.extra.update(self._store.metrics())
+        self._complete_back_stage()
+
+        # After cycle
+        self.after_cycle()
+
+        # End record time
+        timer0.stop()
+        time_record.crawl_time = timer0.secs
+        self._time_recorder.write_record(time_record)
+
+    def _complete_back_stage(self):
+        """Process after filter and store steps of a crawling cycle are completed without error.
+        Called even if all data are filtered out and nothing is stored.
+
+        :return: None
+        """
+        pass
 
     def abort(self):
         """Abort sensor.
@@ -516,6 +804,9 @@ class Sensor():
         # Setup uds.logging
         uds.logging.configure(self.sensor_name, self.log_dir_path, self.log_file_enabled, self.log_params)
 
+        # Setup JSON codec
+        uds.utils.jsoncodec.configure(self.json_codec)
+
         # Setup time_recorder
         self._time_recorder = get_time_recorder(
             self.time_record_enabled,
@@ -532,10 +823,18 @@ class Sensor():
         self._data_builder.m2m_info = self.m2m_info
         self._data_builder.m2m_data_schema = self.m2m_data_schema
         self._data_builder.primary_keys = self.primary_keys
+        self._data_builder.columnar = self.columnar_enabled
+        self._data_builder.prepare()
+
+        # Setup parse pool (Fork before opening connections of filter and store)
+        if self.parallel_parse_enabled:
+            self._parse_pool = multiprocessing.Pool(
+                self.parallel_parse_params['workers'], _init_parse_worker, (self,))
 
         # Setup filter
         self._filter = uds.filters.get_filter(
-            self.filter_type, self.store_type, self.store_params, self.sensor_name, self.start_time)
+            self.filter_type, self.store_type, self.store_params, self.sensor_name, self.start_time,
+            self.filter_params, self.cache_dir_path)
         self._filter.open()
 
         # Setup store
@@ -553,6 +852,8 @@ class Sensor():
 
             self.store_params['evwh']['error_dir_path'] = self._resolve_path(
                 self.store_params['evwh']['error_dir_path'])
+            self.store_params['evwh']['spool_dir_path'] = self._resolve_path(
+                self.store_params['evwh']['spool_dir_path'])
 
         if 'mysql' in self.store_params:
             if self.store_params['mysql']['table_name'] is None:
@@ -580,6 +881,11 @@ class Sensor():
         self._filter.close()
         self._store.close()
 
+        if self._parse_pool is not None:
+            self._parse_pool.close()
+            self._parse_pool.join()
+            self._parse_pool = None
+
     def before_cycle(self):
         """Process before starting a single crawling cycle.
         :return: None.
@@ -611,6 +917,38 @@ class Sensor():
         """
         pass
 
+    def split_source(self, source):
+        """Split fetched source into chunks, which are parsed in parallel. (See :attr:`parallel_parse_enabled`)
+
+        Each chunk is passed to :meth:`parse` as a source object.
+        By default, source is not split.
+
+        :param source: Fetched source object
+        :return: list of chunks
+        :rtype: :class:`list`
+        """
+        return [source]
+
+    def _parse(self, source):
+        """Parse fetched source, in parallel if enabled.
+
+        :param source: Fetched source object
+        :return: list of M2M Data
+        :rtype: list of :class:`uds.data.M2MData`
+        """
+        if self._parse_pool is None:
+            return self.parse(source)
+
+        chunks = self.split_source(source)
+        if len(chunks) <= 1:
+            return self.parse(source)
+
+        uds.logging.debug('[parse] Parse source in parallel. chunks=%d', len(chunks))
+        m2m_data_list = []
+        for chunk_m2m_data_list in self._parse_pool.map(_parse_chunk, chunks, 1):
+            m2m_data_list.extend(chunk_m2m_data_list)
+        return m2m_data_list
+
     def _commit(self, m2m_data_list):
         """Commit list of M2M Data.
 
@@ -627,14 +965,24 @@ class Sensor():
     def check(self, m2m_data_list):
         """Check M2M Data.
 
+        If 'drop_invalid' of :attr:`check_params` is True, invalid datum are dropped from the list in place,
+        and M2M Data including them are committed again.
+
         :param m2m_data_list: list of M2M Data
         :return: Target M2M Data list is valid or not.
         :rtype: :class:`bool`
         """
-        for m2m_data in m2m_data_list:
-            if self._data_checker.process(m2m_data) is False:
-                return False
-        return True
+        if not self.check_params['drop_invalid']:
+            return self._data_checker.check_list(m2m_data_list)
+
+        checked_list = list(m2m_data_list)
+        result = self._data_checker.check_list(checked_list, drop_invalid=True)
+
+        # Commit again M2M Data replaced by checker.
+        committed_ids = set(id(m2m_data) for m2m_data in m2m_data_list)
+        m2m_data_list[:] = [m2m_data if id(m2m_data) in committed_ids else self._data_committer.process(m2m_data)
+                            for m2m_data in checked_list]
+        return result
 
     def filter(self, m2m_data_list):
         """Delete overlap data in M2M Data list.
@@ -655,6 +1003,27 @@ class Sensor():
         self._store.store(m2m_data_list)
 
 
+#: Sensor forked into parse worker process.
+_worker_sensor = None
+
+
+def _init_parse_worker(sensor):
+    global _worker_sensor
+    _worker_sensor = sensor
+
+    # KeyboardInterrupt is handled by the main process.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _parse_chunk(chunk):
+    try:
+        return _worker_sensor.parse(chunk)
+    except Exception:
+        # Traceback of worker process is not passed to the main process with the exception.
+        uds.logging.error('[parse] Failed to parse chunk in worker process.\n%s', traceback.format_exc())
+        raise
+
+
 def check_params(sensor):
     result = True
 
@@ -7,12 +7,22 @@ uds.sensors.csvfile
 :license: GPL2, see LICENSE for more details.
 """
 import csv
+import codecs
+import itertools
+import re
 from abc import abstractmethod
+from StringIO import StringIO
 
 import uds.logging
+import uds.utils.encoding
 from uds.sensors.base import Sensor
 from uds.utils.crawling import Pacemaker
 
+#: Number of leading bytes to detect encoding of csv file in streaming mode.
+_DETECT_SIZE = 1024 * 1024
+
+_non_ascii_pattern = re.compile(r'[\x80-\xff]')
+
 
 class CSVFileSensor(Sensor):
     """
@@ -23,8 +33,13 @@ class CSVFileSensor(Sensor):
         super(CSVFileSensor, self).__init__(project_home)
         self._interval = 0
         self._file_list = []
+        self._header_row_count = 0
+        self._stream_chunk_size = None
         self._pacemaker = None
         self._current_fp = None
+        self._current_file_path = None
+        self._current_rows = None
+        self._current_header_rows = None
 
     @property
     def interval(self):
@@ -49,17 +64,65 @@ class CSVFileSensor(Sensor):
         """
         return self._file_list
 
+    @property
+    def header_row_count(self):
+        """Number of header rows at the top of csv file.
+
+        When csv rows are split into chunks for parallel parsing, header rows are copied to the top of each chunk.
+        (See :attr:`~uds.sensors.base.Sensor.parallel_parse_enabled`)
+
+        :getter: Returns this parameter
+        :setter: Sets this parameter
+        :type: int
+        """
+        return self._header_row_count
+
+    @header_row_count.setter
+    def header_row_count(self, value):
+        self._header_row_count = value
+
+    @property
+    def stream_chunk_size(self):
+        """Number of csv rows fetched in a single crawling cycle. (Streaming mode)
+
+        If None (default), whole csv file is fetched in a crawling cycle.
+        Else csv file is kept open and read chunk by chunk,
+        so memory usage is bounded regardless of file size.
+        Each chunk goes through parse, commit, check, filter and store steps before the next chunk is read.
+
+        * Header rows are copied to the top of each chunk. (See :attr:`header_row_count`)
+        * :attr:`interval` is waited before opening each file, not before each chunk.
+
+        :getter: Returns this parameter
+        :setter: Sets this parameter
+        :type: int
+        """
+        return self._stream_chunk_size
+
+    @stream_chunk_size.setter
+    def stream_chunk_size(self, value):
+        self._stream_chunk_size = value
+
     def open(self):
         """Override of super class's method.
         """
         super(CSVFileSensor, self).open()
         self._pacemaker = Pacemaker(self.interval)
 
+    def close(self):
+        """Override of super class's method.
+        """
+        super(CSVFileSensor, self).close()
+        self._close_current_file()
+
     def fetch(self):
         """Fetch csv file on the local machine.
 
         :return: CSVFileSource object including csv reader and file path.
         """
+        if self.stream_chunk_size is not None:
+            return self._fetch_chunk()
+
         self._pacemaker.wait()
 
         if len(self._file_list) == 0:
@@ -75,7 +138,7 @@ class CSVFileSensor(Sensor):
         try:
             # Read csv file with 'rb' mode.
             fp = open(file_path, 'rb')
-            rows = _read_csv(fp)
+            rows = _read_csv(fp, file_path)
             fp.close()
         except Exception as e1:
             uds.logging.debug('[fetch] Failed to read csv file. Retry with other conditions')
@@ -84,7 +147,7 @@ class CSVFileSensor(Sensor):
             try:
                 # Read csv file with 'rU' mode.
                 fp = open(file_path, 'rU')
-                rows = _read_csv(fp)
+                rows = _read_csv(fp, file_path)
                 fp.close()
             except Exception as e2:
                 uds.logging.error('[fetch] Failed to read csv file. file_path={0}'.format(file_path))
@@ -97,12 +160,85 @@ class CSVFileSensor(Sensor):
         source.file_path = file_path
         return source
 
+    def _fetch_chunk(self):
+        """Fetch next chunk of csv rows. (Streaming mode)
+
+        :return: CSVFileSource object including csv rows of the chunk and file path.
+        """
+        while True:
+            if self._current_fp is None:
+                self._pacemaker.wait()
+
+                if len(self._file_list) == 0:
+                    uds.logging.info('[fetch] Stop crawl. File list to fetch is empty.')
+                    self.abort()
+                    return False
+
+                file_path = self._file_list.pop(0)
+
+                uds.logging.info('--- fetch start ----------------------------')
+                uds.logging.info('[fetch] Open csv file in streaming mode. file_path=' + file_path)
+
+                try:
+                    self._current_fp = _open_csv(file_path)
+                    self._current_file_path = file_path
+                    self._current_rows = _iter_csv(self._current_fp, file_path)
+                    self._current_header_rows = list(itertools.islice(self._current_rows, self._header_row_count))
+                except Exception:
+                    uds.logging.error('[fetch] Failed to read csv file. file_path={0}'.format(file_path))
+                    self._close_current_file()
+                    raise
+
+            try:
+                rows = list(itertools.islice(self._current_rows, self.stream_chunk_size))
+            except Exception:
+                uds.logging.error('[fetch] Failed to read csv file. file_path={0}'.format(self._current_file_path))
+                self._close_current_file()
+                raise
+
+            if len(rows) > 0:
+                source = CSVFileSource()
+                source.rows = self._current_header_rows + rows
+                source.file_path = self._current_file_path
+                uds.logging.info('[fetch] Read chunk of csv file. row_count=%s', len(rows))
+
+            if len(rows) < self.stream_chunk_size:
+                self._close_current_file()
+
+            if len(rows) > 0:
+                return source
+
+    def _close_current_file(self):
+        if self._current_fp is None:
+            return
+
+        self._current_fp.close()
+        uds.logging.info('[fetch] Close csv file.')
+        self._current_fp = None
+        self._current_file_path = None
+        self._current_rows = None
+        self._current_header_rows = None
+
     def parse(self, source):
         """Override of super class's method.
         """
         m2m_data = self.parse_rows(source.rows, source.file_path)
         return m2m_data
 
+    def split_source(self, source):
+        """Override of super class's method --- csv rows are split into row ranges.
+        """
+        header_rows = source.rows[:self._header_row_count]
+        chunk_size = self.parallel_parse_params['chunk_size']
+
+        chunks = []
+        for start in xrange(self._header_row_count, len(source.rows), chunk_size):
+            chunk = CSVFileSource()
+            chunk.rows = header_rows + source.rows[start:start + chunk_size]
+            chunk.file_path = source.file_path
+            chunks.append(chunk)
+        return chunks
+
     @abstractmethod
     def parse_rows(self, reader, file_path):
         """Parse reading csv rows to list of M2M Data.
@@ -125,14 +261,88 @@ class CSVFileSource(object):
         self.file_path = None
 
 
-def _read_csv(fp):
-    rows = []
-    reader = csv.reader(fp)
-    for index, row in enumerate(reader):
-        # Parse to unicode
-        row = [unicode(col, "Shift_JIS") for col in row]
-        rows.append(row)
-    return rows
+def _read_csv(fp, file_path):
+    # Decode whole file at once. (csv module of python 2 reads only byte string)
+    text = uds.utils.encoding.decode(fp.read(), key=file_path)
+    if not isinstance(text, unicode):
+        raise UnicodeError('Failed to decode csv file.')
+    reader = csv.reader(StringIO(text.encode('utf-8')))
+
+    return list(_to_unicode_rows(reader))
+
+
+def _open_csv(file_path):
+    # Read csv file with 'rb' mode, or 'rU' mode if line endings are CR only.
+    fp = open(file_path, 'rb')
+    head = fp.read(_DETECT_SIZE)
+    if '\r' in head and '\n' not in head:
+        fp.close()
+        return open(file_path, 'rU')
+    fp.seek(0)
+    return fp
+
+
+def _iter_csv(fp, file_path):
+    # Detect encoding from leading lines. (Line feed does not appear in multibyte characters)
+    head = fp.read(_DETECT_SIZE)
+    if not head.endswith('\n'):
+        head += fp.readline()
+
+    # Ascii only lines are decoded by any candidate, so encoding is detected from following lines.
+    encoding = None
+    if _non_ascii_pattern.search(head) is not None:
+        encoding = _detect_encoding(head, file_path)
+
+    # Decode line by line, and read as utf-8. (csv module of python 2 reads only byte string)
+    lines = itertools.chain(StringIO(head), fp)
+    reader = csv.reader(codecs.iterencode(_decode_lines(lines, encoding, file_path), 'utf-8'))
+    return _to_unicode_rows(reader)
+
+
+def _decode_lines(lines, encoding, file_path):
+    for line in lines:
+        if encoding is None:
+            if _non_ascii_pattern.search(line) is None:
+                yield line.decode('ascii')
+                continue
+
+            # Detect encoding from the first line including non-ascii bytes and following lines.
+            detect_lines = [line]
+            detect_size = len(line)
+            for next_line in lines:
+                detect_lines.append(next_line)
+                detect_size += len(next_line)
+                if detect_size >= _DETECT_SIZE:
+                    break
+
+            encoding = _detect_encoding(''.join(detect_lines), file_path)
+            for detect_line in detect_lines:
+                yield detect_line.decode(encoding)
+            continue
+
+        try:
+            yield line.decode(encoding)
+        except UnicodeDecodeError:
+            # Leading lines can be decoded by wrong encoding, so detect again from this line.
+            detected = _detect_encoding(line, file_path)
+            uds.logging.warning('[fetch] Encoding of csv file is detected again. encoding=%s -> %s', encoding, detected)
+            encoding = detected
+            yield line.decode(encoding)
+
+
+def _detect_encoding(data, file_path):
+    encoding = uds.utils.encoding.detect_encoding(data, key=file_path)
+    if encoding is None:
+        raise UnicodeError('Failed to decode csv file.')
+    return encoding
+
+
+def _to_unicode_rows(reader):
+    for row in reader:
+        # Parse to unicode row by row. (csv module rejects NULL byte, so it does not appear in columns)
+        if len(row) > 0:
+            row = unicode('\x00'.join(row), 'utf-8').split(u'\x00')
+        yield row
 
 
 
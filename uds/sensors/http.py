@@ -7,15 +7,28 @@ uds.sensors.http
 :license: GPL2, see LICENSE for more details.
 """
 
+import os
 import datetime
+import hashlib
 import urllib
 import urllib2
+import weakref
 from abc import abstractmethod
+from multiprocessing.pool import ThreadPool
 
 import uds.logging
+import uds.utils.encoding
 from uds.sensors.base import Sensor
+from uds.utils.benchmark import Timer
+from uds.utils.crawling import HttpValidatorCache
+from uds.utils.crawling import KeepAliveHandler
 from uds.utils.crawling import Pacemaker
 
+_USER_AGENT = 'Mozilla/5.0 (Windows NT 6.1; WOW64) ' \
+              'AppleWebKit/537.36 (KHTML, like Gecko) ' \
+              'Chrome/29.0.1547.66 ' \
+              'Safari/'
+
 
 class HttpSensor(Sensor):
     """
@@ -26,7 +39,15 @@ class HttpSensor(Sensor):
         super(HttpSensor, self).__init__(project_home)
 
         self._interval = 0
+        self._max_connections = 8
+        self._conditional_fetch_enabled = False
         self._pacemaker = None
+        self._validator_cache = None
+        # Validators fetched in each cycle, saved after the cycle is completed. (Keyed by TimeRecord of the cycle)
+        self._pending_validators = weakref.WeakKeyDictionary()
+        self._keep_alive_handler = None
+        self._opener = None
+        self._fetch_pool = None
 
     @property
     def interval(self):
@@ -42,87 +63,224 @@ class HttpSensor(Sensor):
     def interval(self, value):
         self._interval = value
 
+    @property
+    def max_connections(self):
+        """Max number of HTTP requests executed concurrently in a single crawling cycle.
+        (See :meth:`create_requests`)
+
+        :getter: Returns this parameter
+        :setter: Sets this parameter
+        :type: int
+        """
+        return self._max_connections
+
+    @max_connections.setter
+    def max_connections(self, value):
+        self._max_connections = value
+
+    @property
+    def conditional_fetch_enabled(self):
+        """enable/disable conditional fetch.
+
+        If enabled, ETag, Last-Modified and hash of content of each URL are saved in :attr:`cache_dir_path`
+        after filter and store steps of the crawling cycle are completed, even if all data are filtered out.
+        Then conditional requests are sent.
+        If the cycle fails before storing, its validators are discarded and the pages are fetched again.
+        Pages which are not modified (status 304 or same hash of content) are not parsed.
+        If no page is modified, the crawling cycle is skipped and recorded as 'cache_hits' in the time record.
+
+        :getter: Returns this parameter
+        :setter: Sets this parameter
+        :type: bool
+        """
+        return self._conditional_fetch_enabled
+
+    @conditional_fetch_enabled.setter
+    def conditional_fetch_enabled(self, value):
+        self._conditional_fetch_enabled = value
+
     def open(self):
         """Override of super class's method.
         """
         super(HttpSensor, self).open()
         self._pacemaker = Pacemaker(self.interval)
 
+        if self.conditional_fetch_enabled:
+            self._validator_cache = HttpValidatorCache(
+                os.path.join(self.cache_dir_path, 'http_cache', self.sensor_name + '.json'))
+            self._validator_cache.load()
+
+        # Opener is reused by all requests, and keeps connections alive.
+        self._keep_alive_handler = KeepAliveHandler()
+        self._opener = urllib2.build_opener(urllib2.ProxyHandler({}), self._keep_alive_handler)
+        self._opener.addheaders = [('User-Agent', _USER_AGENT)]
+        urllib2.install_opener(self._opener)
+
+        self._fetch_pool = ThreadPool(self.max_connections)
+
+    def close(self):
+        """Override of super class's method.
+        """
+        super(HttpSensor, self).close()
+
+        self._fetch_pool.close()
+        self._fetch_pool.join()
+        self._keep_alive_handler.close()
+
+        if self._validator_cache is not None:
+            self._validator_cache.save()
+
+    def _complete_back_stage(self):
+        """Override of super class's method --- Save validators of pages fetched in the completed cycle.
+        """
+        super(HttpSensor, self)._complete_back_stage()
+
+        if self._validator_cache is not None:
+            for cache_key, etag, last_modified, content_hash in self._pending_validators.pop(
+                    self._back_time_record, []):
+                self._validator_cache.set(cache_key, etag, last_modified, content_hash)
+            self._validator_cache.save()
+
     def fetch(self, timeout=20):
         """Fetch contents by use of HTTP protocol. (Overridden method)
 
+        When :meth:`create_requests` returns several requests, they are fetched concurrently.
+        (See :attr:`max_connections`)
+        Fetch time of each URL is recorded as 'url_fetch_times' in the time record.
+
         :param timeout: Time until HTTP access timeout.
-        :return: WebPageSource object including content and url.
+        :return: WebPageSource object including content and url,
+            or list of WebPageSource objects in order of requests if several requests are created.
         """
         self._pacemaker.wait()
 
-        url, post_data = self.create_request()
-        encoded_data = _encode_post_data(post_data)
-
-        if url is None or url == '':
+        requests = [(url, post_data) for url, post_data in self.create_requests() if url is not None and url != '']
+        if len(requests) == 0:
             uds.logging.warning('[fetch] url for request is none or empty.')
             return False
 
         uds.logging.info('[fetch] --- start ----------------------------')
 
-        proxies = {}
-        user_agent = 'Mozilla/5.0 (Windows NT 6.1; WOW64) ' \
-                     'AppleWebKit/537.36 (KHTML, like Gecko) ' \
-                     'Chrome/29.0.1547.66 ' \
-                     'Safari/'
-        # headers = { 'User-Agent' : user_agent }
-        proxy_handler = urllib2.ProxyHandler(proxies)
-        opener = urllib2.build_opener(proxy_handler)
-        opener.addheaders = [('User-Agent', user_agent)]
-        urllib2.install_opener(opener)
-        # sock = _thread_timeout(func=opener.open, args=[self._url, self._postData, timeout], timeout_duration=timeout)
-
-        try:
-            uds.logging.info('[fetch] url=%s', url)
-            sock = opener.open(url, encoded_data, timeout)
-        except:
-            sock = None
-        if sock is None:
-            uds.logging.error('[fetch] Get Open Error URL=%s', url)
-            source = WebPageSource()
-            source.url = url
-            source.content = None
-            return source
+        if len(requests) == 1:
+            sources = [self._fetch_page(requests[0], timeout)]
+        else:
+            sources = self._fetch_pool.map(lambda request: self._fetch_page(request, timeout), requests, 1)
+
+        if self._front_time_record is not None:
+            self._front_time_record.extra['url_fetch_times'] = [[source.url, source.fetch_time] for source in sources]
+
+        if self._validator_cache is not None:
+            # Validators are saved after the cycle is completed.
+            if self._front_time_record is not None:
+                self._pending_validators[self._front_time_record] = [
+                    source.validators for source in sources if source.validators is not None]
+
+            # Not modified pages are not parsed.
+            modified_sources = [source for source in sources if not source.not_modified]
+            if self._front_time_record is not None:
+                self._front_time_record.extra['cache_hits'] = len(sources) - len(modified_sources)
+            if len(modified_sources) == 0:
+                uds.logging.info('[fetch] All pages are not modified.')
+                return False
+            if len(sources) > 1:
+                return modified_sources
+
+        if len(sources) == 1:
+            return sources[0]
+        return sources
+
+    def _fetch_page(self, request, timeout):
+        url, post_data = request
+        encoded_data = _encode_post_data(post_data)
 
-        http_source = _thread_timeout(sock.read, None, timeout)
-        sock.close()
+        source = WebPageSource()
+        source.url = url
 
-        # 文字コードをunicodeに変換
-        try:
-            html_unicode = unicode(http_source, "shift_jis")
-        except:
+        # Conditional request
+        request = urllib2.Request(url, encoded_data)
+        cache_key = url if encoded_data is None else url + ' ' + encoded_data
+        validators = self._validator_cache.get(cache_key) if self._validator_cache is not None else None
+        if validators is not None:
+            if validators['etag'] is not None:
+                request.add_header('If-None-Match', validators['etag'])
+            if validators['last_modified'] is not None:
+                request.add_header('If-Modified-Since', validators['last_modified'])
+
+        with Timer() as timer:
             try:
-                html_unicode = unicode(http_source, "euc-jp")
-            except:
-                try:
-                    html_unicode = unicode(http_source, "utf-8")
-                except:
-                    html_unicode = http_source
+                uds.logging.info('[fetch] url=%s', url)
+                sock = self._opener.open(request, timeout=timeout)
+                http_source = sock.read()
+                headers = sock.info()
+                sock.close()
+            except urllib2.HTTPError as e:
+                if e.code == 304 and validators is not None:
+                    uds.logging.info('[fetch] Not modified. url=%s', url)
+                    source.not_modified = True
+                else:
+                    uds.logging.error('[fetch] Get Open Error URL=%s, e=%s', url, e)
+                http_source = None
+            except Exception as e:
+                uds.logging.error('[fetch] Get Open Error URL=%s, e=%s', url, e)
+                http_source = None
+        source.fetch_time = timer.secs
+
+        if http_source is None:
+            return source
 
-        source = WebPageSource()
-        source.url = url
-        source.content = html_unicode
+        if self._validator_cache is not None:
+            content_hash = hashlib.md5(http_source).hexdigest()
+            if validators is not None and validators['content_hash'] == content_hash:
+                uds.logging.info('[fetch] Content is not changed. url=%s', url)
+                source.not_modified = True
+                return source
+            source.validators = (
+                cache_key, headers.getheader('ETag'), headers.getheader('Last-Modified'), content_hash)
+
+        # 文字コードをunicodeに変換
+        charset = uds.utils.encoding.get_charset(headers.getheader('Content-Type'), http_source)
+        source.content = uds.utils.encoding.decode(http_source, key=url, charset=charset)
         return source
 
-    @abstractmethod
+    def create_requests(self):
+        """Create parameters for HTTP requests in a single crawling cycle.
+
+        By default, a request created by :meth:`create_request` is returned.
+        Override this method to fetch several URLs concurrently in a crawling cycle.
+
+        :return: list of tuples of (URL of data source, POST parameters)
+        :rtype: list of (str, dict)
+        """
+        return [self.create_request()]
+
     def create_request(self):
         """Create parameters for HTTP request in a single crawling cycle.
 
+        Override this method or :meth:`create_requests`.
+
         :return:
             * **rul** 　-　 URL of data source
             * **post_data** 　-　  POST parameters
         :rtype: str, dict
         """
-        pass
+        return None, None
+
+    def split_source(self, source):
+        """Override of super class's method --- Each fetched page is a chunk.
+        """
+        if isinstance(source, list):
+            return source
+        return [source]
 
     def parse(self, source):
         """Override of super class's method.
         """
+        if isinstance(source, list):
+            m2m_data_list = []
+            for page in source:
+                m2m_data_list.extend(self.parse_content(page.content, page.url))
+            return m2m_data_list
+
         return self.parse_content(source.content, source.url)
 
     @abstractmethod
@@ -145,6 +303,12 @@ class WebPageSource(object):
         self.content = None
         #: URL of content
         self.url = None
+        #: Second-scale time to fetch content
+        self.fetch_time = 0.0
+        #: True if content is not modified since the last fetch. (Conditional fetch only)
+        self.not_modified = False
+        #: Tuple of (cache key, ETag, Last-Modified, hash of content) to save after storing. (Conditional fetch only)
+        self.validators = None
 
 
 def _encode_post_data(post_data):
@@ -152,28 +316,3 @@ def _encode_post_data(post_data):
         return None
     else:
         return urllib.urlencode(post_data)
-
-
-def _thread_timeout(func, args=(), timeout_duration=1, default=None):
-    import threading
-
-    class InterruptableThread(threading.Thread):
-        def __init__(self):
-            threading.Thread.__init__(self)
-            self.result = None
-
-        def run(self):
-            try:
-                self.result = func(args)
-            except:
-                self.result = default
-
-    it = InterruptableThread()
-    it.start()
-    # print "Time duration:", timeout_duration
-    it.join(timeout_duration)
-    if it.isAlive():
-        return default
-    else:
-        return it.result
-
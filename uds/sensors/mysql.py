@@ -9,9 +9,10 @@ uds.sensors.mysql
 from abc import abstractmethod
 
 import uds.logging
+from uds.config import default_config
 from uds.sensors.base import Sensor
 from uds.utils.crawling import Pacemaker
-from uds.io.mysql import MySQLClient
+from uds.io import mysql
 
 
 class MySQLSensor(Sensor):
@@ -27,6 +28,8 @@ class MySQLSensor(Sensor):
             'password': None,
             'host': None,
             'db': None,
+            'pool_size': default_config.MYSQL_POOL_SIZE,
+            'ping_interval': default_config.MYSQL_PING_INTERVAL,
         }
 
         self._pacemaker = None
@@ -61,6 +64,9 @@ class MySQLSensor(Sensor):
                 'db': MyDatabase,
             }
 
+        If 'pool_size' is greater than 0, connections are kept in a pool shared in the process.
+        (See :func:`uds.io.mysql.create_client`)
+
         :getter: Returns this parameter
         :type: dict
         """
@@ -75,12 +81,7 @@ class MySQLSensor(Sensor):
         """
         super(MySQLSensor, self).open()
         self._pacemaker = Pacemaker(self.interval)
-        self._fetch_client = MySQLClient(
-            self._mysql_fetch_params['user'],
-            self._mysql_fetch_params['password'],
-            self._mysql_fetch_params['host'],
-            self._mysql_fetch_params['db']
-        )
+        self._fetch_client = mysql.create_client(self._mysql_fetch_params)
 
     def fetch(self):
         """Fetch rows from MySQL table.
@@ -13,14 +13,15 @@ from abc import abstractmethod
 import tweepy
 
 from uds.sensors.base import Sensor
+from uds.utils.cache import BoundedSet
 
 
 class GetStreamingListener(tweepy.streaming.StreamListener):
-    def __init__(self):
+    def __init__(self, buffer_size=1000):
         tweepy.streaming.StreamListener.__init__(self)
         self._japanese_keyword_filter = None
         self._queue = None
-        self._id_buffer = []
+        self._id_buffer = BoundedSet(buffer_size)
 
     @property
     def queue(self):
@@ -75,14 +76,11 @@ class GetStreamingListener(tweepy.streaming.StreamListener):
 
     def _is_overlap_tweet(self, data_dict):
         tweet_id = data_dict['id_str']
-        if tweet_id in self._id_buffer:
+        if self._id_buffer.add(tweet_id):
+            return False
+        else:
             print "Ignore overlap tweet. tweet_id=" + tweet_id
             return True
-        else:
-            if len(self._id_buffer) >= 1000:
-                self._id_buffer.pop(0)
-            self._id_buffer.append(tweet_id)
-            return False
 
 
 class TwitterSensor(Sensor):
@@ -197,7 +195,7 @@ class TwitterSensor(Sensor):
         auth.set_access_token(self._access_key, self._access_secret)
 
         # Create GetStreamingListener
-        listener = GetStreamingListener()
+        listener = GetStreamingListener(self.filter_params['limited_buffer_filter']['buffer_size'])
         listener.japanese_keyword_filter = self._japanese_keyword_filter
         listener.queue = self._raw_data_queue
 
@@ -6,17 +6,20 @@ uds.stores
 :copyright: Copyright (c) 2015, National Institute of Information and Communications Technology.All rights reserved.
 :license: GPL2, see LICENSE for more details.
 """
+import os
 from abc import ABCMeta, abstractmethod
+from multiprocessing.pool import ThreadPool
 
 import uds.logging
 from uds.io.console import ConsoleDao
 from uds.io.file import FileDao
 from uds.io import mysql
-from uds.io.mysql import MySQLClient
 from uds.io.mysql import MySQLDao
 from uds.io import evwh
 from uds.io.evwh import EventWarehouseClient
 from uds.io.evwh import EventWarehouseDao
+from uds.io.spool import Spool
+from uds.io.spool import SpoolReplayer
 
 
 def get_store(store_type, store_params, sensor_name, start_time):
@@ -70,6 +73,14 @@ class Store(object):
         """
         pass
 
+    def metrics(self):
+        """Returns metrics of this store, which are written to time records of each crawling cycle.
+
+        :return: Dictionary of metric names and values
+        :rtype: dict
+        """
+        return {}
+
 
 class ConsoleStore(Store):
     """ConsoleStore redirect M2MData list to console.
@@ -151,12 +162,11 @@ class MySQLStore(Store):
         super(MySQLStore, self).open()
 
         # Setup connection to MySQL
-        self._client = MySQLClient(self._mysql_params['user'],
-                                   self._mysql_params['password'],
-                                   self._mysql_params['host'],
-                                   self._mysql_params['db'])
+        self._client = mysql.create_client(self._mysql_params)
         # Setup DAO
-        self._dao = MySQLDao(self._client, self._mysql_params['table_name'])
+        self._dao = MySQLDao(self._client,
+                             self._mysql_params['table_name'],
+                             self._mysql_params['insert_batch_size'])
 
     def store(self, m2m_data_list):
         """Implementation of super class's method.
@@ -177,14 +187,27 @@ class MySQLStore(Store):
                              repr(m2m_data.south),
                              str(m2m_data.min_time))
 
-            self._dao.insert(m2m_data)
+        self._dao.insert_many(m2m_data_list)
 
         self._client.disconnect()
 
+    def close(self):
+        super(MySQLStore, self).close()
+
+        # Release only the connection of this store.
+        # Shared connection pools are closed at process exit, because filters and other sensors may use them.
+        if self._client is not None:
+            self._client.disconnect()
+
 
 class EventWarehouseStore(Store):
-    """
+    """EventWarehouseStore store M2M Data to Event Warehouse.
 
+    *   M2M Data list is split over 'connections' connections, and sent concurrently.
+    *   M2M Data failed to store is written to local file in 'error_dir_path'.
+    *   If 'spool_enabled', M2M Data failed to store is appended to spool in 'spool_dir_path' instead,
+        and replayed by a background thread. While the spool is not empty, M2M Data is appended to
+        the spool without waiting for Event Warehouse.
     """
 
     def __init__(self, evwh_params, file_params, sensor_name, start_time):
@@ -193,26 +216,41 @@ class EventWarehouseStore(Store):
         self._file_params = file_params
         self._sensor_name = sensor_name
         self._start_time = start_time
-        self._client = None
-        self._evwh_dao = None
+        self._clients = []
+        self._evwh_daos = []
         self._file_dao = None
+        self._insert_pool = None
+        self._spool = None
+        self._replayer = None
+        self._replay_client = None
+        self._replay_dao = None
+        self._broken_daos = set()
 
     def open(self):
         super(EventWarehouseStore, self).open()
 
-        # Setup connection to Event Warehouse
-        self._client = EventWarehouseClient(self._evwh_params['host'], self._evwh_params['port'])
-        self._client.connect()
+        # Setup connections to Event Warehouse
+        for i in range(max(self._evwh_params['connections'], 1)):
+            client = EventWarehouseClient(self._evwh_params['host'], self._evwh_params['port'])
+            client.timeout = self._evwh_params['select_timeout']
+            client.max_in_flight = self._evwh_params['max_in_flight']
+            client.connect()
+            self._clients.append(client)
 
         # Check and create table
-        evwh.try_create_table(self._client, self._evwh_params['table_name'])
+        evwh.try_create_table(self._clients[0], self._evwh_params['table_name'])
 
         # Set insert_timeout
-        self._client.timeout = self._evwh_params['insert_timeout']
+        for client in self._clients:
+            client.timeout = self._evwh_params['insert_timeout']
 
-        # Setup EventWarehouseDao
-        self._evwh_dao = EventWarehouseDao(
-            self._client, self._evwh_params['table_name'], self._evwh_params['primary_keys_enabled'])
+        # Setup EventWarehouseDao for each connection
+        self._evwh_daos = [EventWarehouseDao(client,
+                                             self._evwh_params['table_name'],
+                                             self._evwh_params['primary_keys_enabled'],
+                                             self._evwh_params['insert_batch_size'],
+                                             self._evwh_params['insert_batch_bytes'])
+                           for client in self._clients]
 
         # Setup FileDao for Event Warehouse ERROR
         self._file_dao = FileDao(self._sensor_name,
@@ -220,39 +258,173 @@ class EventWarehouseStore(Store):
                                  self._evwh_params['error_dir_path'],
                                  self._file_params['dir_file_max'])
 
+        if len(self._clients) > 1:
+            self._insert_pool = ThreadPool(len(self._clients))
+
+        # Setup spool and replayer with its own connection
+        if self._evwh_params['spool_enabled']:
+            self._spool = Spool(os.path.join(self._evwh_params['spool_dir_path'], self._sensor_name))
+
+            self._replay_client = EventWarehouseClient(self._evwh_params['host'], self._evwh_params['port'])
+            self._replay_client.timeout = self._evwh_params['insert_timeout']
+            self._replay_client.max_in_flight = self._evwh_params['max_in_flight']
+            self._replay_client.connect()
+            self._replay_dao = EventWarehouseDao(
+                self._replay_client, self._evwh_params['table_name'], self._evwh_params['primary_keys_enabled'])
+
+            self._replayer = SpoolReplayer(self._spool, self._replay,
+                                           self._evwh_params['replay_batch_size'],
+                                           max_interval=self._evwh_params['replay_max_interval'])
+            self._replayer.start()
+
+    def close(self):
+        if self._replayer is not None:
+            self._replayer.stop()
+            self._replayer = None
+            self._replay_client.disconnect()
+            self._spool.close()
+
+        if self._insert_pool is not None:
+            self._insert_pool.close()
+            self._insert_pool.join()
+            self._insert_pool = None
+
+        for client in self._clients:
+            client.disconnect()
+        self._clients = []
+        self._evwh_daos = []
+
+        super(EventWarehouseStore, self).close()
+
+    def metrics(self):
+        """Overridden method --- Returns 'spool_depth' if spool is enabled.
+        """
+        if self._spool is None:
+            return {}
+        return {'spool_depth': self._spool.depth}
+
     def store(self, m2m_data_list):
         """Store m2m_data_list to Event Warehouse.
         If fail to store, store data to local file.
         """
-        send_count = 0
-        send_failed_count = 0
-
         for m2m_data in m2m_data_list:
 
             # Write message to log.
             uds.logging.info("[store] Store m2m_data to EvWH. data_id={0}, latitude={1}, longitude={2}, time={3}".format(
                 str(m2m_data.data_id), repr(m2m_data.north), repr(m2m_data.south), str(m2m_data.min_time)))
 
-            # Execute insert
-            send_count += 1
+        if self._spool is not None:
+            if self._spool.depth > 0:
+                # Keep order of data while the spool is replayed.
+                self._append_to_spool(m2m_data_list)
+                return
+
+            # Event Warehouse is recovered. Reconnect connections failed before.
+            for dao in self._broken_daos:
+                self._reconnect(dao)
+            self._broken_daos.clear()
+
+        # Execute insert (Queries are pipelined on each connection, and connections are used concurrently)
+        chunk_size = -(-len(m2m_data_list) // len(self._evwh_daos))
+        tasks = [(dao, m2m_data_list[i * chunk_size:(i + 1) * chunk_size])
+                 for i, dao in enumerate(self._evwh_daos) if i * chunk_size < len(m2m_data_list)]
+        if self._insert_pool is not None and len(tasks) > 1:
+            task_results = self._insert_pool.map(_insert_many, tasks, 1)
+        else:
+            task_results = [_insert_many(task) for task in tasks]
+
+        failed_m2m_data_list = []
+        for (dao, chunk), results in zip(tasks, task_results):
+            for m2m_data, is_success in zip(chunk, results):
+                if is_success is False:
+                    failed_m2m_data_list.append(m2m_data)
+
+            if False in results:
+                if self._spool is not None:
+                    # Reconnect after the spool is replayed, not to wait for Event Warehouse now.
+                    self._broken_daos.add(dao)
+                else:
+                    # Reconnect to EvWH for next insert.
+                    self._reconnect(dao)
+
+        if len(failed_m2m_data_list) > 0:
+            uds.logging.error('[store] Failed to store to EvWH. failed_count=%s/%s',
+                              len(failed_m2m_data_list), len(m2m_data_list))
+
+            # When error, store to spool or file.
+            if self._spool is not None:
+                self._append_to_spool(failed_m2m_data_list)
+            else:
+                for m2m_data in failed_m2m_data_list:
+                    self._file_dao.insert(m2m_data)
+
+    def _append_to_spool(self, m2m_data_list):
+        queries = []
+        spooled_m2m_data_list = []
+        for m2m_data in m2m_data_list:
             try:
-                is_success = self._evwh_dao.insert(m2m_data)
+                queries.append(self._evwh_daos[0].create_insert_query(m2m_data))
+                spooled_m2m_data_list.append(m2m_data)
             except Exception as e:
-                uds.logging.critical(
-                    '[store] Unexpected error occurred during execute insert query to EvWH. e={0}' + str(e))
-                is_success = False
+                uds.logging.error('[store] Failed to create INSERT query. data_id=%s, e=%s', m2m_data.data_id, e)
+                self._file_dao.insert(m2m_data)
 
-            if is_success is False:
-                # When error, store to file.
+        try:
+            self._spool.append(queries)
+        except Exception as e:
+            uds.logging.critical('[store] Failed to append to spool. Store data to file. e=%s', e)
+            # Data failed to create query are already stored to file.
+            for m2m_data in spooled_m2m_data_list:
                 self._file_dao.insert(m2m_data)
-                send_failed_count += 1
-
-                # Reconnect to EvWH for next insert.
-                try:
-                    self._evwh_dao.reconnect()
-                except Exception as e:
-                    uds.logging.critical(
-                        '[store] Exception occurred during connect to EvWH. e={0}' + str(e))
+            return
+
+        uds.logging.info('[store] Append m2m_data to spool. count=%s, depth=%s', len(queries), self._spool.depth)
+
+    def _replay(self, queries):
+        # Called by replay thread
+        try:
+            results = self._replay_dao.insert_queries(queries)
+        except Exception as e:
+            uds.logging.error('[store] Unexpected error occurred during replay to EvWH. e=%s', e)
+            results = [False] * len(queries)
+
+        # Queries rejected by Event Warehouse are not retried, and written to file.
+        rejected_queries = [query for query, result in zip(queries, results) if result is None]
+        if len(rejected_queries) > 0:
+            self._write_rejected_queries(rejected_queries)
+
+        if False in results:
+            self._reconnect(self._replay_dao)
+        return [result is not False for result in results]
+
+    def _write_rejected_queries(self, queries):
+        dir_path = self._evwh_params['error_dir_path']
+        try:
+            if not os.path.exists(dir_path):
+                os.makedirs(dir_path)
+            with open(os.path.join(dir_path, self._sensor_name + '.rejected.mpql'), 'a') as fp:
+                for query in queries:
+                    fp.write(query + '\n')
+        except Exception as e:
+            uds.logging.critical('[store] Failed to write rejected queries. count=%s, e=%s', len(queries), e)
+
+    @staticmethod
+    def _reconnect(dao):
+        try:
+            dao.reconnect()
+        except Exception as e:
+            uds.logging.critical(
+                '[store] Exception occurred during connect to EvWH. e={0}' + str(e))
+
+
+def _insert_many(task):
+    dao, m2m_data_list = task
+    try:
+        return dao.insert_many(m2m_data_list)
+    except Exception as e:
+        uds.logging.critical(
+            '[store] Unexpected error occurred during execute insert query to EvWH. e={0}' + str(e))
+        return [False] * len(m2m_data_list)
 
 
 class SCNStore(Store):
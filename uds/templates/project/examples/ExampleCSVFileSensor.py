@@ -64,6 +64,9 @@ class ExampleCSVFileSensor(CSVFileSensor):
         # Set Second-scale interval of crawling cycle.
         self.interval = 10
 
+        # Set number of header rows. (Copied to each chunk when csv rows are parsed in parallel)
+        self.header_row_count = 1
+
         # Set file list to read.
         dir_path = os.path.abspath(os.path.dirname(__file__))
         self.file_list.append(os.path.join(dir_path, '../sample_rainfall/pre1h/20140809T0900.csv'))
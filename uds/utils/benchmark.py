@@ -9,6 +9,8 @@ uds.utils.benchmark
 import os
 import time
 import csv
+import json
+import threading
 
 
 def get_time_recorder(time_record_enabled, log_dir_path, sensor_name, start_time):
@@ -30,6 +32,7 @@ class TimeRecorder(object):
         self._start_time = start_time
         self._csv_writer = None
         self._file_name = None
+        self._lock = threading.Lock()
 
     def write_header(self):
         # Prepare directory
@@ -50,23 +53,31 @@ class TimeRecorder(object):
             'filter_time',
             'store_time',
             'crawl_time',
+            'fetch_wait_time',
+            'store_wait_time',
+            'extra',
         ])
         
         f.close()
 
     def write_record(self, time_record):
-        f = open(self._file_name, 'a')
-        writer = csv.writer(f, dialect='excel-tab')
-        writer.writerow([
-            time_record.interval_start_time,
-            time_record.fetch_time,
-            time_record.parse_time,
-            time_record.check_time,
-            time_record.filter_time,
-            time_record.store_time,
-            time_record.crawl_time,
-        ])
-        f.close()
+        # Records may be written from fetch/parse stage and filter/store stage in pipelined mode.
+        with self._lock:
+            f = open(self._file_name, 'a')
+            writer = csv.writer(f, dialect='excel-tab')
+            writer.writerow([
+                time_record.interval_start_time,
+                time_record.fetch_time,
+                time_record.parse_time,
+                time_record.check_time,
+                time_record.filter_time,
+                time_record.store_time,
+                time_record.crawl_time,
+                time_record.fetch_wait_time,
+                time_record.store_wait_time,
+                json.dumps(time_record.extra) if time_record.extra else '',
+            ])
+            f.close()
 
 
 class NullTimeRecorder(object):
@@ -91,6 +102,12 @@ class TimeRecord(object):
         self.filter_time = 0.0
         self.store_time = 0.0
         self.crawl_time = 0.0
+        #: Time which fetch/parse stage waited for filter/store stage. (pipelined mode only)
+        self.fetch_wait_time = 0.0
+        #: Time which filter/store stage waited for fetch/parse stage. (pipelined mode only)
+        self.store_wait_time = 0.0
+        #: Additional records of the cycle. (Written as JSON)
+        self.extra = {}
 
 
 class Timer(object):
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+uds.utils.cache
+~~~~~~~~~~~~~~~
+
+Bounded containers for buffering and caching.
+
+:copyright: Copyright (c) 2015, National Institute of Information and Communications Technology.All rights reserved.
+:license: GPL2, see LICENSE for more details.
+"""
+from __future__ import absolute_import
+
+import collections
+
+
+class BoundedSet(object):
+    """Set of hashable keys with bounded capacity.
+    When the capacity is exceeded, the oldest key is evicted.
+
+    * FIFO mode (default) -- Keys are evicted in insertion order.
+    * LRU mode -- Keys are evicted in order of last access by :meth:`add`.
+
+    Both :meth:`add` and ``in`` operator take constant time regardless of the capacity.
+
+    :param int capacity: Max number of keys.
+    :param bool lru: If True, use LRU mode.
+    """
+
+    def __init__(self, capacity, lru=False):
+        assert capacity > 0
+        self._capacity = capacity
+        self._lru = lru
+        if lru:
+            self._keys = collections.OrderedDict()
+        else:
+            self._keys = set()
+            self._order = collections.deque()
+
+    @property
+    def capacity(self):
+        """Max number of keys.
+
+        :getter: Returns this parameter
+        :type: int
+        """
+        return self._capacity
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def add(self, key):
+        """Add the key to this set.
+
+        :param key: Hashable key
+        :return: True if the key is newly added, False if the key is already contained.
+        :rtype: bool
+        """
+        if key in self._keys:
+            if self._lru:
+                # Move to the newest position
+                del self._keys[key]
+                self._keys[key] = None
+            return False
+
+        if self._lru:
+            self._keys[key] = None
+            if len(self._keys) > self._capacity:
+                self._keys.popitem(last=False)
+        else:
+            self._keys.add(key)
+            self._order.append(key)
+            if len(self._order) > self._capacity:
+                self._keys.discard(self._order.popleft())
+        return True
+
+    def clear(self):
+        """Remove all keys.
+
+        :return: None
+        """
+        self._keys.clear()
+        if not self._lru:
+            self._order.clear()
+
+
+class BoundedDict(object):
+    """Mapping with bounded capacity for memoization.
+    When the capacity is exceeded, the oldest entry is evicted in insertion order.
+
+    Concurrent writers may evict an entry earlier than expected, but never break the mapping.
+
+    :param int capacity: Max number of entries.
+    """
+
+    def __init__(self, capacity):
+        assert capacity > 0
+        self._capacity = capacity
+        self._items = {}
+        self._order = collections.deque()
+
+    @property
+    def capacity(self):
+        """Max number of entries.
+
+        :getter: Returns this parameter
+        :type: int
+        """
+        return self._capacity
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __getitem__(self, key):
+        return self._items[key]
+
+    def __setitem__(self, key, value):
+        if key not in self._items:
+            self._order.append(key)
+        self._items[key] = value
+        if len(self._order) > self._capacity:
+            self._items.pop(self._order.popleft(), None)
+
+    def get(self, key, default=None):
+        """Returns the value for the key if the key is contained, else default.
+
+        :param key: Hashable key
+        :param default: Default value
+        :return: Value for the key
+        """
+        return self._items.get(key, default)
+
+    def clear(self):
+        """Remove all entries.
+
+        :return: None
+        """
+        self._items.clear()
+        self._order.clear()
@@ -8,10 +8,20 @@ uds.utils.crawling
 """
 from __future__ import absolute_import
 
+import os
 import time
+import json
 import datetime
+import httplib
+import socket
+import thread
+import threading
+import urllib
+import urllib2
+from StringIO import StringIO
 
 import uds.logging
+from uds.utils.file import write_atomic
 
 
 class Pacemaker(object):
@@ -41,3 +51,167 @@ class Pacemaker(object):
                 time.sleep(sleep_time)
 
         self._before_datetime = datetime.datetime.now()  # 現在の時刻を保存
+
+
+class KeepAliveHandler(urllib2.HTTPHandler, urllib2.HTTPSHandler):
+    """HTTP(S) handler for urllib2, which keeps connections alive and reuses them.
+
+    * Connections are kept per thread and per host, so an opener with this handler can be shared by threads.
+    * Response body is read before the response is returned, to reuse the connection.
+    * A request on a reused connection is retried once on a new connection, if the server has closed it.
+    """
+
+    def __init__(self, debuglevel=0, context=None):
+        urllib2.HTTPHandler.__init__(self, debuglevel)
+        self._context = context
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def http_open(self, req):
+        return self._open_alive(httplib.HTTPConnection, req)
+
+    def https_open(self, req):
+        return self._open_alive(httplib.HTTPSConnection, req, context=self._context)
+
+    http_request = urllib2.AbstractHTTPHandler.do_request_
+    https_request = urllib2.AbstractHTTPHandler.do_request_
+
+    def close(self):
+        """Close all kept connections.
+
+        :return: None
+        """
+        with self._lock:
+            connections = self._connections.values()
+            self._connections.clear()
+        for connection in connections:
+            connection.close()
+
+    def _open_alive(self, http_class, req, **http_conn_args):
+        if req._tunnel_host:
+            # Connections through proxy tunnel are not kept.
+            return self.do_open(http_class, req, **http_conn_args)
+
+        host = req.get_host()
+        if not host:
+            raise urllib2.URLError('no host given')
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update((k, v) for k, v in req.headers.items() if k not in headers)
+        headers['Connection'] = 'keep-alive'
+        headers = dict((name.title(), val) for name, val in headers.items())
+
+        key = (thread.get_ident(), http_class, host)
+        with self._lock:
+            connection = self._connections.pop(key, None)
+
+        if connection is not None:
+            try:
+                return self._request(connection, key, req, headers)
+            except (httplib.HTTPException, socket.error):
+                uds.logging.debug('[KeepAliveHandler] Kept connection is closed. Reconnect. host=%s', host)
+
+        connection = http_class(host, timeout=req.timeout, **http_conn_args)
+        connection.set_debuglevel(self._debuglevel)
+        try:
+            return self._request(connection, key, req, headers)
+        except (httplib.HTTPException, socket.error) as e:
+            raise urllib2.URLError(e)
+
+    def _request(self, connection, key, req, headers):
+        try:
+            connection.request(req.get_method(), req.get_selector(), req.data, headers)
+            response = connection.getresponse()
+            body = response.read()
+        except:
+            connection.close()
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            with self._lock:
+                self._connections[key] = connection
+
+        resp = urllib.addinfourl(StringIO(body), response.msg, req.get_full_url())
+        resp.code = response.status
+        resp.msg = response.reason
+        return resp
+
+
+class HttpValidatorCache(object):
+    """Cache of HTTP validators (ETag, Last-Modified and hash of content) per URL, for conditional fetch.
+
+    Validators are saved to the file by :meth:`save`, and loaded on :meth:`load`.
+    Methods can be called by concurrent threads.
+
+    :param str file_path: Path of cache file
+    """
+
+    def __init__(self, file_path):
+        self._file_path = file_path
+        self._entries = {}
+        self._modified = False
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns validators of the key.
+
+        :param str key: URL (and POST parameters)
+        :return: dict of 'etag', 'last_modified' and 'content_hash', or None if not cached.
+        :rtype: :class:`dict`
+        """
+        with self._lock:
+            return self._entries.get(key)
+
+    def set(self, key, etag, last_modified, content_hash):
+        """Set validators of the key.
+
+        :param str key: URL (and POST parameters)
+        :param str etag: Value of ETag header
+        :param str last_modified: Value of Last-Modified header
+        :param str content_hash: Hash of content
+        :return: None
+        """
+        entry = {'etag': etag, 'last_modified': last_modified, 'content_hash': content_hash}
+        with self._lock:
+            if self._entries.get(key) != entry:
+                self._entries[key] = entry
+                self._modified = True
+
+    def load(self):
+        """Load validators from cache file.
+
+        :return: None
+        """
+        if not os.path.exists(self._file_path):
+            return
+
+        try:
+            with open(self._file_path, 'r') as fp:
+                cache = json.load(fp)
+        except Exception as e:
+            uds.logging.warning('[fetch] Failed to load cache of HTTP validators. path=%s, e=%s', self._file_path, e)
+            return
+
+        with self._lock:
+            self._entries = cache['entries']
+            self._modified = False
+        uds.logging.info('[fetch] Loaded cache of HTTP validators. path=%s, entry_count=%s',
+                         self._file_path, len(self._entries))
+
+    def save(self):
+        """Save validators to cache file, if modified.
+
+        :return: None
+        """
+        with self._lock:
+            if not self._modified:
+                return
+            entries = dict(self._entries)
+            self._modified = False
+
+        try:
+            write_atomic(self._file_path, json.dumps({'entries': entries}, separators=(',', ':')))
+        except Exception as e:
+            uds.logging.warning('[fetch] Failed to save cache of HTTP validators. path=%s, e=%s', self._file_path, e)
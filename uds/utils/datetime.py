@@ -11,8 +11,77 @@ from __future__ import absolute_import
 import re
 import datetime
 import dateutil.parser
+import dateutil.tz
 import pytz
 
+from uds.utils.cache import BoundedDict
+
+#: ISO 8601 format produced by :func:`uds.utils.string.try_parse_to_datetime` with optional time offset.
+_ISO_DATETIME_PATTERN = re.compile(
+    r'^(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6}))?(?:(Z)|([\+-])(\d{2}):?(\d{2}))?$')
+
+#: Max number of parsed (time, offset) pairs kept in memory.
+_PARSED_TIME_CACHE_SIZE = 100000
+
+_parsed_times = BoundedDict(_PARSED_TIME_CACHE_SIZE)
+_tzinfos = {}
+
+
+def parse_time(time, offset=''):
+    """Parse time string with time offset to datetime.
+    The result is same as ``dateutil.parser.parse(time + offset)``.
+
+    * Strict fast path for ISO 8601 format like '2015-02-16T01:00:00.000' and '+09:00'.
+    * Other formats are parsed by dateutil.
+    * Parsed results are cached in memory, shared by all callers.
+
+    :param str time: Time string
+    :param str offset: Time offset string
+    :return: Parsed datetime
+    :rtype: :class:`datetime.datetime`
+    """
+    key = (time, offset)
+    result = _parsed_times.get(key)
+    if result is None:
+        result = _parse_time(time + offset)
+        _parsed_times[key] = result
+    return result
+
+
+def _parse_time(value):
+    match = _ISO_DATETIME_PATTERN.match(value)
+    if match is None:
+        return dateutil.parser.parse(value)
+
+    year, month, day, hour, minute, second, fraction, utc, sign, offset_hour, offset_minute = match.groups()
+    if utc is not None:
+        tzinfo = _get_tzinfo(0)
+    elif sign is not None:
+        offset_seconds = int(offset_hour) * 3600 + int(offset_minute) * 60
+        tzinfo = _get_tzinfo(offset_seconds if sign == '+' else -offset_seconds)
+    else:
+        tzinfo = None
+    microsecond = int(fraction.ljust(6, '0')) if fraction is not None else 0
+
+    try:
+        return datetime.datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                                 microsecond, tzinfo)
+    except ValueError:
+        # Let dateutil decide, e.g. out of range values.
+        return dateutil.parser.parse(value)
+
+
+def _get_tzinfo(offset_seconds):
+    # Same tzinfo as dateutil.parser returns.
+    tzinfo = _tzinfos.get(offset_seconds)
+    if tzinfo is None:
+        if offset_seconds == 0:
+            tzinfo = dateutil.tz.tzutc()
+        else:
+            tzinfo = dateutil.tz.tzoffset(None, offset_seconds)
+        _tzinfos[offset_seconds] = tzinfo
+    return tzinfo
+
 
 def normalize_timezone(timezone):
     """
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+uds.utils.encoding
+~~~~~~~~~~~~~~~~~~
+
+Utility functions to detect charset and decode fetched contents.
+
+:copyright: Copyright (c) 2015, National Institute of Information and Communications Technology.All rights reserved.
+:license: GPL2, see LICENSE for more details.
+"""
+from __future__ import absolute_import
+
+import codecs
+import re
+
+from uds.utils.cache import BoundedDict
+
+#: Default candidate encodings in order of trial.
+DEFAULT_ENCODINGS = ('shift_jis', 'euc-jp', 'utf-8')
+
+#: Number of leading bytes searched for meta charset.
+_META_SEARCH_SIZE = 4096
+
+_content_type_charset_pattern = re.compile(r'charset\s*=\s*["\']?([-\w.:]+)', re.IGNORECASE)
+_meta_charset_pattern = re.compile(r'<meta[^>]+charset\s*=\s*["\']?([-\w.:]+)', re.IGNORECASE)
+
+# Encoding which decoded contents of each key (URL or file path) last time
+_known_encodings = BoundedDict(10000)
+
+
+def get_charset(content_type=None, content=None):
+    """Find charset declared by Content-Type header or meta tag of HTML.
+
+    :param str content_type: Value of Content-Type header
+    :param str content: Fetched content as byte string
+    :return: Name of charset, or None if not declared or unknown.
+    :rtype: :class:`str`
+    """
+    match = None
+    if content_type:
+        match = _content_type_charset_pattern.search(content_type)
+    if match is None and content:
+        match = _meta_charset_pattern.search(content, 0, _META_SEARCH_SIZE)
+    if match is None:
+        return None
+
+    charset = match.group(1)
+    try:
+        codecs.lookup(charset)
+    except LookupError:
+        return None
+    return charset
+
+
+def decode(data, key=None, charset=None, encodings=DEFAULT_ENCODINGS):
+    """Decode whole byte string at once.
+
+    Encodings are tried in the following order, and the first one which can decode data is used.
+
+    1. charset (e.g. declared by Content-Type header. See :func:`get_charset`)
+    2. Encoding which decoded data of the same key last time
+    3. encodings
+
+    :param str data: Byte string to decode
+    :param str key: Key of data source (e.g. URL or file path) to remember encoding
+    :param str charset: Declared charset
+    :param encodings: Candidate encodings
+    :return: Decoded text. If data is already unicode or can not be decoded, data is returned as it is.
+    :rtype: :class:`unicode`
+    """
+    if isinstance(data, unicode):
+        return data
+
+    text, encoding = _decode(data, key, charset, encodings)
+    if encoding is None:
+        return data
+    return text
+
+
+def detect_encoding(data, key=None, charset=None, encodings=DEFAULT_ENCODINGS):
+    """Detect encoding which can decode byte string, in the same order as :func:`decode`.
+
+    :param str data: Byte string to decode
+    :param str key: Key of data source (e.g. URL or file path) to remember encoding
+    :param str charset: Declared charset
+    :param encodings: Candidate encodings
+    :return: Name of encoding, or None if data can not be decoded.
+    :rtype: :class:`str`
+    """
+    text, encoding = _decode(data, key, charset, encodings)
+    return encoding
+
+
+def _decode(data, key, charset, encodings):
+    known_encoding = _known_encodings.get(key) if key is not None else None
+
+    tried = set()
+    for encoding in (charset, known_encoding) + tuple(encodings):
+        if encoding is None or encoding in tried:
+            continue
+        tried.add(encoding)
+
+        try:
+            text = data.decode(encoding)
+        except (UnicodeDecodeError, LookupError):
+            continue
+
+        if key is not None and encoding != known_encoding:
+            _known_encodings[key] = encoding
+        return text, encoding
+
+    return None, None
+
+
+def get_known_encoding(key):
+    """Returns encoding which decoded data of the key last time.
+
+    :param str key: Key of data source (e.g. URL or file path)
+    :return: Name of encoding, or None if unknown.
+    :rtype: :class:`str`
+    """
+    return _known_encodings.get(key)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+uds.utils.file
+~~~~~~~~~~~~~~
+
+Utility functions to read and write local files.
+
+:copyright: Copyright (c) 2015, National Institute of Information and Communications Technology.All rights reserved.
+:license: GPL2, see LICENSE for more details.
+"""
+from __future__ import absolute_import
+
+import os
+
+
+def write_atomic(file_path, data, fsync=False):
+    """Write data to the file atomically.
+
+    Data is written to a temporary file, then the temporary file replaces the file.
+    So the file keeps the previous data if the process is stopped while writing.
+    Parent directories are created if not exist.
+
+    :param str file_path: Path of the file to write
+    :param str data: Data to write
+    :param bool fsync: If True, data is flushed to disk before replacing the file.
+    :return: None
+    """
+    dir_path = os.path.dirname(file_path)
+    if dir_path != '' and not os.path.exists(dir_path):
+        os.makedirs(dir_path)
+
+    tmp_file_path = file_path + '.tmp'
+    with open(tmp_file_path, 'w') as fp:
+        fp.write(data)
+        if fsync:
+            fp.flush()
+            os.fsync(fp.fileno())
+
+    # os.rename does not replace existing file on Windows.
+    if os.name == 'nt' and os.path.exists(file_path):
+        os.remove(file_path)
+    os.rename(tmp_file_path, file_path)
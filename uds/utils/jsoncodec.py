@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+uds.utils.jsoncodec
+~~~~~~~~~~~~~~~~~~~
+
+JSON encoder/decoder used for M2M Data.
+
+Accelerated codec is used if installed, else stdlib :mod:`json` is used.
+Encoded text of M2M Data is same as stdlib :func:`json.dumps`, because 'data_hash' and stored M2M Data depend on it.
+Accelerated codecs differ from stdlib :mod:`json` in the following cases.
+
+* :class:`bool` dict keys are encoded as ``"true"``/``"false"`` by simplejson, and ``"True"``/``"False"`` by json.
+  (Keys of M2M Data are strings.)
+* ASCII strings are decoded as :class:`str` by simplejson, and :class:`unicode` by json.
+  (Both are encoded to same text.)
+
+:copyright: Copyright (c) 2015, National Institute of Information and Communications Technology.All rights reserved.
+:license: GPL2, see LICENSE for more details.
+"""
+from __future__ import absolute_import
+
+import functools
+import json
+
+import uds.logging
+
+# Options of simplejson.dumps to encode same as stdlib json.dumps
+# (NaN and Infinity are allowed, namedtuple is encoded as array, and Decimal is not accepted.)
+_SIMPLEJSON_DUMPS_OPTIONS = {
+    'allow_nan': True,
+    'namedtuple_as_object': False,
+    'tuple_as_array': True,
+    'use_decimal': False,
+    'for_json': False,
+    'bigint_as_string': False,
+    'iterable_as_array': False,
+    'ensure_ascii': True,
+    'separators': (', ', ': ')
+}
+
+_encoder_name = 'json'
+_decoder_name = 'json'
+_dumps = json.dumps
+_loads = json.loads
+
+
+def configure(codec='auto'):
+    """Select JSON codec.
+
+    * 'auto' -- simplejson with C speedups if available, else json.
+    * 'json' -- stdlib json.
+    * 'simplejson' -- simplejson.
+    * 'ujson' -- ujson for decoding. (Encoding is same as 'auto', because ujson encodes differently.)
+
+    If selected codec is not installed, stdlib json is used.
+
+    :param str codec: Codec name
+    :return: None
+    """
+    global _encoder_name, _decoder_name, _dumps, _loads
+
+    codec = codec.lower()
+    if codec not in ('auto', 'json', 'simplejson', 'ujson'):
+        raise ValueError('Unknown JSON codec. codec=' + codec)
+
+    encoder_name, dumps = 'json', json.dumps
+    decoder_name, loads = 'json', json.loads
+
+    if codec in ('auto', 'simplejson', 'ujson'):
+        simplejson = _import_simplejson(codec != 'simplejson')
+        if simplejson is not None:
+            encoder_name, dumps = 'simplejson', functools.partial(simplejson.dumps, **_SIMPLEJSON_DUMPS_OPTIONS)
+            decoder_name, loads = 'simplejson', simplejson.loads
+
+    if codec == 'ujson':
+        try:
+            import ujson
+            decoder_name, loads = 'ujson', ujson.loads
+        except ImportError:
+            uds.logging.warning('[jsoncodec] ujson is not installed.')
+
+    _encoder_name, _dumps = encoder_name, dumps
+    _decoder_name, _loads = decoder_name, loads
+    uds.logging.info('[jsoncodec] Selected JSON codec. encoder=%s, decoder=%s', _encoder_name, _decoder_name)
+
+
+def _import_simplejson(speedups_required):
+    try:
+        import simplejson
+    except ImportError:
+        if not speedups_required:
+            uds.logging.warning('[jsoncodec] simplejson is not installed.')
+        return None
+
+    # Pure python simplejson is slower than stdlib json.
+    if speedups_required:
+        try:
+            from simplejson import _speedups
+        except ImportError:
+            return None
+    return simplejson
+
+
+def get_codec_names():
+    """Returns names of selected encoder and decoder.
+
+    :return: Tuple of (encoder name, decoder name)
+    :rtype: :class:`tuple`
+    """
+    return _encoder_name, _decoder_name
+
+
+def dumps(obj):
+    """Serialize object to JSON text. Same as ``json.dumps(obj)``, except :class:`bool` dict keys.
+
+    :param obj: Object to serialize
+    :return: JSON text
+    :rtype: :class:`str`
+    """
+    return _dumps(obj)
+
+
+def loads(s):
+    """Deserialize JSON text to object.
+
+    * Strings may be decoded as :class:`str` instead of :class:`unicode`, depending on the codec.
+
+    :param str s: JSON text
+    :return: Deserialized object
+    """
+    return _loads(s)
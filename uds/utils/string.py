@@ -11,6 +11,8 @@ Utility functions to parse string and others.
 import re
 import dateutil.parser
 
+from uds.utils.encoding import decode
+
 
 def check_ignore(invalid_keyword_list, text):
     """Check the text validity as sensing data. (Check the text has invalid strings.)
@@ -19,16 +21,7 @@ def check_ignore(invalid_keyword_list, text):
     :param str text: Text to check
     :return: If not contains invalid strings. If contains invalid strings, return False.
     """
-    try:
-        text = unicode(text, "utf-8")
-    except StandardError:
-        try:
-            text = unicode(text, "shift_jis")
-        except StandardError:
-            try:
-                text = unicode(text, "euc-jp")
-            except StandardError:
-                pass
+    text = decode(text, encodings=('utf-8', 'shift_jis', 'euc-jp'))
 
     for keyword in invalid_keyword_list:
         if text.find(keyword) >= 0: